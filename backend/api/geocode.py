@@ -1,12 +1,14 @@
 from typing import Annotated, List, Optional
 from fastapi import APIRouter, Depends, Query
 from pydantic import BaseModel
-import httpx
+from backend.services.geocode_cache import geocode_cache
+from backend.services.geocoder_providers import GeocodingError, geocoder
+from backend.services.geocoding import reverse_flights, write_path_counters
+from backend.services.enrichment import enrichment_worker
+from backend.services.query_cache import search_cache, forward_cache
 
 router = APIRouter(prefix="/geocode", tags=["geocoding"])
 
-NOMINATIM_SEARCH_URL = "https://nominatim.openstreetmap.org/search"
-
 class CityResult(BaseModel):
     display_name: str
     city: Optional[str]
@@ -18,43 +20,32 @@ class CityResult(BaseModel):
 async def search_cities(
     q: str = Query(..., min_length=2, description="Search query")
 ):
-    """Search for cities/places using Nominatim API."""
-    results = []
-    
+    """Search for cities/places through the query cache and the configured geocoder providers."""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                NOMINATIM_SEARCH_URL,
-                params={
-                    "q": q,
-                    "format": "json",
-                    "addressdetails": 1,
-                    "limit": 5,
-                    "accept-language": "en",
-                },
-                headers={"User-Agent": "Odyssey/1.0"},
-                timeout=5.0
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                for item in data:
-                    address = item.get("address", {})
-                    city = (
-                        address.get("city") or 
-                        address.get("town") or 
-                        address.get("village") or 
-                        address.get("municipality") or
-                        address.get("county")
-                    )
-                    results.append(CityResult(
-                        display_name=item.get("display_name", ""),
-                        city=city,
-                        country=address.get("country"),
-                        latitude=float(item["lat"]),
-                        longitude=float(item["lon"])
-                    ))
-    except Exception as e:
+        matches = await search_cache.get_or_fetch(q, lambda: geocoder.search(q, limit=5), limit=5)
+    except GeocodingError as e:
         print(f"Geocoding search error: {e}")
+        return []
     
-    return results
+    return [
+        CityResult(
+            display_name=match.display_name,
+            city=match.location.get("city"),
+            country=match.location.get("country"),
+            latitude=match.latitude,
+            longitude=match.longitude
+        )
+        for match in matches
+    ]
+
+@router.get("/stats")
+def get_geocoding_stats():
+    """Reverse geocoding cache, provider, write path and background enrichment counters."""
+    return {
+        "cache": geocode_cache.get_stats(),
+        "providers": geocoder.get_stats(),
+        "query_cache": {"search": search_cache.get_stats(), "forward": forward_cache.get_stats()},
+        "write_path": dict(write_path_counters),
+        "single_flight": reverse_flights.get_stats(),
+        "enrichment": enrichment_worker.get_stats(),
+    }
@@ -1,12 +1,22 @@
-from typing import Annotated, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from typing import Annotated, List, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, File, Form
 from sqlmodel import Session, select, func, or_
 from backend.database import get_session
 from backend.models import Map, MapParticipant, Point, User, Route
 from backend.schemas import MapCreate, MapRead, PointCreate, PointRead, PointUpdate
 from backend.api.deps import get_current_user
-from backend.services.geocoding import reverse_geocode, forward_geocode
+from backend.services.geocoding import geocode_for_write, forward_geocode, apply_location
+from backend.services.clustering import cluster_cache
+from backend.services.enrichment import enrichment_worker
 from backend.services.images import save_upload_file, delete_image
+from backend.services.places import place_directory
+from backend.services.point_pages import keyset_page, point_counts
+from backend.services.point_search import point_search
+from backend.services.scoreboard import scoreboard_cache
+from backend.services.spatial import bbox_condition
+from backend.services.timeline import timeline_cache
+from backend.services.vector_tiles import MAX_ZOOM, MEDIA_TYPE, tile_cache
+from backend.services import user_stats
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/maps", tags=["maps"])
@@ -32,6 +42,24 @@ class PaginatedPointsResponse(BaseModel):
     limit: int
     pages: int
 
+class CursorPointsResponse(BaseModel):
+    items: List[PointRead]
+    total: int  # Cached, may lag behind writes from other workers
+    limit: int
+    next_cursor: Optional[str] = None  # None on the last page
+
+# --- Scoreboard ---
+class ScoreboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    username: str
+    role: str
+    assigned_color: Optional[str] = None
+    points: int
+    unique_cities: int
+    unique_countries: int
+    unique_continents: int
+
 # --- Map Endpoints ---
 @router.post("", response_model=MapRead)
 def create_map(
@@ -114,6 +142,7 @@ def delete_map(
     
     # Delete points images first
     points = session.exec(select(Point).where(Point.map_id == map_id)).all()
+    user_stats.point_removed(session, *points)
     for p in points:
         delete_image(p.photo_path)
         session.delete(p)
@@ -211,42 +240,115 @@ async def add_point(
     if photo:
         photo_path = await save_upload_file(photo)
 
-    geo_data = await reverse_geocode(latitude, longitude)
+    # Points the geocoder cannot place within the write budget (or at all in
+    # async mode) are committed as pending and geocoded in the background
+    geo_data = await geocode_for_write(latitude, longitude)
     
     new_point = Point(
         map_id=map_id,
         user_id=current_user.id,
         latitude=latitude,
         longitude=longitude,
-        city=geo_data.get("city"),
-        region=geo_data.get("region"),
-        country=geo_data.get("country"),
-        continent=geo_data.get("continent"),
         category=category,
         description=description,
         photo_path=photo_path
     )
+    if geo_data is not None:
+        apply_location(new_point, geo_data)
+    else:
+        new_point.geocode_status = "pending"
     session.add(new_point)
+    user_stats.point_added(session, new_point)
     session.commit()
     session.refresh(new_point)
     
+    if new_point.geocode_status == "pending":
+        enrichment_worker.enqueue(new_point.id)
+    
     return new_point
 
 @router.get("/{map_id}/points", response_model=List[PointRead])
 def get_points(
     map_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_session),
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lng: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lng: Optional[float] = Query(None, ge=-180, le=180)
 ):
+    """Visible points of a map, or only those in a viewport when all four bounds are given.
+
+    min_lng > max_lng selects a viewport crossing the antimeridian.
+    """
     # Only validation checks
     db_map = session.get(Map, map_id)
     if not db_map:
         raise HTTPException(status_code=404, detail="Map not found")
     
-    points = session.exec(select(Point).where(Point.map_id == map_id, Point.hidden_at == None)).all()
+    query = select(Point).where(Point.hidden_at == None)
+    bounds = (min_lat, min_lng, max_lat, max_lng)
+    if any(bound is not None for bound in bounds):
+        if any(bound is None for bound in bounds):
+            raise HTTPException(status_code=400, detail="min_lat, min_lng, max_lat and max_lng go together")
+        if min_lat > max_lat:
+            raise HTTPException(status_code=400, detail="min_lat must not exceed max_lat")
+        # Scopes to the map itself; a separate map_id filter makes SQLite scan the whole map
+        query = query.where(bbox_condition(map_id, min_lat, min_lng, max_lat, max_lng))
+    else:
+        query = query.where(Point.map_id == map_id)
+    
+    points = session.exec(query).all()
     return points
 
-@router.get("/{map_id}/points/paginated", response_model=PaginatedPointsResponse)
+@router.get("/{map_id}/clusters", response_model=dict)
+def get_clusters(
+    map_id: int,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: Session = Depends(get_session),
+    zoom: int = Query(..., ge=0, le=22),
+    min_lat: float = Query(-90, ge=-90, le=90),
+    min_lng: float = Query(-180, ge=-180, le=180),
+    max_lat: float = Query(90, ge=-90, le=90),
+    max_lng: float = Query(180, ge=-180, le=180)
+):
+    """Visible points of a map in the viewport, grouped into clusters for the zoom level.
+
+    Each cluster has its centroid, point count and counts per category.
+    min_lng > max_lng selects a viewport crossing the antimeridian.
+    """
+    db_map = session.get(Map, map_id)
+    if not db_map:
+        raise HTTPException(status_code=404, detail="Map not found")
+    if min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="min_lat must not exceed max_lat")
+    
+    return cluster_cache.tree(session, map_id).clusters(min_lat, min_lng, max_lat, max_lng, zoom)
+
+@router.get("/{map_id}/tiles/{z}/{x}/{y}.mvt")
+def get_tile(
+    map_id: int,
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: Session = Depends(get_session)
+):
+    """Mapbox Vector Tile of the map's points (clusters where too dense) and routes, with ETag revalidation."""
+    db_map = session.get(Map, map_id)
+    if not db_map:
+        raise HTTPException(status_code=404, detail="Map not found")
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise HTTPException(status_code=404, detail="Tile not found")
+    
+    tile = tile_cache.get(session, map_id, z, x, y)
+    headers = {"ETag": tile.etag, "Cache-Control": "private, no-cache"}
+    if tile.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=tile.data, media_type=MEDIA_TYPE, headers=headers)
+
+@router.get("/{map_id}/points/paginated", response_model=Union[PaginatedPointsResponse, CursorPointsResponse])
 def get_points_paginated(
     map_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
@@ -258,8 +360,16 @@ def get_points_paginated(
     sort_order: str = Query("desc"),
     country: Optional[str] = Query(None),
     city: Optional[str] = Query(None),
-    category: Optional[str] = Query(None)
+    category: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None)
 ):
+    """Page through a map's visible points.
+
+    With cursor (empty for the first page) pages are read by keyset, see
+    services/point_pages.py, and total is cached; page is then ignored.
+    search matches word prefixes through the full-text index, see
+    services/point_search.py; sort_by=relevance ranks the matches (page mode).
+    """
     db_map = session.get(Map, map_id)
     if not db_map:
         raise HTTPException(status_code=404, detail="Map not found")
@@ -267,8 +377,12 @@ def get_points_paginated(
     # Base query - exclude hidden points
     query = select(Point).where(Point.map_id == map_id, Point.hidden_at == None)
     
-    # Search filter
-    if search:
+    # Search filter: the full-text index, or ILIKE where it is unavailable
+    matches = point_search.matches(session.get_bind().dialect.name, search) if search else None
+    if matches is not None:
+        # IN, not a join: SQLite would otherwise run the MATCH once per point when counting
+        query = query.where(Point.id.in_(select(matches.c.id)))
+    elif search:
         search_filter = or_(
             Point.city.ilike(f"%{search}%"),
             Point.region.ilike(f"%{search}%"),
@@ -278,24 +392,35 @@ def get_points_paginated(
         )
         query = query.where(search_filter)
     
-    # Filters
+    # Filters (on place ids, so spelling and accents do not matter)
     if country:
-        query = query.where(Point.country == country)
+        query = query.where(Point.country_id.in_(place_directory.ids_named(session, "country", country)))
     if city:
-        query = query.where(Point.city == city)
+        query = query.where(Point.city_id.in_(place_directory.ids_named(session, "city", city)))
     if category:
         query = query.where(Point.category == category)
     
+    if cursor is not None:
+        filters = (search, country, city, category)
+        total = point_counts.total(session, map_id, filters, query)
+        try:
+            points, next_cursor = keyset_page(session, query, sort_by, sort_order, filters, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return CursorPointsResponse(items=points, total=total, limit=limit, next_cursor=next_cursor)
+    
     # Count total
     count_query = select(func.count()).select_from(query.subquery())
     total = session.exec(count_query).one()
     
-    # Sorting
+    # Sorting; id breaks ties so pages do not overlap
     sort_column = getattr(Point, sort_by, Point.timestamp)
-    if sort_order == "asc":
-        query = query.order_by(sort_column.asc())
+    if sort_by == "relevance" and matches is not None:
+        query = query.join(matches, matches.c.id == Point.id).order_by(matches.c.rank.desc(), Point.id.desc())
+    elif sort_order == "asc":
+        query = query.order_by(sort_column.asc(), Point.id.asc())
     else:
-        query = query.order_by(sort_column.desc())
+        query = query.order_by(sort_column.desc(), Point.id.desc())
     
     # Pagination
     offset = (page - 1) * limit
@@ -312,6 +437,33 @@ def get_points_paginated(
         pages=pages
     )
 
+@router.get("/{map_id}/scoreboard", response_model=List[ScoreboardEntry])
+def get_scoreboard(
+    map_id: int,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: Session = Depends(get_session)
+):
+    """Per-participant points and distinct places, ranked by points."""
+    db_map = session.get(Map, map_id)
+    if not db_map:
+        raise HTTPException(status_code=404, detail="Map not found")
+    
+    return scoreboard_cache.get(session, map_id)
+
+@router.get("/{map_id}/timeline", response_model=dict)
+def get_map_timeline(
+    map_id: int,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: Session = Depends(get_session),
+    bucket: str = Query("month", regex="^(day|week|month|year)$")
+):
+    """Points and first visits of new countries and cities per time bucket."""
+    db_map = session.get(Map, map_id)
+    if not db_map:
+        raise HTTPException(status_code=404, detail="Map not found")
+    
+    return timeline_cache.timeline(session, "map", map_id, bucket)
+
 @router.delete("/{map_id}/points/{point_id}")
 def delete_point(
     map_id: int,
@@ -328,6 +480,7 @@ def delete_point(
     # Delete image
     delete_image(point.photo_path)
     
+    user_stats.point_removed(session, point)
     session.delete(point)
     # Also delete associated routes?
     # For now, let's just delete the point. Routes might need cascade delete or manual cleanup.
@@ -495,17 +648,34 @@ async def update_point(
     if point.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only edit your own points")
     
+    before = user_stats.snapshot(point)
+    old_coordinates = (point.latitude, point.longitude)
     if latitude is not None and (-90 <= latitude <= 90):
         point.latitude = latitude
     if longitude is not None and (-180 <= longitude <= 180):
         point.longitude = longitude
     
-    # Recalculate geolocation if coords changed and city not manually provided?
-    # For simplicity, if coords change, we might want to reverse geocode again unless city is updated.
-    # But let's trust the user or the frontend to provide updated info if needed.
-    # If city is passed, update it.
-    if city is not None:
+    # Moved points are geocoded again, inline or in the background like new ones
+    moved = (point.latitude, point.longitude) != old_coordinates
+    if moved:
+        geo_data = await geocode_for_write(point.latitude, point.longitude)
+        if geo_data is not None:
+            apply_location(point, geo_data)
+        else:
+            point.geocode_status = "pending"
+    
+    # If city is passed without coordinates, move the point to that city.
+    if city is not None and latitude is None and longitude is None:
+        located = await forward_geocode(city)
+        if located:
+            point.latitude, point.longitude, geo_data = located
+            apply_location(point, geo_data)
+        else:
+            point.city = city
+            place_directory.assign(point)
+    elif city is not None:
         point.city = city
+        place_directory.assign(point)
     
     if category is not None:
         point.category = category
@@ -518,6 +688,10 @@ async def update_point(
         point.photo_path = await save_upload_file(photo)
 
     session.add(point)
+    user_stats.point_updated(session, point, before)
     session.commit()
     session.refresh(point)
+    
+    if moved and point.geocode_status == "pending":
+        enrichment_worker.enqueue(point.id)
     return point
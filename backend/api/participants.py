@@ -9,6 +9,7 @@ from backend.database import get_session
 from backend.models import Map, MapParticipant, User, Notification, Point
 from backend.schemas import ParticipantCreate, ParticipantRead
 from backend.api.deps import get_current_user
+from backend.services import user_stats
 
 router = APIRouter(prefix="/maps/{map_id}/participants", tags=["participants"])
 
@@ -130,6 +131,7 @@ def accept_invite(
     for point in hidden_points:
         point.hidden_at = None
         session.add(point)
+    user_stats.point_added(session, *hidden_points)
     
     notification.read = True
     session.add(notification)
@@ -237,6 +239,7 @@ def leave_map(
     user_points = session.exec(
         select(Point).where(Point.map_id == map_id, Point.user_id == current_user.id, Point.hidden_at == None)
     ).all()
+    user_stats.point_removed(session, *user_points)
     for point in user_points:
         point.hidden_at = datetime.utcnow()
         session.add(point)
@@ -285,6 +288,7 @@ def remove_participant(
     user_points = session.exec(
         select(Point).where(Point.map_id == map_id, Point.user_id == user_id, Point.hidden_at == None)
     ).all()
+    user_stats.point_removed(session, *user_points)
     for point in user_points:
         point.hidden_at = datetime.utcnow()
         session.add(point)
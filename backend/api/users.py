@@ -1,11 +1,15 @@
 from typing import Annotated, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlmodel import Session, select, or_
 from pydantic import BaseModel
 from backend.database import get_session
 from backend.models import User, Map
+from backend.core.config import settings
 from backend.api.deps import get_current_user
 from backend.services.achievements import get_user_stats
+from backend.services.leaderboard import leaderboard_snapshots
+from backend.services.rank_index import rank_index
+from backend.services.timeline import timeline_cache
 import bcrypt
 from datetime import datetime
 
@@ -29,12 +33,14 @@ class StatsResponse(BaseModel):
     badges_by_category: dict
     next_milestones: dict
     total_badges: int
+    continent_coverage: dict  # continent -> visited, total and percent of its countries
     # Rankings
     global_rank_points: Optional[int] = None
     global_rank_countries: Optional[int] = None
     global_rank_continents: Optional[int] = None
 
 class LeaderboardEntry(BaseModel):
+    rank: int
     user_id: int
     username: str
     total_points: int
@@ -74,35 +80,29 @@ def search_users(
 
 @router.get("/leaderboard", response_model=List[LeaderboardEntry])
 def get_leaderboard(
+    request: Request,
+    response: Response,
     session: Session = Depends(get_session),
     sort_by: str = Query("points", regex="^(points|countries|continents)$"),
-    limit: int = Query(50, ge=1, le=100)
+    limit: int = Query(50, ge=1, le=100),
+    offset: int = Query(0, ge=0)
 ):
-    """Get global leaderboard."""
-    users = session.exec(select(User)).all()
-    results = []
-    
-    # Calculate stats for all users (could be optimized with raw SQL later)
-    for user in users:
-        stats = get_user_stats(session, user.id)
-        results.append(LeaderboardEntry(
-            user_id=user.id,
-            username=user.username,
-            total_points=stats["total_points"],
-            unique_countries=stats["unique_countries"],
-            unique_continents=stats["unique_continents"],
-            total_badges=stats["total_badges"]
-        ))
+    """Get global leaderboard from the in-memory snapshot, with ETag revalidation."""
+    cache_control = (
+        f"public, max-age={settings.LEADERBOARD_MAX_AGE_SECONDS}, "
+        f"stale-while-revalidate={settings.LEADERBOARD_REFRESH_SECONDS}"
+    )
+    snapshot, entries = leaderboard_snapshots.page(sort_by, offset, limit)
+    if entries is None:
+        # Past the snapshot: rank live, without an ETag
+        response.headers["Cache-Control"] = cache_control
+        return leaderboard_snapshots.query(session, sort_by, offset, limit)
     
-    # Sort in python for now (easier than complex SQL with the current dynamic point logic)
-    if sort_by == "points":
-        results.sort(key=lambda x: x.total_points, reverse=True)
-    elif sort_by == "countries":
-        results.sort(key=lambda x: x.unique_countries, reverse=True)
-    elif sort_by == "continents":
-        results.sort(key=lambda x: x.unique_continents, reverse=True)
-        
-    return results[:limit]
+    headers = {"ETag": snapshot.etag, "Cache-Control": cache_control}
+    if snapshot.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return entries
 
 @router.get("/{user_id}/profile", response_model=dict)
 def get_public_profile(
@@ -125,16 +125,17 @@ def get_public_profile(
         "stats": stats
     }
 
-def calculate_rank(session: Session, current_user_stats, sort_key):
-    # This is a bit heavy, looping all users. OK for small scale.
-    # In production, this should be a cached SQL query or a separate Rank table.
-    users = session.exec(select(User)).all()
-    better_count = 0
-    for user in users:
-        stats = get_user_stats(session, user.id)
-        if stats[sort_key] > current_user_stats[sort_key]:
-            better_count += 1
-    return better_count + 1
+@router.get("/{user_id}/timeline", response_model=dict)
+def get_user_timeline(
+    user_id: int,
+    session: Session = Depends(get_session),
+    bucket: str = Query("month", regex="^(day|week|month|year)$")
+):
+    """Points and first visits of new countries and cities per time bucket."""
+    if not session.get(User, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return timeline_cache.timeline(session, "user", user_id, bucket)
 
 @router.get("/me/stats", response_model=StatsResponse)
 def get_my_stats(
@@ -143,10 +144,10 @@ def get_my_stats(
 ):
     stats = get_user_stats(session, current_user.id)
     
-    # Calculate ranks
-    stats["global_rank_points"] = calculate_rank(session, stats, "total_points")
-    stats["global_rank_countries"] = calculate_rank(session, stats, "unique_countries")
-    stats["global_rank_continents"] = calculate_rank(session, stats, "unique_continents")
+    # Ranks come from the in-memory index, a binary search per metric
+    stats["global_rank_points"] = rank_index.rank("total_points", stats["total_points"])
+    stats["global_rank_countries"] = rank_index.rank("unique_countries", stats["unique_countries"])
+    stats["global_rank_continents"] = rank_index.rank("unique_continents", stats["unique_continents"])
     
     return stats
 
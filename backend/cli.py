@@ -0,0 +1,250 @@
+"""Maintenance commands, run with `python -m backend.cli <command>`.
+
+    regeocode       Geocode points with missing or failed locations (or all
+                    points with --all), resumable from a JSON checkpoint file.
+    rebuild-stats   Recompute the materialized per-user stats from the point
+                    table, to repair drift.
+    replay-achievements
+                    Rebuild every user's badges from their point history.
+    recompute-stats Recompute stats and badges for all users in one vectorized
+                    pass over the point table (needs numpy; pause writes first).
+    export-analytics
+                    Append new points, users and maps to the Parquet snapshot
+                    read by services/analytics.py (needs pyarrow).
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+
+from sqlmodel import Session, select, func, or_
+from backend.core.config import settings
+from backend.database import engine, init_db
+from backend.models import Point, User
+from backend.services.geocoder_providers import nominatim_limiter
+from backend.services.geocoding import GeocodingError, apply_location, reverse_geocode
+from backend.services.http_client import http_clients
+from backend.services.offline_geocoder import offline_geocoder
+from backend.services import achievements, user_stats
+
+DEFAULT_CHECKPOINT = "data/regeocode.checkpoint.json"
+
+
+def _load_checkpoint(path: str) -> dict:
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"last_id": 0, "processed": 0, "resolved": 0, "failed": 0, "errors": 0}
+
+
+def _save_checkpoint(path: str, checkpoint: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    # Atomic swap so a kill mid-write never leaves a truncated checkpoint
+    os.replace(tmp_path, path)
+
+
+def _needs_geocoding(query, include_all: bool):
+    if include_all:
+        return query
+    return query.where(or_(Point.geocode_status == None, Point.geocode_status != "resolved"))
+
+
+async def _geocode(point_id: int, lat: float, lng: float, semaphore: asyncio.Semaphore, retries: int):
+    async with semaphore:
+        for attempt in range(retries + 1):
+            try:
+                return point_id, lat, lng, await reverse_geocode(lat, lng, raise_errors=True)
+            except GeocodingError as e:
+                if attempt == retries:
+                    print(f"Giving up on point {point_id}: {e}")
+                    return point_id, lat, lng, None
+                await asyncio.sleep(settings.GEOCODE_RETRY_BASE_SECONDS * 2 ** attempt)
+
+
+def _write_batch(results: List[Tuple[int, float, float, Optional[dict]]], checkpoint: dict):
+    """Apply one batch of results in a single transaction."""
+    with Session(engine) as session:
+        points = session.exec(select(Point).where(Point.id.in_([r[0] for r in results]))).all()
+        by_id = {point.id: point for point in points}
+        for point_id, lat, lng, geo in results:
+            point = by_id.get(point_id)
+            # Skip points deleted or moved since they were read; a later run picks moves up
+            if point is None or (point.latitude, point.longitude) != (lat, lng):
+                continue
+            if geo is None:
+                checkpoint["errors"] += 1
+                continue
+            before = user_stats.snapshot(point)
+            apply_location(point, geo)
+            checkpoint[point.geocode_status] += 1
+            session.add(point)
+            user_stats.point_updated(session, point, before)
+        session.commit()
+
+
+async def regeocode(args):
+    init_db()
+    if settings.GEOCODER_MODE == "offline":
+        offline_geocoder.load(settings.GEODATA_DIR, settings.OFFLINE_CITY_MAX_DISTANCE_KM)
+    if args.rate:
+        nominatim_limiter.interval = 1.0 / args.rate
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint = _load_checkpoint(args.checkpoint)
+    if checkpoint["last_id"]:
+        print(f"Resuming after point {checkpoint['last_id']} ({checkpoint['processed']} already processed)")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started = time.monotonic()
+    processed_this_run = 0
+    try:
+        while True:
+            # Keyset pagination: stable under concurrent inserts and cheap at any depth
+            with Session(engine) as session:
+                batch = session.exec(
+                    _needs_geocoding(
+                        select(Point.id, Point.latitude, Point.longitude).where(Point.id > checkpoint["last_id"]),
+                        args.all,
+                    ).order_by(Point.id).limit(args.batch_size)
+                ).all()
+            if not batch:
+                break
+
+            results = await asyncio.gather(*[
+                _geocode(point_id, lat, lng, semaphore, args.retries) for point_id, lat, lng in batch
+            ])
+            _write_batch(results, checkpoint)
+
+            checkpoint["last_id"] = batch[-1][0]
+            checkpoint["processed"] += len(batch)
+            _save_checkpoint(args.checkpoint, checkpoint)
+
+            processed_this_run += len(batch)
+            with Session(engine) as session:
+                backlog = session.exec(
+                    _needs_geocoding(
+                        select(func.count()).select_from(Point).where(Point.id > checkpoint["last_id"]),
+                        args.all,
+                    )
+                ).one()
+            rate = processed_this_run / max(time.monotonic() - started, 1e-9)
+            eta = f", ~{backlog / rate:.0f}s left" if rate else ""
+            print(
+                f"Processed {checkpoint['processed']} (resolved {checkpoint['resolved']}, "
+                f"failed {checkpoint['failed']}, errors {checkpoint['errors']}) "
+                f"at {rate:.1f} points/s; backlog {backlog}{eta}"
+            )
+    finally:
+        await http_clients.aclose()
+
+    print(f"Done: {processed_this_run} points in {time.monotonic() - started:.1f}s")
+    # A finished run starts over next time
+    if os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+
+def _all_user_ids() -> List[int]:
+    with Session(engine) as session:
+        return list(session.exec(select(User.id).order_by(User.id)).all())
+
+
+async def rebuild_stats(args):
+    init_db()
+    user_ids = args.user_id or _all_user_ids()
+    started = time.monotonic()
+    # One transaction per batch of users keeps locks short on large tables
+    for start in range(0, len(user_ids), args.batch_size):
+        with engine.begin() as connection:
+            user_stats.rebuild_user_stats(connection, user_ids[start:start + args.batch_size])
+        print(f"Rebuilt stats for {min(start + args.batch_size, len(user_ids))}/{len(user_ids)} users")
+    print(f"Done in {time.monotonic() - started:.1f}s")
+
+
+async def replay_achievements(args):
+    init_db()
+    user_ids = args.user_id or _all_user_ids()
+    started = time.monotonic()
+    written = 0
+    for start in range(0, len(user_ids), args.batch_size):
+        with engine.begin() as connection:
+            written += achievements.replay_achievements(connection, user_ids[start:start + args.batch_size])
+        print(f"Replayed achievements for {min(start + args.batch_size, len(user_ids))}/{len(user_ids)} users")
+    print(f"Done in {time.monotonic() - started:.1f}s, {written} badges")
+
+
+async def recompute_stats(args):
+    # Imported here so the other commands run without numpy
+    from backend.services.bulk_stats import recompute_all_stats
+
+    init_db()
+    report = recompute_all_stats(engine, chunk_size=args.chunk_size)
+    print(
+        f"Recomputed {report['users']} users from {report['points']} points in {report['seconds']}s "
+        f"({report['rows_per_second']} points/s read, {report['place_counts']} place counts, "
+        f"{report['achievement_changes']} achievement changes)"
+    )
+
+
+async def export_analytics(args):
+    # Imported here so the other commands run without pyarrow
+    from backend.services.analytics_export import export_snapshot
+
+    init_db()
+    while True:
+        started = time.monotonic()
+        report = export_snapshot(engine, full=args.full, batch_size=args.batch_size)
+        kind = "Full" if report["full"] else "Incremental"
+        print(f"{kind} export: {report['points']} points in {time.monotonic() - started:.1f}s, watermark {report['watermark']}")
+        if not args.every:
+            break
+        args.full = False
+        await asyncio.sleep(args.every)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    regeocode_parser = commands.add_parser("regeocode", help="Geocode points with missing or failed locations")
+    regeocode_parser.add_argument("--all", action="store_true", help="Re-geocode every point, not only unresolved ones")
+    regeocode_parser.add_argument("--batch-size", type=int, default=200, help="Points per transaction")
+    regeocode_parser.add_argument("--concurrency", type=int, default=settings.GEOCODE_WORKER_CONCURRENCY)
+    regeocode_parser.add_argument("--rate", type=float, default=None,
+                                  help="Max Nominatim requests per second (default NOMINATIM_MAX_REQUESTS_PER_SECOND)")
+    regeocode_parser.add_argument("--retries", type=int, default=settings.GEOCODE_MAX_RETRIES)
+    regeocode_parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    regeocode_parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    regeocode_parser.set_defaults(handler=regeocode)
+
+    stats_parser = commands.add_parser("rebuild-stats", help="Recompute materialized per-user stats")
+    stats_parser.add_argument("--user-id", type=int, action="append", help="Only this user (repeatable)")
+    stats_parser.add_argument("--batch-size", type=int, default=500, help="Users per transaction")
+    stats_parser.set_defaults(handler=rebuild_stats)
+
+    replay_parser = commands.add_parser("replay-achievements", help="Rebuild badges from point history")
+    replay_parser.add_argument("--user-id", type=int, action="append", help="Only this user (repeatable)")
+    replay_parser.add_argument("--batch-size", type=int, default=500, help="Users per transaction")
+    replay_parser.set_defaults(handler=replay_achievements)
+
+    recompute_parser = commands.add_parser("recompute-stats", help="Recompute all stats in one vectorized pass")
+    recompute_parser.add_argument("--chunk-size", type=int, default=200000, help="Points read per chunk")
+    recompute_parser.set_defaults(handler=recompute_stats)
+
+    export_parser = commands.add_parser("export-analytics", help="Export points, users and maps to Parquet")
+    export_parser.add_argument("--full", action="store_true", help="Rewrite every point, not only new ones")
+    export_parser.add_argument("--batch-size", type=int, default=50000, help="Points per query and file")
+    export_parser.add_argument("--every", type=float, default=None, help="Keep running, exporting every N seconds")
+    export_parser.set_defaults(handler=export_analytics)
+
+    args = parser.parse_args(argv)
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
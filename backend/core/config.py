@@ -31,6 +31,111 @@ class Settings(BaseSettings):
     _DEV_TURNSTILE_SITE_KEY: str = "1x00000000000000000000AA"  # Always passes
     _DEV_TURNSTILE_SECRET_KEY: str = "1x0000000000000000000000000000000AA"  # Always passes
 
+    # Outbound HTTP (shared keep-alive pools, one per upstream host)
+    HTTP_TIMEOUT_SECONDS: float = 5.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 3.0
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 10
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 5
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP2_ENABLED: bool = True  # Only used when the h2 package is installed
+
+    # Geocoder mode: "remote" (Nominatim) or "offline" (local datasets, Nominatim as fallback)
+    GEOCODER_MODE: str = "remote"
+    GEODATA_DIR: str = "data/geo"
+    OFFLINE_CITY_MAX_DISTANCE_KM: float = 30.0
+
+    # Geocoder providers, tried in order: "local" (offline index + gazetteer),
+    # "nominatim", "stub" (see services/stub_geocoder.py)
+    GEOCODER_PROVIDERS: str = "local,nominatim"
+    NOMINATIM_BASE_URL: str = "https://nominatim.openstreetmap.org"
+    STUB_GEOCODER_URL: str = "http://127.0.0.1:8399"
+    # Start the next provider when one is slower than this percentile of its
+    # recent latencies (0 disables hedging; errors always fail over)
+    GEOCODER_HEDGE_PERCENTILE: float = 0.95
+    GEOCODER_HEDGE_MIN_DELAY_SECONDS: float = 0.2
+    GEOCODER_HEDGE_MIN_SAMPLES: int = 20
+    # Per-provider circuit breaker: opens after N consecutive failed or slow calls
+    GEOCODER_BREAKER_FAILURE_THRESHOLD: int = 5
+    GEOCODER_BREAKER_SLOW_CALL_SECONDS: float = 2.0
+    GEOCODER_BREAKER_RESET_SECONDS: float = 30.0  # Open time before half-open probes
+    GEOCODER_BREAKER_HALF_OPEN_PROBES: int = 1
+    # Longest add_point/update_point wait on geocoding before committing the
+    # point as pending for background enrichment
+    GEOCODE_WRITE_BUDGET_SECONDS: float = 1.5
+
+    # Stand-in geocoding server behaviour, for tests and benchmarks
+    STUB_GEOCODER_LATENCY_SECONDS: float = 0.0
+    STUB_GEOCODER_SLOW_RATIO: float = 0.0  # Share of requests delayed by STUB_GEOCODER_SLOW_SECONDS
+    STUB_GEOCODER_SLOW_SECONDS: float = 2.0
+    STUB_GEOCODER_ERROR_RATIO: float = 0.0  # Share of requests answered with HTTP 503
+
+    # Local place-name index for /geocode/search and forward geocoding,
+    # built from GEODATA_DIR/cities.txt when present
+    GAZETTEER_INDEX_PATH: str = "data/geo/gazetteer.idx"
+    GAZETTEER_MAX_SCAN: int = 1000  # Prefix matches examined per query before ranking
+
+    # Cache of /geocode/search and forward geocoding results, keyed on the folded query
+    QUERY_CACHE_MAX_ENTRIES: int = 5000
+    QUERY_CACHE_TTL_SECONDS: int = 24 * 3600
+
+    # Background geocoding: commit points immediately and enrich city/region/country later
+    GEOCODE_ASYNC: bool = False
+    NOMINATIM_MAX_REQUESTS_PER_SECOND: float = 1.0  # Nominatim usage policy
+    GEOCODE_MAX_RETRIES: int = 5
+    GEOCODE_RETRY_BASE_SECONDS: float = 2.0
+    GEOCODE_WORKER_CONCURRENCY: int = 4
+
+    # Reverse geocoding cache
+    # Coordinates are snapped to a grid of GEOCODE_CACHE_CELL_DEGREES (0.01° ≈ 1.1 km)
+    GEOCODE_CACHE_CELL_DEGREES: float = 0.01
+    GEOCODE_CACHE_TTL_SECONDS: int = 30 * 24 * 3600  # 30 days
+    GEOCODE_CACHE_MEMORY_SIZE: int = 10000  # In-process LRU entries
+    GEOCODE_CACHE_DB_MAX_ROWS: int = 200000  # Rows kept in the geocodecacheentry table
+
+    # In-memory rank index for /users/me/stats; rebuilt from userstats this often
+    # so each worker sees changes made by the others
+    RANK_INDEX_REBUILD_SECONDS: int = 300
+
+    # Public leaderboard snapshots, served from memory
+    LEADERBOARD_SNAPSHOT_SIZE: int = 1000  # Entries kept per sort order; deeper pages query live
+    LEADERBOARD_REFRESH_SECONDS: int = 60
+    LEADERBOARD_REFRESH_CHANGES: int = 50  # Committed stats changes that make a snapshot stale early
+    LEADERBOARD_STALE_WHILE_REVALIDATE: bool = True
+    LEADERBOARD_MAX_AGE_SECONDS: int = 30  # Cache-Control max-age for clients and proxies
+    # "database", or "analytics" to rank from the columnar snapshot (needs pyarrow
+    # and a scheduled export; falls back to the database until the first export).
+    # /users/me/stats ranks always come from the database
+    LEADERBOARD_SOURCE: str = "database"
+
+    # The caches below are updated by this process's own commits (see
+    # services/change_feed.py); their TTLs, where set, bound how stale they get from
+    # writes made by other worker processes
+
+    # Per-map scoreboards, cached until a point or participant of the map changes
+    SCOREBOARD_CACHE_MAX_ENTRIES: int = 1000
+    SCOREBOARD_CACHE_TTL_SECONDS: int = 300
+
+    # Filtered point totals for cursor pagination, see services/point_pages.py
+    POINT_COUNT_CACHE_MAX_ENTRIES: int = 5000
+    POINT_COUNT_CACHE_TTL_SECONDS: int = 60
+
+    # Closed timeline buckets per user or map and granularity, see services/timeline.py
+    TIMELINE_CACHE_MAX_ENTRIES: int = 5000
+
+    # Per-map cluster trees for GET /maps/{map_id}/clusters, see services/clustering.py
+    CLUSTER_CACHE_MAX_ENTRIES: int = 200
+    CLUSTER_CACHE_TTL_SECONDS: int = 600
+
+    # Vector tiles, see services/vector_tiles.py
+    TILE_MAX_POINTS: int = 5000  # Denser tiles carry clusters instead of points
+    TILE_CACHE_MAX_ENTRIES: int = 20000
+    TILE_CACHE_TTL_SECONDS: int = 600
+    TILE_EDIT_LOG_SIZE: int = 1000  # Commits per map kept to revalidate older cached tiles
+
+    # Columnar analytics snapshot, written by "python -m backend.cli export-analytics"
+    ANALYTICS_DIR: str = "data/analytics"
+    ANALYTICS_FULL_EXPORT_HOURS: int = 24  # Full rewrite picks up edited, hidden and deleted points
+
     model_config = SettingsConfigDict(env_file=".env", env_ignore_empty=True, extra="ignore")
     
     @property
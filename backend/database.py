@@ -12,7 +12,10 @@ connect_args = {"check_same_thread": False} if "sqlite" in db_url else {}
 engine = create_engine(db_url, echo=settings.DEBUG, connect_args=connect_args)
 
 def init_db():
+    # Imported here so every table is registered before create_all
+    from backend.migrations import run_migrations
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
 
 def get_session():
     with Session(engine) as session:
@@ -1,11 +1,38 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from backend.core.config import settings
 from backend.database import init_db
+from backend.services.enrichment import enrichment_worker
+from backend.services.gazetteer import gazetteer
+from backend.services.http_client import http_clients
+from backend.services.leaderboard import leaderboard_snapshots
+from backend.services.point_pages import point_counts
+from backend.services.scoreboard import scoreboard_cache
+from backend.services.clustering import cluster_cache
+from backend.services.timeline import timeline_cache
+from backend.services.vector_tiles import tile_cache
+from backend.services.offline_geocoder import offline_geocoder
+from backend.services.rank_index import rank_index
 
 from fastapi.middleware.cors import CORSMiddleware
 from backend.api import auth_routes, maps, participants, users, geocode, notifications
 
-app = FastAPI(title=settings.PROJECT_NAME)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    if settings.GEOCODER_MODE == "offline":
+        offline_geocoder.load(settings.GEODATA_DIR, settings.OFFLINE_CITY_MAX_DISTANCE_KM)
+    gazetteer.load(settings.GEODATA_DIR, settings.GAZETTEER_INDEX_PATH, settings.GAZETTEER_MAX_SCAN)
+    await enrichment_worker.start()
+    await leaderboard_snapshots.start()
+    yield
+    await leaderboard_snapshots.stop()
+    await enrichment_worker.stop()
+    gazetteer.close()
+    # Close pooled outbound connections
+    await http_clients.aclose()
+
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,10 +55,41 @@ app.include_router(notifications.router)
 os.makedirs("uploads", exist_ok=True)
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
-@app.on_event("startup")
-def on_startup():
-    init_db()
-
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Odyssey", "environment": "DEBUG" if settings.DEBUG else "PRODUCTION"}
+
+@app.get("/metrics/http")
+def read_http_metrics():
+    """Connection reuse counters for the shared outbound HTTP clients."""
+    return http_clients.get_stats()
+
+@app.get("/metrics/ranks")
+def read_rank_metrics():
+    """Size, age and update counters of the in-memory rank index and leaderboard snapshots."""
+    return {"rank_index": rank_index.get_stats(), "leaderboard": leaderboard_snapshots.get_stats()}
+
+@app.get("/metrics/point-counts")
+def read_point_count_metrics():
+    """Hit and invalidation counters of the cached point listing totals."""
+    return point_counts.get_stats()
+
+@app.get("/metrics/scoreboards")
+def read_scoreboard_metrics():
+    """Hit and invalidation counters of the per-map scoreboard cache."""
+    return scoreboard_cache.get_stats()
+
+@app.get("/metrics/clusters")
+def read_cluster_metrics():
+    """Hit, build and incremental update counters of the per-map cluster trees."""
+    return cluster_cache.get_stats()
+
+@app.get("/metrics/tiles")
+def read_tile_metrics():
+    """Hit, revalidation and size counters of the vector tile cache."""
+    return tile_cache.get_stats()
+
+@app.get("/metrics/timelines")
+def read_timeline_metrics():
+    """Hit and invalidation counters of the closed timeline bucket cache."""
+    return timeline_cache.get_stats()
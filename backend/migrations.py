@@ -0,0 +1,200 @@
+"""Lightweight schema migrations, run at startup right after create_all.
+
+create_all only creates missing tables, so new columns and indexes on
+existing tables are added here. Data backfills are registered in
+DATA_MIGRATIONS and recorded in the schemamigration table so each runs once.
+"""
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import bindparam, delete, func, inspect, or_, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex
+from sqlmodel import SQLModel
+
+from backend.models import Place, Point, SchemaMigration, UserPlaceCount
+
+
+def _column_ddl(connection: Connection, column) -> str:
+    dialect = connection.dialect
+    ddl = f"{dialect.identifier_preparer.format_column(column)} {column.type.compile(dialect=dialect)}"
+
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        literal = column.type.literal_processor(dialect)
+        ddl += f" DEFAULT {literal(default) if literal else repr(default)}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def add_missing_columns(connection: Connection):
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            table_name = connection.dialect.identifier_preparer.format_table(table)
+            connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {_column_ddl(connection, column)}"))
+            print(f"Migration: added column {table.name}.{column.name}")
+
+
+def merge_duplicate_places(connection: Connection):
+    """Fold places inserted twice by racing workers into the lowest id, so the unique index can be built."""
+    from backend.services.places import PLACE_KINDS
+    from backend.services.user_stats import rebuild_user_stats
+
+    merged: Dict[int, int] = {}  # duplicate id -> kept id
+    # Parents first: merging two parents can turn their children into duplicates
+    for kind in PLACE_KINDS:
+        children = connection.execute(
+            select(Place.id, Place.key, Place.parent_id)
+            .where(Place.kind == kind, Place.parent_id.in_(list(merged)))
+            .order_by(Place.id)
+        ).all() if merged else []
+        for place_id, key, parent_id in children:
+            sibling = connection.execute(
+                select(func.min(Place.id)).where(Place.kind == kind, Place.key == key, Place.parent_id == merged[parent_id])
+            ).scalar()
+            if sibling is not None:
+                merged[place_id] = sibling
+            else:
+                connection.execute(update(Place).where(Place.id == place_id).values(parent_id=merged[parent_id]))
+
+        # Elsewhere the (kind, parent_id, key) constraint already rules out duplicates
+        for key, keep in connection.execute(
+            select(Place.key, func.min(Place.id))
+            .where(Place.kind == kind, Place.parent_id.is_(None))
+            .group_by(Place.key).having(func.count() > 1)
+        ).all():
+            merged.update((place_id, keep) for place_id in connection.execute(
+                select(Place.id).where(Place.kind == kind, Place.key == key, Place.parent_id.is_(None), Place.id != keep)
+            ).scalars())
+
+    if not merged:
+        return
+    pairs = [{"duplicate": duplicate, "keep": keep} for duplicate, keep in merged.items()]
+    for kind in PLACE_KINDS:
+        column = getattr(Point, f"{kind}_id")
+        connection.execute(update(Point).where(column == bindparam("duplicate")).values({column: bindparam("keep")}), pairs)
+    connection.execute(delete(UserPlaceCount).where(UserPlaceCount.place_id.in_(list(merged))))
+    connection.execute(delete(Place).where(Place.id.in_(list(merged))))
+    # Counts split across the duplicates are recounted; badges follow silently
+    rebuild_user_stats(connection)
+    print(f"Migration: merged {len(merged)} duplicate places")
+
+
+def create_missing_indexes(connection: Connection):
+    # IF NOT EXISTS rather than checkfirst: reflection skips expression indexes
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def backfill_point_geocode_status(connection: Connection):
+    """Points created before async enrichment are either resolved or failed."""
+    connection.execute(text(
+        "UPDATE point SET geocode_status = CASE WHEN country IS NULL THEN 'failed' ELSE 'resolved' END "
+        "WHERE geocode_status IS NULL"
+    ))
+
+
+def backfill_point_place_ids(connection: Connection):
+    """Resolve place ids once per distinct location tuple and write them to matching points."""
+    # Imported here: services.places needs the engine from backend.database
+    from backend.services.places import PLACE_KINDS, place_directory
+
+    columns = [getattr(Point, kind) for kind in PLACE_KINDS]
+    locations = connection.execute(
+        select(*columns).where(
+            *[getattr(Point, f"{kind}_id").is_(None) for kind in PLACE_KINDS],
+            or_(*[column.is_not(None) for column in columns]),
+        ).distinct()
+    ).all()
+    for location in locations:
+        geo = dict(zip(PLACE_KINDS, location))
+        ids = place_directory.resolve(geo, connection)
+        matches = [column == value if value is not None else column.is_(None) for column, value in zip(columns, location)]
+        connection.execute(
+            update(Point).where(*matches).values(**{f"{kind}_id": ids[kind] for kind in PLACE_KINDS})
+        )
+    print(f"Migration: linked {len(locations)} distinct locations to places")
+
+
+def build_user_stats(connection: Connection):
+    from backend.services.user_stats import rebuild_user_stats
+
+    count = rebuild_user_stats(connection)
+    print(f"Migration: built stats for {count} users")
+
+
+def build_achievements(connection: Connection):
+    from backend.services.achievements import replay_achievements
+
+    count = replay_achievements(connection)
+    print(f"Migration: replayed {count} achievements")
+
+
+def backfill_point_cells(connection: Connection):
+    from backend.services.spatial import cell_for
+
+    updated = 0
+    while True:
+        rows = connection.execute(
+            select(Point.id, Point.latitude, Point.longitude).where(Point.cell.is_(None)).limit(5000)
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            update(Point).where(Point.id == bindparam("point_id")).values(cell=bindparam("cell")),
+            [{"point_id": row.id, "cell": cell_for(row.latitude, row.longitude)} for row in rows],
+        )
+        updated += len(rows)
+    print(f"Migration: computed cells for {updated} points")
+
+
+def build_point_search(connection: Connection):
+    from backend.services.point_search import point_search
+
+    point_search.rebuild(connection)
+
+
+# Ordered (name, migration) pairs; never rename or reorder applied entries
+DATA_MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("0001_point_geocode_status", backfill_point_geocode_status),
+    ("0002_point_place_ids", backfill_point_place_ids),
+    ("0003_user_stats", build_user_stats),
+    ("0004_achievements", build_achievements),
+    ("0005_point_cells", backfill_point_cells),
+    ("0006_point_search", build_point_search),
+]
+
+
+def run_migrations(engine: Engine):
+    # Imported here: services.point_search needs the models registered first
+    from backend.services.point_search import point_search
+
+    with engine.begin() as connection:
+        add_missing_columns(connection)
+        # Before the indexes: duplicates would fail the unique place index
+        merge_duplicate_places(connection)
+        create_missing_indexes(connection)
+        point_search.create_index(connection)
+
+    with engine.begin() as connection:
+        applied = set(connection.execute(text("SELECT name FROM schemamigration")).scalars())
+
+    for name, migration in DATA_MIGRATIONS:
+        if name in applied:
+            continue
+        with engine.begin() as connection:
+            migration(connection)
+            connection.execute(
+                SchemaMigration.__table__.insert().values(name=name, applied_at=datetime.utcnow())
+            )
+        print(f"Migration: applied {name}")
@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Optional, List
+from sqlalchemy import Index, UniqueConstraint, text
 from sqlmodel import SQLModel, Field, Relationship
 
 class User(SQLModel, table=True):
@@ -31,6 +32,17 @@ class Map(SQLModel, table=True):
     routes: List["Route"] = Relationship(back_populates="map")
 
 class Point(SQLModel, table=True):
+    # Timelines group a user's or a map's points by timestamp; viewport
+    # queries scan cell ranges of one map; point listings seek by their sort
+    # key, see services/point_pages.py
+    __table_args__ = (
+        Index("ix_point_user_timestamp", "user_id", "timestamp"),
+        Index("ix_point_map_timestamp", "map_id", "timestamp"),
+        Index("ix_point_map_cell", "map_id", "cell"),
+        Index("ix_point_map_city_key", "map_id", text("coalesce(city, '')")),
+        Index("ix_point_map_country_key", "map_id", text("coalesce(country, '')")),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     map_id: Optional[int] = Field(default=None, foreign_key="map.id")
     user_id: Optional[int] = Field(default=None, foreign_key="user.id")
@@ -43,6 +55,13 @@ class Point(SQLModel, table=True):
     continent: Optional[str] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     hidden_at: Optional[datetime] = None  # Set when user leaves, cleared when user rejoins
+    geocode_status: Optional[str] = Field(default=None, index=True)  # pending/resolved/failed
+    # Normalized copies of the location strings above, see services/places.py
+    city_id: Optional[int] = Field(default=None, foreign_key="place.id", index=True)
+    region_id: Optional[int] = Field(default=None, foreign_key="place.id", index=True)
+    country_id: Optional[int] = Field(default=None, foreign_key="place.id", index=True)
+    continent_id: Optional[int] = Field(default=None, foreign_key="place.id", index=True)
+    cell: Optional[int] = None  # Quadkey of latitude/longitude, see services/spatial.py
     
     # New fields
     category: Optional[str] = None # Restaurant, Hotel, etc.
@@ -74,9 +93,11 @@ class MapParticipant(SQLModel, table=True):
 
 class Achievement(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: Optional[int] = Field(default=None, foreign_key="user.id")
-    type: str # Cities/Countries/Continents
+    user_id: Optional[int] = Field(default=None, foreign_key="user.id", index=True)
+    type: str # cities/regions/countries/continents, see services/achievements.py
     level: int # Fibonacci
+    achieved_at: Optional[datetime] = None
+    revoked_at: Optional[datetime] = None  # Set while no longer earned; restored without a new notification
     
     user: Optional[User] = Relationship(back_populates="achievements")
 
@@ -91,3 +112,54 @@ class Notification(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     
     user: Optional[User] = Relationship(back_populates="notifications")
+
+class Place(SQLModel, table=True):
+    # continent -> country -> region -> city; cities without a region hang off the country
+    __table_args__ = (
+        UniqueConstraint("kind", "parent_id", "key"),
+        # NULLs never conflict in the constraint above, so top-level places need this one
+        Index("ux_place_kind_parent_key", "kind", text("coalesce(parent_id, 0)"), "key", unique=True),
+        Index("ix_place_kind_key", "kind", "key"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str  # continent/country/region/city
+    name: str
+    key: str  # fold_text(name), compared instead of the display name
+    iso_code: Optional[str] = None  # ISO 3166-1 alpha-2, countries only
+    parent_id: Optional[int] = Field(default=None, foreign_key="place.id")
+
+class UserStats(SQLModel, table=True):
+    # Materialized get_user_stats counts, maintained by services/user_stats.py
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    total_points: int = Field(default=0)
+    unique_cities: int = Field(default=0)
+    unique_regions: int = Field(default=0)
+    unique_countries: int = Field(default=0)
+    unique_continents: int = Field(default=0)
+    # JSON lists of place names
+    cities_list: str = Field(default="[]")
+    regions_list: str = Field(default="[]")
+    countries_list: str = Field(default="[]")
+    continents_list: str = Field(default="[]")
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class UserPlaceCount(SQLModel, table=True):
+    # Visible points per user and place; a row exists while the count is positive
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    place_id: int = Field(foreign_key="place.id", primary_key=True)
+    kind: str
+    points: int = Field(default=0)
+
+class GeocodeCacheEntry(SQLModel, table=True):
+    cell: str = Field(primary_key=True)  # Quantized "size:lat_index:lng_index" key
+    city: Optional[str] = None
+    region: Optional[str] = None
+    country: Optional[str] = None
+    country_code: Optional[str] = None
+    continent: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+class SchemaMigration(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
@@ -69,6 +69,7 @@ class PointRead(PointBase):
     category: Optional[str] = None
     description: Optional[str] = None
     photo_path: Optional[str] = None
+    geocode_status: Optional[str] = None  # pending until background enrichment fills the location
 
     class Config:
         from_attributes = True
@@ -1,5 +1,26 @@
-from sqlmodel import Session, select
-from backend.models import User, Point
+"""Fibonacci milestone badges and the engine that awards them.
+
+A user earns a badge per category for every FIBONACCI milestone reached by
+their distinct count in that category. Badges are stored as Achievement rows
+and counted in User.total_badges. sync_achievements runs in the same
+transaction as every stats change (see services/user_stats.py), awarding new
+badges with a notification and revoking those no longer earned.
+
+A revoked badge keeps its row with revoked_at set, e.g. while the user's
+points are hidden after leaving a map. Earning it again clears revoked_at
+without a notification, so leaving and rejoining a map does not notify the
+same badges again. replay_achievements rebuilds them from point history.
+"""
+import json
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlmodel import Session
+from backend.models import Achievement, Notification, Point, User, UserStats
+from backend.services.countries import continent_coverage
+from backend.services.user_stats import KIND_FIELDS, read_user_stats
 
 # Fibonacci sequence for milestones
 FIBONACCI = [1, 2, 3, 5, 8, 13, 21, 34, 55, 89]
@@ -14,6 +35,14 @@ ACHIEVEMENT_TYPES = {
     "continents": "Pioneer"
 }
 
+# Category -> highest count a badge can require (None: the full FIBONACCI list)
+CATEGORY_LIMITS = {
+    "cities": None,
+    "regions": None,
+    "countries": None,
+    "continents": MAX_CONTINENTS,
+}
+
 RANK_NAMES = {
     1: "Traveler",
     2: "Wanderer",
@@ -53,32 +82,156 @@ def get_badges_for_count(count: int, max_limit: int | None = None) -> list:
             })
     return badges
 
+def earned_badges(counts: Dict[str, int]) -> Set[Tuple[str, int]]:
+    """(category, level) pairs earned with the given distinct counts per category."""
+    return {
+        (category, badge["level"])
+        for category, max_limit in CATEGORY_LIMITS.items()
+        for badge in get_badges_for_count(counts.get(category, 0), max_limit)
+    }
+
+def sync_achievements(connection, user_ids: Iterable[int], notify: bool = True) -> int:
+    """Award and revoke badges to match the users' userstats counts. Returns the number awarded.
+
+    Works on a Session or a Connection, inside the caller's transaction.
+    """
+    user_ids = list(user_ids)
+    counts = {
+        row[0]: dict(zip(CATEGORY_LIMITS, row[1:]))
+        for row in connection.execute(
+            select(UserStats.user_id, *[getattr(UserStats, f"unique_{category}") for category in CATEGORY_LIMITS])
+            .where(UserStats.user_id.in_(user_ids))
+        ).all()
+    }
+    held = _held_badges(connection, user_ids)
+    revoked = _held_badges(connection, user_ids, revoked=True)
+
+    awarded = 0
+    now = datetime.utcnow()
+    for user_id in user_ids:
+        earned = earned_badges(counts.get(user_id, {}))
+        _set_revoked(connection, user_id, held[user_id] - earned, now)
+        _set_revoked(connection, user_id, earned & revoked[user_id], None)
+        new = sorted(earned - held[user_id] - revoked[user_id])
+        if new:
+            connection.execute(insert(Achievement), [
+                {"user_id": user_id, "type": category, "level": level, "achieved_at": now}
+                for category, level in new
+            ])
+            if notify:
+                connection.execute(insert(Notification), [_notification(user_id, category, level, now) for category, level in new])
+            awarded += len(new)
+        _set_total_badges(connection, user_id, len(earned))
+    return awarded
+
+def replay_achievements(connection, user_ids: Optional[List[int]] = None) -> int:
+    """Rebuild the users' achievements from their visible points, oldest first.
+
+    Each badge is dated by the point that reached its milestone. Badges no
+    longer earned are kept as revoked. No notifications are sent. Returns the
+    number of badges written.
+    """
+    if user_ids is None:
+        user_ids = list(connection.execute(select(User.id)).scalars())
+    if not user_ids:
+        return 0
+
+    kinds = list(KIND_FIELDS)
+    rows = connection.execute(
+        select(Point.user_id, Point.timestamp, *[getattr(Point, f"{kind}_id") for kind in kinds])
+        .where(Point.user_id.in_(user_ids), Point.hidden_at.is_(None))
+        .order_by(Point.user_id, Point.timestamp, Point.id)
+    ).all()
+
+    seen: Dict[int, Dict[str, set]] = defaultdict(lambda: {category: set() for category in CATEGORY_LIMITS})
+    achieved: Dict[int, Dict[Tuple[str, int], datetime]] = defaultdict(dict)
+    for user_id, timestamp, *place_ids in rows:
+        for kind, place_id in zip(kinds, place_ids):
+            category = KIND_FIELDS[kind]
+            places = seen[user_id][category]
+            if place_id is None or place_id in places:
+                continue
+            places.add(place_id)
+            max_limit = CATEGORY_LIMITS[category]
+            if len(places) in FIBONACCI and (max_limit is None or len(places) <= max_limit):
+                achieved[user_id][(category, len(places))] = timestamp
+
+    held = _held_badges(connection, user_ids)
+    revoked = _held_badges(connection, user_ids, revoked=True)
+    now = datetime.utcnow()
+    written = 0
+    for user_id in user_ids:
+        badges = achieved.get(user_id, {})
+        _set_revoked(connection, user_id, held[user_id] - badges.keys(), now)
+        # Earned badges are written again with their replayed dates
+        rewritten = (held[user_id] | revoked[user_id]) & badges.keys()
+        if rewritten:
+            connection.execute(delete(Achievement).where(_badges_condition(user_id, rewritten)))
+        if badges:
+            connection.execute(insert(Achievement), [
+                {"user_id": user_id, "type": category, "level": level, "achieved_at": achieved_at}
+                for (category, level), achieved_at in sorted(badges.items())
+            ])
+        _set_total_badges(connection, user_id, len(badges))
+        written += len(badges)
+    return written
+
+def _held_badges(connection, user_ids: List[int], revoked: bool = False) -> Dict[int, Set[Tuple[str, int]]]:
+    held = defaultdict(set)
+    for user_id, category, level in connection.execute(
+        select(Achievement.user_id, Achievement.type, Achievement.level).where(
+            Achievement.user_id.in_(user_ids),
+            Achievement.revoked_at.is_not(None) if revoked else Achievement.revoked_at.is_(None),
+        )
+    ).all():
+        held[user_id].add((category, level))
+    return held
+
+def _set_revoked(connection, user_id: int, badges: Set[Tuple[str, int]], revoked_at: Optional[datetime]):
+    """Revoke badges (revoked_at set) or restore revoked ones (None)."""
+    if badges:
+        connection.execute(update(Achievement).where(_badges_condition(user_id, badges)).values(revoked_at=revoked_at))
+
+def _badges_condition(user_id: int, badges: Set[Tuple[str, int]]):
+    return and_(
+        Achievement.user_id == user_id,
+        or_(*[and_(Achievement.type == category, Achievement.level == level) for category, level in badges]),
+    )
+
+def _set_total_badges(connection, user_id: int, total: int):
+    connection.execute(
+        update(User).where(User.id == user_id, User.total_badges != total).values(total_badges=total)
+    )
+
+def _notification(user_id: int, category: str, level: int, now: datetime) -> dict:
+    kind = next(kind for kind, field in KIND_FIELDS.items() if field == category)
+    return {
+        "user_id": user_id,
+        "type": "achievement",
+        "title": f"{ACHIEVEMENT_TYPES[category]} badge: {get_rank_name(level)}",
+        "message": f"You have visited {level} {kind if level == 1 else category}.",
+        "data": json.dumps({"category": category, "level": level}),
+        "read": False,
+        "created_at": now,
+    }
+
 def get_user_stats(session: Session, user_id: int) -> dict:
-    """Get user's geographic statistics with dynamically calculated badges."""
-    points = session.exec(select(Point).where(Point.user_id == user_id, Point.hidden_at == None)).all()
+    """Get user's geographic statistics with their stored badges."""
+    # One primary-key lookup on the materialized userstats row
+    stored = read_user_stats(session, user_id)
+    unique_cities = stored["cities_list"]
+    unique_regions = stored["regions_list"]
+    unique_countries = stored["countries_list"]
+    unique_continents = stored["continents_list"]
     
-    unique_cities = set()
-    unique_regions = set()
-    unique_countries = set()
-    unique_continents = set()
-    
-    for point in points:
-        if point.city:
-            unique_cities.add(point.city)
-        if point.region:
-            unique_regions.add(point.region)
-        if point.country:
-            unique_countries.add(point.country)
-        if point.continent:
-            unique_continents.add(point.continent)
-    
-    # Calculate badges dynamically based on current counts
-    badges_by_category = {
-        "cities": get_badges_for_count(len(unique_cities)),
-        "regions": get_badges_for_count(len(unique_regions)),
-        "countries": get_badges_for_count(len(unique_countries)),
-        "continents": get_badges_for_count(len(unique_continents), MAX_CONTINENTS)  # Limit for continents
-    }
+    # Badges are kept current by sync_achievements on every stats change
+    badges_by_category = {category: [] for category in CATEGORY_LIMITS}
+    for category, level in session.exec(
+        select(Achievement.type, Achievement.level)
+        .where(Achievement.user_id == user_id, Achievement.revoked_at.is_(None))
+        .order_by(Achievement.level)
+    ).all():
+        badges_by_category.setdefault(category, []).append({"level": level, "rank": get_rank_name(level)})
     
     # Calculate total badges as sum of all category badges
     total_badges = sum(len(badges) for badges in badges_by_category.values())
@@ -92,7 +245,7 @@ def get_user_stats(session: Session, user_id: int) -> dict:
     }
     
     return {
-        "total_points": len(points),
+        "total_points": stored["total_points"],
         "unique_cities": len(unique_cities),
         "unique_regions": len(unique_regions),
         "unique_countries": len(unique_countries),
@@ -103,5 +256,7 @@ def get_user_stats(session: Session, user_id: int) -> dict:
         "continents_list": sorted(list(unique_continents)),
         "badges_by_category": badges_by_category,
         "next_milestones": next_milestones,
-        "total_badges": total_badges
+        "total_badges": total_badges,
+        # From the visited country names alone: O(countries visited)
+        "continent_coverage": continent_coverage(unique_countries),
     }
@@ -0,0 +1,109 @@
+"""Analytical reads over the columnar snapshot written by services/analytics_export.py.
+
+Scans run in-process on the Parquet files, away from the transactional
+database, and see the data as of the last export. Points are read from the
+directory named in state.json, which a full export switches atomically.
+Date filters prune the date=YYYY-MM-DD partitions before any file is opened.
+"""
+import os
+from datetime import date
+from typing import List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from backend.core.config import settings
+from backend.services.analytics_export import DATE_PARTITIONING, read_state
+
+# Leaderboard sort order -> user_totals column, as in services/leaderboard.py
+LEADERBOARD_SCORES = {"points": "total_points", "countries": "unique_countries", "continents": "unique_continents"}
+TOTAL_COLUMNS = ["total_points", "unique_cities", "unique_regions", "unique_countries", "unique_continents"]
+
+
+def is_available(directory: Optional[str] = None) -> bool:
+    return read_state(directory or settings.ANALYTICS_DIR)["exported_at"] is not None
+
+
+def points(columns: Optional[List[str]] = None, visible_only: bool = True,
+           since: Optional[date] = None, until: Optional[date] = None,
+           directory: Optional[str] = None) -> pa.Table:
+    """Point rows, optionally only visible ones and within [since, until) by timestamp date."""
+    directory = directory or settings.ANALYTICS_DIR
+    path = os.path.join(directory, read_state(directory)["points_dir"])
+    if not os.path.exists(path):
+        return pa.table({})
+    dataset = ds.dataset(path, format="parquet", partitioning=DATE_PARTITIONING)
+    condition = None
+    for part in (
+        pc.field("hidden_at").is_null() if visible_only else None,
+        pc.field("date") >= since.isoformat() if since else None,
+        pc.field("date") < until.isoformat() if until else None,
+    ):
+        if part is not None:
+            condition = part if condition is None else condition & part
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def user_totals(directory: Optional[str] = None) -> pa.Table:
+    """Visible points and distinct places per user, for every exported user (zeros when none)."""
+    directory = directory or settings.ANALYTICS_DIR
+    users = pq.read_table(os.path.join(directory, "users.parquet"), columns=["id", "username", "total_badges"])
+    users = users.rename_columns(["user_id", "username", "total_badges"])
+    table = points(["id", "user_id", "city_id", "region_id", "country_id", "continent_id"], directory=directory)
+    if table.num_rows == 0:
+        for name in TOTAL_COLUMNS:
+            users = users.append_column(name, pa.array([0] * users.num_rows, pa.int64()))
+        return users
+
+    # (column, function, user_totals column); the output column order varies across pyarrow versions
+    aggregates = [
+        ("id", "count", "total_points"),
+        ("city_id", "count_distinct", "unique_cities"),
+        ("region_id", "count_distinct", "unique_regions"),
+        ("country_id", "count_distinct", "unique_countries"),
+        ("continent_id", "count_distinct", "unique_continents"),
+    ]
+    totals = table.group_by("user_id").aggregate([(column, function) for column, function, _ in aggregates])
+    names = {f"{column}_{function}": name for column, function, name in aggregates}
+    totals = totals.rename_columns([names.get(name, name) for name in totals.column_names])
+    joined = users.join(totals, keys="user_id", join_type="left outer")
+    return pa.table({
+        name: pc.fill_null(joined[name], 0) if name in TOTAL_COLUMNS else joined[name]
+        for name in joined.column_names
+    })
+
+
+def leaderboard(sort_by: str, offset: int, limit: int, directory: Optional[str] = None) -> List[dict]:
+    """Same entries as services.leaderboard.query_leaderboard, computed from the snapshot."""
+    totals = user_totals(directory)
+    score = LEADERBOARD_SCORES[sort_by]
+    totals = totals.append_column("rank", pc.rank(totals[score], sort_keys="descending", tiebreaker="min"))
+    ordered = totals.sort_by([(score, "descending"), ("user_id", "ascending")]).slice(offset, limit)
+    return [
+        {
+            "rank": row["rank"],
+            "user_id": row["user_id"],
+            "username": row["username"],
+            "total_points": row["total_points"],
+            "unique_countries": row["unique_countries"],
+            "unique_continents": row["unique_continents"],
+            "total_badges": row["total_badges"] or 0,
+        }
+        for row in ordered.to_pylist()
+    ]
+
+
+def monthly_points(user_id: Optional[int] = None, directory: Optional[str] = None) -> List[dict]:
+    """Visible points per calendar month, optionally for one user."""
+    table = points(["user_id", "date"], directory=directory)
+    if table.num_rows == 0:
+        return []
+    if user_id is not None:
+        table = table.filter(pc.equal(table["user_id"], user_id))
+    months = pc.utf8_slice_codeunits(table["date"].cast(pa.string()), 0, 7)
+    counts = pa.table({"month": months}).group_by("month").aggregate([("month", "count")])
+    return sorted(
+        ({"month": row["month"], "points": row["month_count"]} for row in counts.to_pylist()),
+        key=lambda entry: entry["month"],
+    )
@@ -0,0 +1,152 @@
+"""Columnar snapshot of points, users and maps for analytical reads (Parquet, via pyarrow).
+
+Layout under ANALYTICS_DIR:
+
+    points-<n>/date=YYYY-MM-DD/part-<first id>-<n>.parquet   points by timestamp date
+    users.parquet, maps.parquet                              rewritten by every export
+    state.json                                               current points-<n>, watermark, export times
+
+Exports are incremental: points with an id above the watermark are appended
+to the current points directory. Points are also edited, hidden and deleted
+in place, which an id watermark does not see, so a full export rewrites them
+when the last one is older than ANALYTICS_FULL_EXPORT_HOURS. It also compacts
+the small incremental files.
+
+A full export writes a new points-<n> directory and switches to it by
+rewriting state.json, so readers never see a missing or half-written
+directory. Incremental exports write into the live directory, under a
+"."-prefixed name that dataset scans skip, and rename each file into place
+once it is complete. The previous directory is kept until the next full export, so
+scans opened before the switch can finish. services/analytics.py reads the
+snapshot.
+"""
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from backend.core.config import settings
+from backend.models import Map, Point, User
+
+POINT_SCHEMA = pa.schema([
+    ("id", pa.int64()), ("map_id", pa.int64()), ("user_id", pa.int64()),
+    ("timestamp", pa.timestamp("us")), ("hidden_at", pa.timestamp("us")),
+    ("city", pa.string()), ("region", pa.string()), ("country", pa.string()), ("continent", pa.string()),
+    ("city_id", pa.int64()), ("region_id", pa.int64()), ("country_id", pa.int64()), ("continent_id", pa.int64()),
+    ("category", pa.string()),
+])
+USER_SCHEMA = pa.schema([
+    ("id", pa.int64()), ("username", pa.string()), ("total_badges", pa.int64()), ("created_at", pa.timestamp("us")),
+])
+MAP_SCHEMA = pa.schema([
+    ("id", pa.int64()), ("name", pa.string()), ("type", pa.string()), ("creator_id", pa.int64()),
+])
+DATE_PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+
+def read_state(directory: str) -> dict:
+    path = os.path.join(directory, "state.json")
+    state = {"points_dir": "points", "generation": 0, "watermark": 0, "full_export_at": None, "exported_at": None}
+    if os.path.exists(path):
+        with open(path) as f:
+            state.update(json.load(f))
+    return state
+
+
+def export_snapshot(engine: Engine, directory: Optional[str] = None, full: bool = False,
+                    batch_size: int = 50000, progress: Callable[[str], None] = print) -> dict:
+    """Append new points (or rewrite all of them when a full export is due) and refresh users and maps."""
+    directory = directory or settings.ANALYTICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    state = read_state(directory)
+    now = datetime.utcnow()
+    if state["full_export_at"] is None or (
+        now - datetime.fromisoformat(state["full_export_at"]) > timedelta(hours=settings.ANALYTICS_FULL_EXPORT_HOURS)
+    ):
+        full = True
+
+    previous = state["points_dir"]
+    if full:
+        # A directory left by a crashed full export is not referenced by state.json yet
+        state["generation"] += 1
+        state["points_dir"] = f"points-{state['generation']}"
+        shutil.rmtree(os.path.join(directory, state["points_dir"]), ignore_errors=True)
+    target = os.path.join(directory, state["points_dir"])
+    watermark = 0 if full else state["watermark"]
+
+    exported = 0
+    with engine.connect() as connection:
+        while True:
+            rows = connection.execute(
+                select(*[getattr(Point, name) for name in POINT_SCHEMA.names])
+                .where(Point.id > watermark)
+                .order_by(Point.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            _write_points(rows, target)
+            watermark = rows[-1].id
+            exported += len(rows)
+            progress(f"Exported {exported} points")
+
+        _write_table(connection.execute(select(*[getattr(User, name) for name in USER_SCHEMA.names])).all(),
+                     USER_SCHEMA, os.path.join(directory, "users.parquet"))
+        _write_table(connection.execute(select(*[getattr(Map, name) for name in MAP_SCHEMA.names])).all(),
+                     MAP_SCHEMA, os.path.join(directory, "maps.parquet"))
+
+    if full:
+        os.makedirs(target, exist_ok=True)
+        state["full_export_at"] = now.isoformat()
+
+    # Saved last; after a crash the next run rewrites the same batches to the same file names
+    state.update(watermark=watermark, exported_at=now.isoformat())
+    _write_json(os.path.join(directory, "state.json"), state)
+    if full:
+        _remove_points_dirs(directory, keep={state["points_dir"], previous})
+    return {"full": full, "points": exported, "watermark": watermark}
+
+
+def _remove_points_dirs(directory: str, keep: set):
+    """Delete points directories of exports before the previous full one, and any left by crashes."""
+    for name in os.listdir(directory):
+        if name.startswith("points") and name not in keep and os.path.isdir(os.path.join(directory, name)):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def _write_points(rows, directory: str):
+    table = pa.Table.from_pylist([dict(row._mapping) for row in rows], schema=POINT_SCHEMA)
+    dates = [row.timestamp.strftime("%Y-%m-%d") for row in rows]
+    table = table.append_column("date", pa.array(dates, pa.string()))
+    written = []
+    ds.write_dataset(
+        table, directory, format="parquet", partitioning=DATE_PARTITIONING,
+        # Named by the batch's first id, so batches never overwrite each other. The
+        # "." prefix hides files from dataset scans until they are complete.
+        basename_template=f".part-{rows[0].id}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        file_visitor=lambda written_file: written.append(written_file.path),
+    )
+    # Incremental batches land in the live directory, so each file appears whole
+    for path in written:
+        folder, name = os.path.split(path)
+        os.replace(path, os.path.join(folder, name[1:]))
+
+
+def _write_table(rows, schema: pa.Schema, path: str):
+    tmp_path = f"{path}.tmp"
+    pq.write_table(pa.Table.from_pylist([dict(row._mapping) for row in rows], schema=schema), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_json(path: str, data: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,202 @@
+"""Recompute every user's stats in one pass over the point table, with NumPy.
+
+The visible points are streamed as (user_id, city_id, region_id, country_id,
+continent_id) integer rows in chunks. Each chunk is reduced to distinct
+(user, place) keys with their point counts and merged into running
+accumulators, so memory grows with the number of distinct user/place pairs
+(the size of userplacecount), not with the number of points. Distinct counts
+and badge levels per user then come from vectorized passes. userplacecount,
+userstats, achievements and User.total_badges are bulk-written in one
+transaction.
+
+Writes made while the job runs may be lost, so run it with writes paused.
+rebuild_user_stats in services/user_stats.py repairs selected users online.
+"""
+import json
+import time
+from itertools import chain
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from sqlalchemy import and_, bindparam, delete, func, insert, or_, select, update
+from sqlalchemy.engine import Engine
+from backend.models import Achievement, Place, Point, User, UserPlaceCount, UserStats
+from backend.services.achievements import CATEGORY_LIMITS, FIBONACCI
+from backend.services.user_stats import KIND_FIELDS
+
+# Keys pack (user_id, place_id) into one int64
+KEY_SHIFT = 32
+PLACE_MASK = (1 << KEY_SHIFT) - 1
+WRITE_BATCH_SIZE = 10000
+
+Counts = Tuple[np.ndarray, np.ndarray]  # (sorted keys, counts)
+
+
+def recompute_all_stats(engine: Engine, chunk_size: int = 200000, progress: Callable[[str], None] = print) -> dict:
+    """Rebuild the stats tables from the point table. Returns row counts and timings."""
+    started = time.monotonic()
+    totals, pairs, rows_read = _read_points(engine, chunk_size, progress)
+    read_seconds = time.monotonic() - started
+
+    with engine.begin() as connection:
+        users = connection.execute(select(User.id, User.total_badges).order_by(User.id)).all()
+        user_ids = np.array([row[0] for row in users], dtype=np.int64)
+        stored_badges = np.array([row[1] or 0 for row in users], dtype=np.int64)
+
+        distinct = {
+            kind: _align(user_ids, *np.unique(pairs[kind][0] >> KEY_SHIFT, return_counts=True)) for kind in KIND_FIELDS
+        }
+        points = _align(user_ids, *totals)
+        levels = {KIND_FIELDS[kind]: _badge_levels(distinct[kind], CATEGORY_LIMITS[KIND_FIELDS[kind]]) for kind in KIND_FIELDS}
+        total_badges = sum(levels.values())
+
+        _write_place_counts(connection, pairs)
+        _write_user_stats(connection, user_ids, points, distinct, pairs)
+        badges_changed = _write_achievements(connection, user_ids, levels)
+        changed = np.nonzero(total_badges != stored_badges)[0]
+        if len(changed):
+            connection.execute(
+                update(User).where(User.id == bindparam("user_id")).values(total_badges=bindparam("total")),
+                [{"user_id": int(user_ids[i]), "total": int(total_badges[i])} for i in changed],
+            )
+
+    seconds = time.monotonic() - started
+    return {
+        "points": rows_read,
+        "users": len(user_ids),
+        "place_counts": sum(len(pairs[kind][0]) for kind in KIND_FIELDS),
+        "achievement_changes": badges_changed,
+        "read_seconds": round(read_seconds, 2),
+        "seconds": round(seconds, 2),
+        "rows_per_second": round(rows_read / read_seconds) if read_seconds else None,
+    }
+
+
+def _read_points(engine: Engine, chunk_size: int, progress) -> Tuple[Counts, Dict[str, Counts], int]:
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    totals = empty
+    pairs = {kind: empty for kind in KIND_FIELDS}
+    rows_read = 0
+    # Missing place ids read as 0; place ids start at 1
+    query = select(Point.user_id, *[func.coalesce(getattr(Point, f"{kind}_id"), 0) for kind in KIND_FIELDS]).where(
+        Point.hidden_at.is_(None), Point.user_id.is_not(None)
+    )
+    width = 1 + len(KIND_FIELDS)
+    with engine.connect() as connection:
+        result = connection.execution_options(yield_per=chunk_size).execute(query)
+        for rows in result.partitions(chunk_size):
+            # fromiter over the flattened values; np.array probes every Row for array attributes
+            chunk = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * width).reshape(-1, width)
+            user_ids = chunk[:, 0]
+            totals = _merge(totals, *np.unique(user_ids, return_counts=True))
+            for column, kind in enumerate(KIND_FIELDS, start=1):
+                place_ids = chunk[:, column]
+                located = place_ids > 0
+                keys = (user_ids[located] << KEY_SHIFT) | place_ids[located]
+                pairs[kind] = _merge(pairs[kind], *np.unique(keys, return_counts=True))
+            rows_read += len(chunk)
+            progress(f"Read {rows_read} points")
+    return totals, pairs, rows_read
+
+
+def _merge(accumulated: Counts, keys: np.ndarray, counts: np.ndarray) -> Counts:
+    all_keys = np.concatenate([accumulated[0], keys])
+    merged, inverse = np.unique(all_keys, return_inverse=True)
+    summed = np.bincount(inverse, weights=np.concatenate([accumulated[1], counts]), minlength=len(merged))
+    return merged, summed.astype(np.int64)
+
+
+def _align(user_ids: np.ndarray, users: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Per-user counts laid out along the sorted user_ids, zero for absent users."""
+    aligned = np.zeros(len(user_ids), dtype=np.int64)
+    known = np.isin(users, user_ids)
+    aligned[np.searchsorted(user_ids, users[known])] = counts[known]
+    return aligned
+
+
+def _badge_levels(counts: np.ndarray, max_limit) -> np.ndarray:
+    """Number of FIBONACCI milestones reached by each count, capped at max_limit."""
+    milestones = np.array([fib for fib in FIBONACCI if max_limit is None or fib <= max_limit], dtype=np.int64)
+    return np.searchsorted(milestones, counts, side="right")
+
+
+def _write_place_counts(connection, pairs: Dict[str, Counts]):
+    connection.execute(delete(UserPlaceCount))
+    for kind, (keys, counts) in pairs.items():
+        user_ids = (keys >> KEY_SHIFT).tolist()
+        place_ids = (keys & PLACE_MASK).tolist()
+        rows = [
+            {"user_id": user_id, "place_id": place_id, "kind": kind, "points": points}
+            for user_id, place_id, points in zip(user_ids, place_ids, counts.tolist())
+        ]
+        for start in range(0, len(rows), WRITE_BATCH_SIZE):
+            connection.execute(insert(UserPlaceCount), rows[start:start + WRITE_BATCH_SIZE])
+
+
+def _write_user_stats(connection, user_ids: np.ndarray, points: np.ndarray, distinct: Dict[str, np.ndarray], pairs: Dict[str, Counts]):
+    names = dict(connection.execute(select(Place.id, Place.name)).all())
+    lists: Dict[str, Dict[int, List[str]]] = {}
+    for kind, (keys, _) in pairs.items():
+        by_user: Dict[int, List[str]] = {}
+        for user_id, place_id in zip((keys >> KEY_SHIFT).tolist(), (keys & PLACE_MASK).tolist()):
+            by_user.setdefault(user_id, []).append(names.get(place_id, ""))
+        lists[kind] = by_user
+
+    now = datetime.utcnow()
+    rows = []
+    for index, user_id in enumerate(user_ids.tolist()):
+        row = {"user_id": user_id, "total_points": int(points[index]), "updated_at": now}
+        for kind, field in KIND_FIELDS.items():
+            row[f"unique_{field}"] = int(distinct[kind][index])
+            row[f"{field}_list"] = json.dumps(sorted(lists[kind].get(user_id, [])))
+        rows.append(row)
+
+    connection.execute(delete(UserStats))
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        connection.execute(insert(UserStats), rows[start:start + WRITE_BATCH_SIZE])
+
+
+def _write_achievements(connection, user_ids: np.ndarray, levels: Dict[str, np.ndarray]) -> int:
+    """Add, revoke and restore Achievement rows where the held badge count differs. Returns rows changed."""
+    held = {category: np.zeros(len(user_ids), dtype=np.int64) for category in levels}
+    for user_id, category, count in connection.execute(
+        select(Achievement.user_id, Achievement.type, func.count())
+        .where(Achievement.revoked_at.is_(None))
+        .group_by(Achievement.user_id, Achievement.type)
+    ).all():
+        index = np.searchsorted(user_ids, user_id)
+        if category in held and index < len(user_ids) and user_ids[index] == user_id:
+            held[category][index] = count
+
+    # Revoked rows are restored rather than added again, as sync_achievements does
+    revoked_badges = set(connection.execute(
+        select(Achievement.user_id, Achievement.type, Achievement.level).where(Achievement.revoked_at.is_not(None))
+    ).all())
+
+    now = datetime.utcnow()
+    added, revoked, restored = [], [], []
+    for category, earned in levels.items():
+        # A user's held badges in a category are always the first N milestones
+        for index in np.nonzero(earned != held[category])[0].tolist():
+            user_id, count = int(user_ids[index]), int(earned[index])
+            revoked.append(and_(
+                Achievement.user_id == user_id, Achievement.type == category, Achievement.revoked_at.is_(None),
+                Achievement.level > (FIBONACCI[count - 1] if count else 0),
+            ))
+            for level in FIBONACCI[int(held[category][index]):count]:
+                if (user_id, category, level) in revoked_badges:
+                    restored.append(and_(
+                        Achievement.user_id == user_id, Achievement.type == category, Achievement.level == level,
+                    ))
+                else:
+                    added.append({"user_id": user_id, "type": category, "level": level, "achieved_at": now})
+
+    for conditions, revoked_at in ((revoked, now), (restored, None)):
+        for start in range(0, len(conditions), 500):
+            connection.execute(
+                update(Achievement).where(or_(*conditions[start:start + 500])).values(revoked_at=revoked_at)
+            )
+    for start in range(0, len(added), WRITE_BATCH_SIZE):
+        connection.execute(insert(Achievement), added[start:start + WRITE_BATCH_SIZE])
+    return len(added) + len(revoked) + len(restored)
@@ -0,0 +1,78 @@
+"""Committed changes of ORM objects, handed to the in-process caches that depend on them.
+
+A cache subscribes with a collect function, called after every flush with
+the flushed objects while their pre-flush state and attribute history are
+still readable, and an apply function. Whatever collect returns is staged on
+the session and passed to apply once the transaction commits; a rolled back
+transaction drops it, a rolled back savepoint leaves the outer transaction's
+staged values alone. Code that knows its changes directly (not from the
+flushed objects) stages them with stage().
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+STAGED_KEY = "change_feed"
+
+# (object, "new" | "dirty" | "deleted") for every object in the flush
+Changes = List[Tuple[object, str]]
+Collect = Callable[[OrmSession, Changes], Optional[Iterable]]
+Apply = Callable[[list], None]
+
+
+class ChangeFeed:
+    def __init__(self):
+        # name -> (collect, apply), in subscription order
+        self._subscribers: Dict[str, Tuple[Optional[Collect], Apply]] = {}
+
+    def subscribe(self, name: str, apply: Apply, collect: Optional[Collect] = None):
+        self._subscribers[name] = (collect, apply)
+
+    def stage(self, session, name: str, items: Iterable):
+        """Queue items for a subscriber's apply, called when the session commits."""
+        # Plain Connections (migrations, CLI) have no caches to keep in sync
+        if isinstance(session, OrmSession):
+            session.info.setdefault(STAGED_KEY, {}).setdefault(name, []).extend(items)
+
+    def _collect(self, session: OrmSession):
+        changes: Changes = [(obj, "new") for obj in session.new]
+        changes += [(obj, "dirty") for obj in session.dirty]
+        changes += [(obj, "deleted") for obj in session.deleted]
+        if not changes:
+            return
+        for name, (collect, _) in self._subscribers.items():
+            if collect is not None:
+                items = collect(session, changes)
+                if items:
+                    self.stage(session, name, items)
+
+    def _apply(self, staged: Dict[str, list]):
+        for name, items in staged.items():
+            try:
+                self._subscribers[name][1](items)
+            except Exception as e:
+                # One failing cache must not keep the others stale
+                print(f"Change feed: {name} failed to apply a commit: {e}")
+
+
+change_feed = ChangeFeed()
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _collect_changes(session, flush_context):
+    # Still the pre-flush state here: new/dirty/deleted and attribute history
+    change_feed._collect(session)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _apply_staged(session):
+    staged = session.info.pop(STAGED_KEY, None)
+    if staged:
+        change_feed._apply(staged)
+
+
+@event.listens_for(OrmSession, "after_soft_rollback")
+def _discard_staged(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(STAGED_KEY, None)
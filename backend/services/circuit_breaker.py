@@ -0,0 +1,83 @@
+"""Circuit breaker for calls to an upstream that may degrade.
+
+closed     calls pass; consecutive failures or slow calls are counted
+open       calls are rejected immediately until reset_seconds have passed
+half_open  up to half_open_probes calls go through as probes; a successful
+           probe closes the circuit, a failed one opens it again
+
+State lives in the process and is only touched from the event loop.
+"""
+import time
+
+
+class CircuitOpenError(Exception):
+    """The circuit is open and the call was not attempted."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, slow_call_seconds: float,
+                 reset_seconds: float, half_open_probes: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+        self.state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self.counters = {"trips": 0, "rejected": 0, "failures": 0, "slow_calls": 0, "probes": 0}
+
+    def before_call(self):
+        """Claim permission for one call or raise CircuitOpenError."""
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            self.state = "half_open"
+            self._probes_in_flight = 0
+
+        if self.state == "half_open":
+            if self._probes_in_flight >= self.half_open_probes:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(f"{self.name} circuit is half-open, probe in flight")
+            self._probes_in_flight += 1
+            self.counters["probes"] += 1
+
+    def record_success(self, duration: float):
+        if duration > self.slow_call_seconds:
+            # Answered, but too slowly to be worth waiting for
+            self.counters["slow_calls"] += 1
+            self._on_failure()
+            return
+        self._consecutive_failures = 0
+        if self.state == "half_open":
+            self.state = "closed"
+            self._probes_in_flight = 0
+
+    def record_failure(self):
+        self.counters["failures"] += 1
+        self._on_failure()
+
+    def release(self):
+        """Give back a probe slot for a call that was cancelled before it finished."""
+        if self.state == "half_open" and self._probes_in_flight:
+            self._probes_in_flight -= 1
+
+    def _on_failure(self):
+        self._consecutive_failures += 1
+        if self.state == "half_open" or self._consecutive_failures >= self.failure_threshold:
+            self._trip()
+
+    def _trip(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._consecutive_failures = 0
+        self._probes_in_flight = 0
+        self.counters["trips"] += 1
+
+    def get_stats(self) -> dict:
+        stats = dict(self.counters)
+        stats["state"] = self.state
+        stats["consecutive_failures"] = self._consecutive_failures
+        return stats
@@ -0,0 +1,239 @@
+"""Server-side point clusters per map and zoom level.
+
+A map's visible points are aggregated into a grid tree: level L holds one
+cluster per Web Mercator tile at zoom L (point count, coordinate sums for the
+centroid, and counts per category), for L from 0 to CELL_ZOOM. The deepest
+level is built from the points; the others are built on first use by merging
+the nearest finer level, so a world view never pays for the city levels.
+A request at zoom z reads level z + GRID_BITS, i.e. a grid of
+2**GRID_BITS x 2**GRID_BITS clusters per displayed tile, so the response size
+depends on the viewport, not on the number of points.
+
+Trees are cached per map. Commits that add, delete, hide, move or
+re-categorize points update the cached tree of their map in place;
+services/change_feed.py delivers the old and new values. Each worker process
+keeps its own cache, so trees also expire after CLUSTER_CACHE_TTL_SECONDS to
+pick up writes made by other processes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlmodel import Session, select
+from backend.core.config import settings
+from backend.models import Point
+from backend.services.change_feed import change_feed
+from backend.services.spatial import CELL_ZOOM, tile_xy
+
+GRID_BITS = 2  # 4x4 clusters per 256 px tile, about 64 px apart
+UNCATEGORIZED = "uncategorized"
+
+# (map_id, latitude, longitude, category, +1 or -1)
+Delta = Tuple[int, float, float, Optional[str], int]
+
+
+class Cluster:
+    __slots__ = ("count", "lat_sum", "lng_sum", "categories")
+
+    def __init__(self):
+        self.count = 0
+        self.lat_sum = 0.0
+        self.lng_sum = 0.0
+        self.categories: Dict[str, int] = {}
+
+    def add(self, count: int, lat_sum: float, lng_sum: float, categories: Dict[str, int]):
+        self.count += count
+        self.lat_sum += lat_sum
+        self.lng_sum += lng_sum
+        for category, n in categories.items():
+            n += self.categories.get(category, 0)
+            if n:
+                self.categories[category] = n
+            else:
+                self.categories.pop(category, None)
+
+
+class ClusterTree:
+    def __init__(self, points: Iterable[Tuple[float, float, Optional[str]]]):
+        # level -> (tile x, tile y) at that zoom -> cluster; levels above
+        # CELL_ZOOM are built on first use from the nearest finer level
+        self.levels: Dict[int, Dict[Tuple[int, int], Cluster]] = {}
+        self.total = 0
+        self.lock = threading.Lock()
+
+        deepest: Dict[Tuple[int, int], Cluster] = {}
+        for lat, lng, category in points:
+            key = tile_xy(lat, lng, CELL_ZOOM)
+            cluster = deepest.get(key)
+            if cluster is None:
+                cluster = deepest[key] = Cluster()
+            cluster.add(1, lat, lng, {category or UNCATEGORIZED: 1})
+            self.total += 1
+        self.levels[CELL_ZOOM] = deepest
+
+    def apply(self, lat: float, lng: float, category: Optional[str], sign: int):
+        """Add (sign 1) or remove (sign -1) one point at every built level."""
+        with self.lock:
+            x, y = tile_xy(lat, lng, CELL_ZOOM)
+            categories = {category or UNCATEGORIZED: sign}
+            for level, tiles in self.levels.items():
+                shift = CELL_ZOOM - level
+                key = (x >> shift, y >> shift)
+                cluster = tiles.get(key)
+                if cluster is None:
+                    cluster = tiles[key] = Cluster()
+                cluster.add(sign, sign * lat, sign * lng, categories)
+                if cluster.count <= 0:
+                    del tiles[key]
+            self.total += sign
+
+    def _level(self, level: int) -> Dict[Tuple[int, int], Cluster]:
+        # Called with self.lock held
+        tiles = self.levels.get(level)
+        if tiles is None:
+            finer = min(built for built in self.levels if built > level)
+            shift = finer - level
+            tiles = {}
+            for (x, y), child in self.levels[finer].items():
+                parent = tiles.get((x >> shift, y >> shift))
+                if parent is None:
+                    parent = tiles[(x >> shift, y >> shift)] = Cluster()
+                parent.add(child.count, child.lat_sum, child.lng_sum, child.categories)
+            self.levels[level] = tiles
+        return tiles
+
+    def clusters(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float, zoom: int) -> dict:
+        """Clusters whose tile intersects the box; min_lng > max_lng means it crosses the antimeridian."""
+        level = max(0, min(zoom + GRID_BITS, CELL_ZOOM))
+        boxes = [(min_lng, max_lng)] if min_lng <= max_lng else [(min_lng, 180.0), (-180.0, max_lng)]
+        found: Dict[Tuple[int, int], Cluster] = {}
+        with self.lock:
+            tiles = self._level(level)
+            for west, east in boxes:
+                # Tile y grows southwards
+                x0, y0 = tile_xy(max_lat, west, level)
+                x1, y1 = tile_xy(min_lat, east, level)
+                if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(tiles):
+                    for x in range(x0, x1 + 1):
+                        for y in range(y0, y1 + 1):
+                            if (x, y) in tiles:
+                                found[(x, y)] = tiles[(x, y)]
+                else:
+                    found.update(
+                        (key, cluster) for key, cluster in tiles.items()
+                        if x0 <= key[0] <= x1 and y0 <= key[1] <= y1
+                    )
+            entries = [
+                {
+                    "latitude": cluster.lat_sum / cluster.count,
+                    "longitude": cluster.lng_sum / cluster.count,
+                    "count": cluster.count,
+                    "categories": dict(cluster.categories),
+                }
+                for cluster in found.values()
+            ]
+            total = self.total
+        return {"zoom": zoom, "level": level, "total_points": total, "clusters": entries}
+
+
+class ClusterCache:
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # map_id -> (expires_at, tree)
+        self._entries: OrderedDict[int, Tuple[float, ClusterTree]] = OrderedDict()
+        # Bumped whenever a map's points change, so a tree built before the change is not stored
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "builds_discarded": 0, "points_applied": 0}
+
+    def tree(self, session: Session, map_id: int) -> ClusterTree:
+        with self._lock:
+            entry = self._entries.get(map_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(map_id)
+                self.counters["hits"] += 1
+                return entry[1]
+            self.counters["misses"] += 1
+            generation = self._generations.get(map_id, 0)
+
+        tree = ClusterTree(session.exec(
+            select(Point.latitude, Point.longitude, Point.category)
+            .where(Point.map_id == map_id, Point.hidden_at.is_(None))
+        ))
+        with self._lock:
+            if self._generations.get(map_id, 0) == generation:
+                self._entries[map_id] = (time.monotonic() + self.ttl_seconds, tree)
+                self._entries.move_to_end(map_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self.counters["builds_discarded"] += 1
+        return tree
+
+    def apply(self, deltas: List[Delta]):
+        with self._lock:
+            trees = {}
+            for map_id in {delta[0] for delta in deltas}:
+                self._generations[map_id] = self._generations.get(map_id, 0) + 1
+                entry = self._entries.get(map_id)
+                if entry is not None:
+                    trees[map_id] = entry[1]
+        for map_id, lat, lng, category, sign in deltas:
+            if map_id in trees:
+                trees[map_id].apply(lat, lng, category, sign)
+                self.counters["points_applied"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._entries)
+            stats["cached_points"] = sum(tree.total for _, tree in self._entries.values())
+        return stats
+
+
+cluster_cache = ClusterCache(
+    max_entries=settings.CLUSTER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.CLUSTER_CACHE_TTL_SECONDS,
+)
+
+
+def _values(point: Point, before: bool) -> Tuple:
+    """(map_id, latitude, longitude, category, hidden_at) before or after the pending flush."""
+    state = inspect(point)
+    values = []
+    for name in ("map_id", "latitude", "longitude", "category", "hidden_at"):
+        history = state.attrs[name].history
+        if before and history.deleted:
+            values.append(history.deleted[0])
+        else:
+            values.append(getattr(point, name))
+    return tuple(values)
+
+
+def _deltas(values: Tuple, sign: int) -> List[Delta]:
+    map_id, lat, lng, category, hidden_at = values
+    if map_id is None or lat is None or lng is None or hidden_at is not None:
+        return []
+    return [(map_id, lat, lng, category, sign)]
+
+
+def _collect_deltas(session, changes) -> List[Delta]:
+    deltas: List[Delta] = []
+    for point, change in changes:
+        if not isinstance(point, Point):
+            continue
+        if change == "new":
+            deltas.extend(_deltas(_values(point, before=False), 1))
+        elif change == "deleted":
+            deltas.extend(_deltas(_values(point, before=True), -1))
+        else:
+            old, new = _values(point, before=True), _values(point, before=False)
+            if old != new:
+                deltas.extend(_deltas(old, -1) + _deltas(new, 1))
+    return deltas
+
+
+change_feed.subscribe("clusters", collect=_collect_deltas, apply=cluster_cache.apply)
@@ -0,0 +1,164 @@
+"""Reference list of countries and territories per continent (ISO 3166-1 plus Kosovo).
+
+Loaded once into read-only lookups. Names follow the English names returned
+by the geocoders; ALIASES covers the other spellings they or older data use.
+Lookups fold case, accents and whitespace.
+
+Transcontinental countries keep the continent the app has always given them
+(Russia and Turkey in Europe, Egypt in Africa).
+"""
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional
+
+from backend.services.text import fold_text
+
+COUNTRIES = {
+    "Europe": (
+        ("AD", "Andorra"), ("AL", "Albania"), ("AT", "Austria"), ("AX", "Åland Islands"),
+        ("BA", "Bosnia and Herzegovina"), ("BE", "Belgium"), ("BG", "Bulgaria"), ("BY", "Belarus"),
+        ("CH", "Switzerland"), ("CY", "Cyprus"), ("CZ", "Czechia"), ("DE", "Germany"),
+        ("DK", "Denmark"), ("EE", "Estonia"), ("ES", "Spain"), ("FI", "Finland"),
+        ("FO", "Faroe Islands"), ("FR", "France"), ("GB", "United Kingdom"), ("GG", "Guernsey"),
+        ("GI", "Gibraltar"), ("GR", "Greece"), ("HR", "Croatia"), ("HU", "Hungary"),
+        ("IE", "Ireland"), ("IM", "Isle of Man"), ("IS", "Iceland"), ("IT", "Italy"),
+        ("JE", "Jersey"), ("LI", "Liechtenstein"), ("LT", "Lithuania"), ("LU", "Luxembourg"),
+        ("LV", "Latvia"), ("MC", "Monaco"), ("MD", "Moldova"), ("ME", "Montenegro"),
+        ("MK", "North Macedonia"), ("MT", "Malta"), ("NL", "Netherlands"), ("NO", "Norway"),
+        ("PL", "Poland"), ("PT", "Portugal"), ("RO", "Romania"), ("RS", "Serbia"),
+        ("RU", "Russia"), ("SE", "Sweden"), ("SI", "Slovenia"), ("SJ", "Svalbard and Jan Mayen"),
+        ("SK", "Slovakia"), ("SM", "San Marino"), ("TR", "Turkey"), ("UA", "Ukraine"),
+        ("VA", "Vatican City"), ("XK", "Kosovo"),
+    ),
+    "Asia": (
+        ("AE", "United Arab Emirates"), ("AF", "Afghanistan"), ("AM", "Armenia"), ("AZ", "Azerbaijan"),
+        ("BD", "Bangladesh"), ("BH", "Bahrain"), ("BN", "Brunei"), ("BT", "Bhutan"),
+        ("CC", "Cocos (Keeling) Islands"), ("CN", "China"), ("CX", "Christmas Island"), ("GE", "Georgia"),
+        ("HK", "Hong Kong"), ("ID", "Indonesia"), ("IL", "Israel"), ("IN", "India"),
+        ("IO", "British Indian Ocean Territory"), ("IQ", "Iraq"), ("IR", "Iran"), ("JO", "Jordan"),
+        ("JP", "Japan"), ("KG", "Kyrgyzstan"), ("KH", "Cambodia"), ("KP", "North Korea"),
+        ("KR", "South Korea"), ("KW", "Kuwait"), ("KZ", "Kazakhstan"), ("LA", "Laos"),
+        ("LB", "Lebanon"), ("LK", "Sri Lanka"), ("MM", "Myanmar"), ("MN", "Mongolia"),
+        ("MO", "Macao"), ("MV", "Maldives"), ("MY", "Malaysia"), ("NP", "Nepal"),
+        ("OM", "Oman"), ("PH", "Philippines"), ("PK", "Pakistan"), ("PS", "Palestine"),
+        ("QA", "Qatar"), ("SA", "Saudi Arabia"), ("SG", "Singapore"), ("SY", "Syria"),
+        ("TH", "Thailand"), ("TJ", "Tajikistan"), ("TL", "Timor-Leste"), ("TM", "Turkmenistan"),
+        ("TW", "Taiwan"), ("UZ", "Uzbekistan"), ("VN", "Vietnam"), ("YE", "Yemen"),
+    ),
+    "Africa": (
+        ("AO", "Angola"), ("BF", "Burkina Faso"), ("BI", "Burundi"), ("BJ", "Benin"),
+        ("BW", "Botswana"), ("CD", "Democratic Republic of the Congo"), ("CF", "Central African Republic"),
+        ("CG", "Republic of the Congo"), ("CI", "Côte d'Ivoire"), ("CM", "Cameroon"), ("CV", "Cape Verde"),
+        ("DJ", "Djibouti"), ("DZ", "Algeria"), ("EG", "Egypt"), ("EH", "Western Sahara"),
+        ("ER", "Eritrea"), ("ET", "Ethiopia"), ("GA", "Gabon"), ("GH", "Ghana"),
+        ("GM", "Gambia"), ("GN", "Guinea"), ("GQ", "Equatorial Guinea"), ("GW", "Guinea-Bissau"),
+        ("KE", "Kenya"), ("KM", "Comoros"), ("LR", "Liberia"), ("LS", "Lesotho"),
+        ("LY", "Libya"), ("MA", "Morocco"), ("MG", "Madagascar"), ("ML", "Mali"),
+        ("MR", "Mauritania"), ("MU", "Mauritius"), ("MW", "Malawi"), ("MZ", "Mozambique"),
+        ("NA", "Namibia"), ("NE", "Niger"), ("NG", "Nigeria"), ("RE", "Réunion"),
+        ("RW", "Rwanda"), ("SC", "Seychelles"), ("SD", "Sudan"), ("SH", "Saint Helena"),
+        ("SL", "Sierra Leone"), ("SN", "Senegal"), ("SO", "Somalia"), ("SS", "South Sudan"),
+        ("ST", "São Tomé and Príncipe"), ("SZ", "Eswatini"), ("TD", "Chad"), ("TG", "Togo"),
+        ("TN", "Tunisia"), ("TZ", "Tanzania"), ("UG", "Uganda"), ("YT", "Mayotte"),
+        ("ZA", "South Africa"), ("ZM", "Zambia"), ("ZW", "Zimbabwe"),
+    ),
+    "North America": (
+        ("AG", "Antigua and Barbuda"), ("AI", "Anguilla"), ("AW", "Aruba"), ("BB", "Barbados"),
+        ("BL", "Saint Barthélemy"), ("BM", "Bermuda"), ("BQ", "Caribbean Netherlands"), ("BS", "Bahamas"),
+        ("BZ", "Belize"), ("CA", "Canada"), ("CR", "Costa Rica"), ("CU", "Cuba"),
+        ("CW", "Curaçao"), ("DM", "Dominica"), ("DO", "Dominican Republic"), ("GD", "Grenada"),
+        ("GL", "Greenland"), ("GP", "Guadeloupe"), ("GT", "Guatemala"), ("HN", "Honduras"),
+        ("HT", "Haiti"), ("JM", "Jamaica"), ("KN", "Saint Kitts and Nevis"), ("KY", "Cayman Islands"),
+        ("LC", "Saint Lucia"), ("MF", "Saint Martin"), ("MQ", "Martinique"), ("MS", "Montserrat"),
+        ("MX", "Mexico"), ("NI", "Nicaragua"), ("PA", "Panama"), ("PM", "Saint Pierre and Miquelon"),
+        ("PR", "Puerto Rico"), ("SV", "El Salvador"), ("SX", "Sint Maarten"), ("TC", "Turks and Caicos Islands"),
+        ("TT", "Trinidad and Tobago"), ("US", "United States"), ("VC", "Saint Vincent and the Grenadines"),
+        ("VG", "British Virgin Islands"), ("VI", "United States Virgin Islands"),
+    ),
+    "South America": (
+        ("AR", "Argentina"), ("BO", "Bolivia"), ("BR", "Brazil"), ("CL", "Chile"),
+        ("CO", "Colombia"), ("EC", "Ecuador"), ("FK", "Falkland Islands"), ("GF", "French Guiana"),
+        ("GY", "Guyana"), ("PE", "Peru"), ("PY", "Paraguay"), ("SR", "Suriname"),
+        ("UY", "Uruguay"), ("VE", "Venezuela"),
+    ),
+    "Oceania": (
+        ("AS", "American Samoa"), ("AU", "Australia"), ("CK", "Cook Islands"), ("FJ", "Fiji"),
+        ("FM", "Micronesia"), ("GU", "Guam"), ("KI", "Kiribati"), ("MH", "Marshall Islands"),
+        ("MP", "Northern Mariana Islands"), ("NC", "New Caledonia"), ("NF", "Norfolk Island"), ("NR", "Nauru"),
+        ("NU", "Niue"), ("NZ", "New Zealand"), ("PF", "French Polynesia"), ("PG", "Papua New Guinea"),
+        ("PN", "Pitcairn Islands"), ("PW", "Palau"), ("SB", "Solomon Islands"), ("TK", "Tokelau"),
+        ("TO", "Tonga"), ("TV", "Tuvalu"), ("UM", "United States Minor Outlying Islands"), ("VU", "Vanuatu"),
+        ("WF", "Wallis and Futuna"), ("WS", "Samoa"),
+    ),
+    "Antarctica": (
+        ("AQ", "Antarctica"), ("BV", "Bouvet Island"), ("GS", "South Georgia and the South Sandwich Islands"),
+        ("HM", "Heard Island and McDonald Islands"), ("TF", "French Southern Territories"),
+    ),
+}
+
+# Other names -> ISO code
+ALIASES = {
+    "Czech Republic": "CZ", "Türkiye": "TR", "Russian Federation": "RU",
+    "United States of America": "US", "USA": "US", "UK": "GB", "Great Britain": "GB",
+    "The Netherlands": "NL", "Holland": "NL", "Macedonia": "MK", "Republic of Moldova": "MD",
+    "Vatican": "VA", "Holy See": "VA", "Republic of Korea": "KR",
+    "Democratic People's Republic of Korea": "KP", "Viet Nam": "VN", "Burma": "MM", "Macau": "MO",
+    "Lao People's Democratic Republic": "LA", "Syrian Arab Republic": "SY", "Islamic Republic of Iran": "IR",
+    "Palestinian Territories": "PS", "Palestinian Territory": "PS", "State of Palestine": "PS",
+    "East Timor": "TL", "Timor Leste": "TL", "Brunei Darussalam": "BN",
+    "Ivory Coast": "CI", "Cabo Verde": "CV", "Swaziland": "SZ", "DR Congo": "CD", "Congo-Kinshasa": "CD",
+    "Congo-Brazzaville": "CG", "Congo": "CG", "The Gambia": "GM", "Sahrawi Arab Democratic Republic": "EH",
+    "Saint Helena, Ascension and Tristan da Cunha": "SH", "United Republic of Tanzania": "TZ",
+    "The Bahamas": "BS", "U.S. Virgin Islands": "VI", "Sint Eustatius and Saba": "BQ",
+    "Falkland Islands (Malvinas)": "FK", "Federated States of Micronesia": "FM", "Pitcairn": "PN",
+}
+
+CONTINENTS = tuple(COUNTRIES)
+
+CONTINENT_BY_CODE: Mapping[str, str] = MappingProxyType({
+    code: continent for continent, countries in COUNTRIES.items() for code, _ in countries
+})
+NAME_BY_CODE: Mapping[str, str] = MappingProxyType({
+    code: name for countries in COUNTRIES.values() for code, name in countries
+})
+COUNTRY_TOTALS: Mapping[str, int] = MappingProxyType({
+    continent: len(countries) for continent, countries in COUNTRIES.items()
+})
+
+_CODE_BY_NAME: Mapping[str, str] = MappingProxyType({
+    **{fold_text(name): code for code, name in NAME_BY_CODE.items()},
+    **{fold_text(name): code for name, code in ALIASES.items()},
+})
+
+
+def country_code(country: str) -> Optional[str]:
+    """ISO code for a country name, alias or code; None when unknown."""
+    folded = fold_text(country)
+    code = _CODE_BY_NAME.get(folded)
+    if code is None and folded.upper() in CONTINENT_BY_CODE:
+        code = folded.upper()
+    return code
+
+
+def continent_of(country: str) -> Optional[str]:
+    code = country_code(country)
+    return CONTINENT_BY_CODE[code] if code else None
+
+
+def continent_coverage(countries: Iterable[str]) -> Dict[str, dict]:
+    """Visited share of each continent's countries, from a set of visited country names.
+
+    Costs one dictionary lookup per visited country.
+    """
+    visited: Dict[str, set] = {continent: set() for continent in CONTINENTS}
+    for country in countries:
+        code = country_code(country)
+        if code:
+            visited[CONTINENT_BY_CODE[code]].add(code)
+    return {
+        continent: {
+            "visited": len(codes),
+            "total": COUNTRY_TOTALS[continent],
+            "percent": round(100 * len(codes) / COUNTRY_TOTALS[continent], 1),
+        }
+        for continent, codes in visited.items()
+    }
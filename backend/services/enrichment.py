@@ -0,0 +1,107 @@
+"""Background geocoding of points committed with geocode_status="pending".
+
+Point ids are queued in-process; on startup any pending rows left over from
+a previous run are queued again. Nominatim calls go through the shared rate
+limiter and single-flight in services.geocoding, and upstream errors are
+retried with exponential backoff.
+"""
+import asyncio
+from typing import List, Optional
+
+from sqlmodel import Session, select
+from backend.core.config import settings
+from backend.database import engine
+from backend.models import Point
+from backend.services.geocoding import GeocodingError, reverse_geocode, apply_location
+from backend.services import user_stats
+
+
+class EnrichmentWorker:
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.counters = {"queued": 0, "resolved": 0, "failed": 0, "retries": 0}
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        # Several consumers so one point's backoff does not stall the queue;
+        # the shared rate limiter still caps upstream calls
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(settings.GEOCODE_WORKER_CONCURRENCY)]
+
+        with Session(engine) as session:
+            pending = session.exec(
+                select(Point.id).where(Point.geocode_status == "pending").order_by(Point.id)
+            ).all()
+        for point_id in pending:
+            self.enqueue(point_id)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def enqueue(self, point_id: int):
+        if self._queue is None:
+            # Worker not running (e.g. CLI); the point is picked up on next startup
+            return
+        self._queue.put_nowait(point_id)
+        self.counters["queued"] += 1
+
+    def get_stats(self) -> dict:
+        stats = dict(self.counters)
+        stats["running"] = any(not task.done() for task in self._tasks)
+        stats["backlog"] = self._queue.qsize() if self._queue else 0
+        return stats
+
+    async def _run(self):
+        while True:
+            point_id = await self._queue.get()
+            try:
+                await self._enrich(point_id)
+            except Exception as e:
+                print(f"Enrichment error for point {point_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _enrich(self, point_id: int):
+        with Session(engine) as session:
+            point = session.get(Point, point_id)
+            if not point or point.geocode_status != "pending":
+                return
+            lat, lng = point.latitude, point.longitude
+
+        geo = None
+        for attempt in range(settings.GEOCODE_MAX_RETRIES + 1):
+            try:
+                geo = await reverse_geocode(lat, lng, raise_errors=True)
+                break
+            except GeocodingError as e:
+                if attempt == settings.GEOCODE_MAX_RETRIES:
+                    print(f"Giving up geocoding point {point_id}: {e}")
+                    break
+                self.counters["retries"] += 1
+                await asyncio.sleep(settings.GEOCODE_RETRY_BASE_SECONDS * 2 ** attempt)
+
+        with Session(engine) as session:
+            point = session.get(Point, point_id)
+            # Skip if the point was deleted, re-geocoded or moved meanwhile
+            if not point or point.geocode_status != "pending":
+                return
+            if (point.latitude, point.longitude) != (lat, lng):
+                self.enqueue(point_id)
+                return
+            before = user_stats.snapshot(point)
+            if geo is None:
+                point.geocode_status = "failed"
+            else:
+                apply_location(point, geo)
+            status = point.geocode_status
+            session.add(point)
+            user_stats.point_updated(session, point, before)
+            session.commit()
+            self.counters[status] += 1
+
+
+enrichment_worker = EnrichmentWorker()
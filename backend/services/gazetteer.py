@@ -0,0 +1,307 @@
+"""Prefix-searchable place-name index built from the local GeoNames city dump.
+
+The index is a single file of sorted, folded name keys: a header, a table of
+record offsets and newline-terminated records. It is memory-mapped read-only,
+so every worker process shares the same pages, and searched with binary
+search on the offset table.
+
+Short prefixes ("s", "sa") match far more records than a query can rank, so
+the file also holds a top table: for every prefix matching more than
+TOP_PLACES records, the indexes of its TOP_PLACES most populous records,
+sorted and searched the same way. A prefix range larger than max_scan is
+answered from it instead of from its first records in alphabetical order.
+"""
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+from backend.services.geodata import data_file, read_admin1_codes, read_cities, read_country_info
+from backend.services.text import fold_text
+
+MAGIC = b"ODYGAZ3\0"
+# magic, records, top table entries, start of the top table after the records
+HEADER = struct.Struct("<8sIII")
+OFFSET = struct.Struct("<I")
+
+TOP_PLACES = 100  # Most populous records kept per prefix that matches more than this
+
+
+@dataclass
+class Place:
+    name: str
+    region: Optional[str]
+    country: Optional[str]
+    country_code: Optional[str]
+    continent: Optional[str]
+    latitude: float
+    longitude: float
+    population: int
+
+    @property
+    def display_name(self) -> str:
+        return ", ".join(part for part in (self.name, self.region, self.country) if part)
+
+
+def _clean(value: Optional[str]) -> str:
+    return (value or "").replace("\t", " ").replace("\n", " ")
+
+
+def build_index(data_dir: str, index_path: str) -> int:
+    """Write the index for data_dir/cities.txt to index_path. Returns the number of keys."""
+    # Imported here to avoid a cycle: geocoding imports this module
+    from backend.services.geocoding import get_continent
+
+    cities = read_cities(os.path.join(data_dir, "cities.txt"))
+    info_path = data_file(data_dir, "countryInfo.txt")
+    country_info = read_country_info(info_path) if info_path else {}
+    codes_path = data_file(data_dir, "admin1Codes.txt")
+    admin1_names = read_admin1_codes(codes_path) if codes_path else {}
+
+    records = []  # (record, population)
+    for city in cities:
+        country, info_continent = country_info.get(city.country_code, (city.country_code or None, None))
+        continent = get_continent(country) if country else "Unknown"
+        if continent == "Unknown" and info_continent:
+            continent = info_continent
+        region = admin1_names.get(f"{city.country_code}.{city.admin1_code}")
+        payload = "\t".join([
+            _clean(city.name), _clean(region), _clean(country), _clean(city.country_code), _clean(continent),
+            f"{city.latitude:.5f}", f"{city.longitude:.5f}", str(city.population),
+        ])
+        # Index under the native and the ASCII spelling when they fold differently
+        for key in {fold_text(city.name), fold_text(city.ascii_name)}:
+            if key:
+                records.append((f"{_clean(key)}\t{payload}\n".encode("utf-8"), city.population))
+
+    # UTF-8 byte order matches code point order, so sorting bytes keeps lookups consistent
+    records.sort()
+    top = [
+        f"{prefix}\t{','.join(map(str, indexes))}\n".encode("utf-8")
+        for prefix, indexes in _top_places(records)
+    ]
+    top.sort()
+
+    directory = os.path.dirname(index_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # A unique temporary file, so concurrent builds never write into each other's
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(index_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            records_size = sum(len(record) for record, _ in records)
+            f.write(HEADER.pack(MAGIC, len(records), len(top), records_size))
+            for section in ([record for record, _ in records], top):
+                position = 0
+                for line in section:
+                    f.write(OFFSET.pack(position))
+                    position += len(line)
+            for record, _ in records:
+                f.write(record)
+            for line in top:
+                f.write(line)
+        os.chmod(tmp_path, 0o644)
+        # Atomic swap so other workers never map a half-written file
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(records)
+
+
+def _top_places(records: list) -> Iterator[tuple]:
+    """(prefix, record indexes by population) for every prefix matching more than TOP_PLACES records."""
+    keys = [record[:record.index(b"\t")].decode("utf-8") for record, _ in records]
+    # Ranges of the previous prefix length that may still hold large ranges
+    ranges = [(0, len(keys))]
+    length = 0
+    while ranges:
+        length += 1
+        larger = []
+        for start, end in ranges:
+            i = start
+            while i < end:
+                prefix = keys[i][:length]
+                j = i
+                while j < end and keys[j][:length] == prefix:
+                    j += 1
+                if j - i > TOP_PLACES and len(prefix) == length:
+                    yield prefix, heapq.nlargest(TOP_PLACES, range(i, j), key=lambda k: records[k][1])
+                    larger.append((i, j))
+                i = j
+        ranges = larger
+
+
+class Gazetteer:
+    def __init__(self):
+        self._mm: Optional[mmap.mmap] = None
+        self._count = 0
+        self._top_count = 0
+        self._data_start = 0
+        self._top_data_start = 0
+        self.max_scan = 1000
+
+    @property
+    def loaded(self) -> bool:
+        return self._mm is not None
+
+    def load(self, data_dir: str, index_path: str, max_scan: int = 1000):
+        """Map the index, rebuilding it first if the city dump is newer or the index format changed."""
+        self.max_scan = max_scan
+        cities_path = data_file(data_dir, "cities.txt")
+        stale = cities_path and (
+            not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(cities_path)
+            or _read_magic(index_path) != MAGIC
+        )
+        if stale:
+            started = time.perf_counter()
+            count = build_index(data_dir, index_path)
+            print(f"Gazetteer: indexed {count} names in {time.perf_counter() - started:.1f}s")
+        if not os.path.exists(index_path):
+            print(f"Gazetteer: no index at {index_path}, local place search disabled")
+            return
+
+        with open(index_path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = mm[:len(MAGIC)]
+        if magic != MAGIC:
+            mm.close()
+            print(f"Gazetteer: {index_path} is not a gazetteer index")
+            return
+
+        _, count, top_count, records_size = HEADER.unpack_from(mm, 0)
+        self.close()
+        self._mm = mm
+        self._count = count
+        self._top_count = top_count
+        self._data_start = HEADER.size + (count + top_count) * OFFSET.size
+        self._top_data_start = self._data_start + records_size
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+            self._count = 0
+            self._top_count = 0
+
+    def _record_start(self, i: int) -> int:
+        return self._data_start + OFFSET.unpack_from(self._mm, HEADER.size + i * OFFSET.size)[0]
+
+    def _top_start(self, i: int) -> int:
+        position = HEADER.size + (self._count + i) * OFFSET.size
+        return self._top_data_start + OFFSET.unpack_from(self._mm, position)[0]
+
+    def _key_at(self, i: int) -> bytes:
+        start = self._record_start(i)
+        return self._mm[start:self._mm.find(b"\t", start)]
+
+    def _top_key_at(self, i: int) -> bytes:
+        start = self._top_start(i)
+        return self._mm[start:self._mm.find(b"\t", start)]
+
+    def _place_at(self, i: int) -> Place:
+        start = self._record_start(i)
+        line = self._mm[start:self._mm.find(b"\n", start)].decode("utf-8")
+        _, name, region, country, country_code, continent, lat, lon, population = line.split("\t")
+        return Place(
+            name=name,
+            region=region or None,
+            country=country or None,
+            country_code=country_code or None,
+            continent=continent or None,
+            latitude=float(lat),
+            longitude=float(lon),
+            population=int(population),
+        )
+
+    def _lower_bound(self, key: bytes, top: bool = False) -> int:
+        key_at = self._top_key_at if top else self._key_at
+        lo, hi = 0, self._top_count if top else self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _top_places(self, key: bytes) -> List[int]:
+        """Indexes of the most populous records under a prefix, if it has a top table entry."""
+        i = self._lower_bound(key, top=True)
+        if i == self._top_count or self._top_key_at(i) != key:
+            return []
+        start = self._mm.find(b"\t", self._top_start(i)) + 1
+        return [int(index) for index in self._mm[start:self._mm.find(b"\n", start)].split(b",")]
+
+    def search(self, query: str, limit: int = 5) -> List[Place]:
+        """
+        Places whose name starts with the query, most populous first.
+        Text after a comma filters on region, country or ISO code ("paris, us").
+        """
+        if not self.loaded:
+            return []
+        name_part, _, qualifier = query.partition(",")
+        prefix = fold_text(name_part)
+        qualifier = fold_text(qualifier)
+        if not prefix:
+            return []
+
+        key = prefix.encode("utf-8")
+        start = self._lower_bound(key)
+        # No UTF-8 text contains 0xff, so this is the end of the prefix's range
+        end = self._lower_bound(key + b"\xff")
+        if end - start <= self.max_scan:
+            indexes = range(start, end)
+        else:
+            # Exact matches sort first in the range; the rest comes from the top table
+            exact = start
+            while exact < min(end, start + self.max_scan) and self._key_at(exact) == key:
+                exact += 1
+            # Without an entry (max_scan below TOP_PLACES) fall back to the first records
+            top = self._top_places(key) or range(start, start + self.max_scan)
+            indexes = {*range(start, exact), *top}
+            if qualifier:
+                # The most populous places may all be elsewhere; rank the first records too
+                indexes.update(range(start, start + self.max_scan))
+
+        candidates = []
+        for i in indexes:
+            record_key = self._key_at(i)
+            place = self._place_at(i)
+            if not qualifier or qualifier == fold_text(place.country_code or "") or any(
+                fold_text(part or "").startswith(qualifier) for part in (place.region, place.country)
+            ):
+                # Exact name matches rank above longer names sharing the prefix
+                candidates.append((record_key == key, place.population, i, place))
+
+        results = []
+        seen = set()
+        for _, _, _, place in heapq.nlargest(limit * 2, candidates):
+            identity = (place.name, place.country, place.latitude, place.longitude)
+            if identity in seen:
+                continue
+            seen.add(identity)
+            results.append(place)
+            if len(results) == limit:
+                break
+        return results
+
+    def lookup(self, name: str) -> Optional[Place]:
+        """The most populous place with exactly this (folded) name."""
+        for place in self.search(name, limit=5):
+            if fold_text(place.name) == fold_text(name.partition(",")[0]):
+                return place
+        return None
+
+
+def _read_magic(path: str) -> Optional[bytes]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC))
+
+
+gazetteer = Gazetteer()
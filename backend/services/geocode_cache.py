@@ -0,0 +1,153 @@
+"""Reverse geocoding cache keyed by quantized coordinates.
+
+Lookups go through an in-process LRU first, then the geocodecacheentry table.
+Only a miss on both levels reaches Nominatim.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import delete
+from sqlmodel import Session, select, func
+from backend.core.config import settings
+from backend.database import engine
+from backend.models import GeocodeCacheEntry
+
+GEO_FIELDS = ("city", "region", "country", "country_code", "continent")
+
+# Run the DB eviction pass every N stores instead of on every write
+DB_EVICTION_INTERVAL = 100
+
+
+def cell_key(lat: float, lng: float, cell_degrees: float | None = None) -> str:
+    """Snap coordinates to a grid cell and return its cache key."""
+    size = cell_degrees or settings.GEOCODE_CACHE_CELL_DEGREES
+    return f"{size:g}:{math.floor(lat / size)}:{math.floor(lng / size)}"
+
+
+class GeocodeCache:
+    def __init__(self, max_entries: int, ttl_seconds: int, db_max_rows: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_max_rows = db_max_rows
+        self._memory: OrderedDict[str, tuple[float, Dict[str, Optional[str]]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stores_since_eviction = 0
+        self.counters = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "db_evictions": 0,
+        }
+
+    def get(self, lat: float, lng: float) -> Optional[Dict[str, Optional[str]]]:
+        key = cell_key(lat, lng)
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                expires_at, result = entry
+                if expires_at > time.monotonic():
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return dict(result)
+                del self._memory[key]
+
+        result = self._get_from_db(key)
+        if result is not None:
+            self._remember(key, result)
+            with self._lock:
+                self.counters["db_hits"] += 1
+            return dict(result)
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def set(self, lat: float, lng: float, result: Dict[str, Optional[str]]):
+        key = cell_key(lat, lng)
+        values = {field: result.get(field) for field in GEO_FIELDS}
+        self._remember(key, values)
+        self._store_in_db(key, values)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["db_hits"]) / lookups, 4) if lookups else None
+        stats["cell_degrees"] = settings.GEOCODE_CACHE_CELL_DEGREES
+        return stats
+
+    def _remember(self, key: str, values: Dict[str, Optional[str]]):
+        with self._lock:
+            self._memory[key] = (time.monotonic() + self.ttl_seconds, values)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.counters["memory_evictions"] += 1
+
+    def _get_from_db(self, key: str) -> Optional[Dict[str, Optional[str]]]:
+        try:
+            with Session(engine) as session:
+                entry = session.get(GeocodeCacheEntry, key)
+                if not entry:
+                    return None
+                if entry.created_at < datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+                    return None
+                return {field: getattr(entry, field) for field in GEO_FIELDS}
+        except Exception as e:
+            print(f"Geocode cache read error: {e}")
+            return None
+
+    def _store_in_db(self, key: str, values: Dict[str, Optional[str]]):
+        try:
+            with Session(engine) as session:
+                session.merge(GeocodeCacheEntry(cell=key, created_at=datetime.utcnow(), **values))
+                session.commit()
+
+                with self._lock:
+                    self.counters["stores"] += 1
+                    self._stores_since_eviction += 1
+                    run_eviction = self._stores_since_eviction >= DB_EVICTION_INTERVAL
+                    if run_eviction:
+                        self._stores_since_eviction = 0
+
+                if run_eviction:
+                    self._evict_db(session)
+        except Exception as e:
+            # Another worker may have stored the same cell concurrently
+            print(f"Geocode cache write error: {e}")
+
+    def _evict_db(self, session: Session):
+        """Drop expired rows, then the oldest rows beyond the size bound."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        expired = session.execute(delete(GeocodeCacheEntry).where(GeocodeCacheEntry.created_at < cutoff))
+        evicted = expired.rowcount or 0
+
+        total = session.exec(select(func.count()).select_from(GeocodeCacheEntry)).one()
+        excess = total - self.db_max_rows
+        if excess > 0:
+            oldest = select(GeocodeCacheEntry.cell).order_by(GeocodeCacheEntry.created_at.asc()).limit(excess)
+            result = session.execute(delete(GeocodeCacheEntry).where(GeocodeCacheEntry.cell.in_(oldest)))
+            evicted += result.rowcount or 0
+
+        session.commit()
+        with self._lock:
+            self.counters["db_evictions"] += evicted
+
+
+geocode_cache = GeocodeCache(
+    max_entries=settings.GEOCODE_CACHE_MEMORY_SIZE,
+    ttl_seconds=settings.GEOCODE_CACHE_TTL_SECONDS,
+    db_max_rows=settings.GEOCODE_CACHE_DB_MAX_ROWS,
+)
@@ -0,0 +1,349 @@
+"""Geocoder backends behind one interface, plus a failover/hedging composite.
+
+A provider answers reverse, forward and search queries. None (or an empty
+list) means "no answer here, ask the next provider"; GeocodingError means the
+backend failed. The composite tries providers in GEOCODER_PROVIDERS order,
+fails over on errors and, once a provider has a latency history, starts the
+next one when a call runs past that provider's GEOCODER_HEDGE_PERCENTILE.
+Remote providers sit behind a circuit breaker, so while an upstream is down
+the chain skips it instead of waiting for its timeout.
+"""
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional
+
+from backend.core.config import settings
+from backend.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from backend.services.gazetteer import gazetteer
+from backend.services.http_client import http_clients
+from backend.services.offline_geocoder import offline_geocoder
+from backend.services.rate_limit import AsyncRateLimiter
+
+Location = Dict[str, Optional[str]]
+
+# Shared by every public Nominatim call in this process to honour the usage policy
+nominatim_limiter = AsyncRateLimiter(settings.NOMINATIM_MAX_REQUESTS_PER_SECOND)
+
+# Latencies kept per provider for the hedging percentile
+LATENCY_WINDOW = 200
+
+
+class GeocodingError(Exception):
+    """The geocoding upstream could not be reached or answered with an error."""
+
+
+@dataclass
+class GeocodeMatch:
+    display_name: str
+    latitude: float
+    longitude: float
+    location: Location  # city, region, country, country_code, continent
+    provider: str = ""  # Name of the provider that answered
+
+
+class GeocoderProvider:
+    name = "base"
+
+    def __init__(self):
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"calls": 0, "answers": 0, "errors": 0}
+        self.breaker: Optional[CircuitBreaker] = None
+
+    async def acquire(self):
+        """Wait for this provider's turn to call its upstream; a no-op unless it is rate limited."""
+
+    async def reverse(self, lat: float, lng: float) -> Optional[Location]:
+        return None
+
+    async def forward(self, query: str) -> Optional[GeocodeMatch]:
+        matches = await self.search(query, limit=1)
+        return matches[0] if matches else None
+
+    async def search(self, query: str, limit: int = 5) -> List[GeocodeMatch]:
+        return []
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        if len(self.latencies) < settings.GEOCODER_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    def get_stats(self) -> dict:
+        stats = dict(self.counters)
+        for label, percentile in (("p50_ms", 0.5), ("p95_ms", 0.95)):
+            ordered = sorted(self.latencies)
+            stats[label] = round(ordered[int(percentile * (len(ordered) - 1))] * 1000, 1) if ordered else None
+        if self.breaker:
+            stats["breaker"] = self.breaker.get_stats()
+        return stats
+
+
+class LocalProvider(GeocoderProvider):
+    """Offline boundary index for reverse lookups, gazetteer for names. Never touches the network."""
+    name = "local"
+
+    async def reverse(self, lat: float, lng: float) -> Optional[Location]:
+        return offline_geocoder.lookup(lat, lng)
+
+    async def forward(self, query: str) -> Optional[GeocodeMatch]:
+        place = gazetteer.lookup(query)
+        return _match_from_place(place) if place else None
+
+    async def search(self, query: str, limit: int = 5) -> List[GeocodeMatch]:
+        return [_match_from_place(place) for place in gazetteer.search(query, limit=limit)]
+
+
+def _match_from_place(place) -> GeocodeMatch:
+    return GeocodeMatch(
+        display_name=place.display_name,
+        latitude=place.latitude,
+        longitude=place.longitude,
+        location={
+            "city": place.name,
+            "region": place.region,
+            "country": place.country,
+            "country_code": place.country_code,
+            "continent": place.continent or "Unknown",
+        },
+        provider=LocalProvider.name,
+    )
+
+
+class NominatimProvider(GeocoderProvider):
+    """Nominatim's /reverse and /search API, or anything that speaks it."""
+
+    def __init__(self, name: str, base_url: str, client_name: str, limiter: Optional[AsyncRateLimiter] = None):
+        super().__init__()
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.client_name = client_name
+        self.limiter = limiter
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=settings.GEOCODER_BREAKER_FAILURE_THRESHOLD,
+            slow_call_seconds=settings.GEOCODER_BREAKER_SLOW_CALL_SECONDS,
+            reset_seconds=settings.GEOCODER_BREAKER_RESET_SECONDS,
+            half_open_probes=settings.GEOCODER_BREAKER_HALF_OPEN_PROBES,
+        )
+
+    async def acquire(self):
+        if self.limiter:
+            await self.limiter.acquire()
+
+    async def reverse(self, lat: float, lng: float) -> Optional[Location]:
+        data = await self._get("/reverse", {"lat": lat, "lon": lng})
+        return _location_from_address(data.get("address", {}))
+
+    async def forward(self, query: str) -> Optional[GeocodeMatch]:
+        match = await super().forward(query)
+        if match and not match.location["city"]:
+            # Nominatim may match a district or landmark; keep the name the user asked for
+            match.location["city"] = query
+        return match
+
+    async def search(self, query: str, limit: int = 5) -> List[GeocodeMatch]:
+        data = await self._get("/search", {"q": query, "limit": limit})
+        try:
+            return [
+                GeocodeMatch(
+                    display_name=item.get("display_name", ""),
+                    latitude=float(item["lat"]),
+                    longitude=float(item["lon"]),
+                    location=_location_from_address(item.get("address", {})),
+                    provider=self.name,
+                )
+                for item in data
+            ]
+        except (KeyError, TypeError, ValueError) as e:
+            raise GeocodingError(f"Invalid {self.name} response: {e}") from e
+
+    async def _get(self, path: str, params: dict):
+        try:
+            client = http_clients.get(self.client_name)
+            response = await client.get(
+                f"{self.base_url}{path}",
+                params={**params, "format": "json", "addressdetails": 1, "accept-language": "en"},
+            )
+        except Exception as e:
+            raise GeocodingError(str(e) or type(e).__name__) from e
+
+        if response.status_code != 200:
+            raise GeocodingError(f"{self.name} returned HTTP {response.status_code}")
+        try:
+            return response.json()
+        except ValueError as e:
+            raise GeocodingError(f"Invalid {self.name} response: {e}") from e
+
+
+def _location_from_address(address: dict) -> Location:
+    # Imported here to avoid a cycle: geocoding imports this module
+    from backend.services.geocoding import get_continent
+
+    country = address.get("country")
+    return {
+        "city": (
+            address.get("city") or
+            address.get("town") or
+            address.get("village") or
+            address.get("municipality") or
+            address.get("county")
+        ),
+        "region": address.get("state") or address.get("region"),
+        "country": country,
+        "country_code": (address.get("country_code") or "").upper() or None,
+        "continent": get_continent(country) if country else None,
+    }
+
+
+class FailoverProvider(GeocoderProvider):
+    """Ask providers in order; fail over on errors and hedge slow calls."""
+    name = "failover"
+
+    def __init__(self, providers: List[GeocoderProvider]):
+        super().__init__()
+        self.providers = providers
+        self.counters.update({"failovers": 0, "hedges": 0, "hedge_wins": 0})
+
+    async def reverse(self, lat: float, lng: float) -> Optional[Location]:
+        return await self._first_answer(lambda provider: provider.reverse(lat, lng))
+
+    async def forward(self, query: str) -> Optional[GeocodeMatch]:
+        return await self._first_answer(lambda provider: provider.forward(query))
+
+    async def search(self, query: str, limit: int = 5) -> List[GeocodeMatch]:
+        return await self._first_answer(lambda provider: provider.search(query, limit)) or []
+
+    async def _first_answer(self, call: Callable):
+        self.counters["calls"] += 1
+        started = time.perf_counter()
+        running: Dict[asyncio.Task, int] = {}
+        errors = []
+        hedged = set()
+        next_index = 0
+        hedge_at = None
+
+        def launch(hedge: bool = False):
+            nonlocal next_index, hedge_at
+            provider = self.providers[next_index]
+            running[asyncio.create_task(_timed(provider, call))] = next_index
+            if hedge:
+                hedged.add(next_index)
+            next_index += 1
+            delay = _hedge_delay(provider)
+            hedge_at = time.perf_counter() + delay if delay is not None else None
+
+        launch()
+        try:
+            while running:
+                can_hedge = hedge_at is not None and next_index < len(self.providers)
+                timeout = max(0.0, hedge_at - time.perf_counter()) if can_hedge else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.counters["hedges"] += 1
+                    launch(hedge=True)
+                    continue
+
+                for task in done:
+                    index = running.pop(task)
+                    try:
+                        answer = task.result()
+                    except GeocodingError as e:
+                        errors.append(f"{self.providers[index].name}: {e}")
+                        continue
+                    if answer:
+                        if index in hedged:
+                            self.counters["hedge_wins"] += 1
+                        self.counters["answers"] += 1
+                        self.latencies.append(time.perf_counter() - started)
+                        return answer
+
+                if not running and next_index < len(self.providers):
+                    if errors:
+                        self.counters["failovers"] += 1
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+
+        if errors:
+            self.counters["errors"] += 1
+            raise GeocodingError("; ".join(errors))
+        return None
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        stats["providers"] = {provider.name: provider.get_stats() for provider in self.providers}
+        return stats
+
+
+def _hedge_delay(provider: GeocoderProvider) -> Optional[float]:
+    if settings.GEOCODER_HEDGE_PERCENTILE <= 0:
+        return None
+    threshold = provider.latency_percentile(settings.GEOCODER_HEDGE_PERCENTILE)
+    if threshold is None:
+        return None
+    return max(threshold, settings.GEOCODER_HEDGE_MIN_DELAY_SECONDS)
+
+
+async def _timed(provider: GeocoderProvider, call: Callable):
+    breaker = provider.breaker
+    if breaker:
+        try:
+            breaker.before_call()
+        except CircuitOpenError as e:
+            # Fail over without waiting on an upstream known to be down
+            raise GeocodingError(str(e)) from e
+
+    # Queueing for a rate-limit slot is not upstream latency: it must not
+    # count as a slow call for the breaker or feed the hedging percentile
+    try:
+        await provider.acquire()
+    except asyncio.CancelledError:
+        # Lost a hedge race while queued; give back a claimed probe slot
+        if breaker:
+            breaker.release()
+        raise
+
+    provider.counters["calls"] += 1
+    started = time.perf_counter()
+    try:
+        answer = await call(provider)
+    except GeocodingError:
+        provider.counters["errors"] += 1
+        if breaker:
+            breaker.record_failure()
+        raise
+    except asyncio.CancelledError:
+        # Lost a hedge race; neither a success nor a failure of the upstream
+        if breaker:
+            breaker.release()
+        raise
+    if breaker:
+        breaker.record_success(time.perf_counter() - started)
+    # Only answered calls feed the percentile; local misses return in microseconds
+    if answer:
+        provider.counters["answers"] += 1
+        provider.latencies.append(time.perf_counter() - started)
+    return answer
+
+
+PROVIDERS: Dict[str, Callable[[], GeocoderProvider]] = {
+    "local": LocalProvider,
+    "nominatim": lambda: NominatimProvider("nominatim", settings.NOMINATIM_BASE_URL, "nominatim", nominatim_limiter),
+    "stub": lambda: NominatimProvider("stub", settings.STUB_GEOCODER_URL, "stub"),
+}
+
+
+def build_geocoder(names: str) -> GeocoderProvider:
+    """Composite provider for a comma-separated list of registered provider names."""
+    providers = []
+    for name in (part.strip() for part in names.split(",")):
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown geocoder provider {name!r}, expected one of {', '.join(PROVIDERS)}")
+        providers.append(PROVIDERS[name]())
+    return FailoverProvider(providers)
+
+
+geocoder = build_geocoder(settings.GEOCODER_PROVIDERS)
@@ -1,135 +1,136 @@
-import httpx
+import asyncio
 from typing import Optional, Dict, Tuple
+from backend.core.config import settings
+from backend.services.countries import continent_of
+from backend.services.geocode_cache import geocode_cache, cell_key
+from backend.services.geocoder_providers import GeocodingError, geocoder
+from backend.services.offline_geocoder import offline_geocoder
+from backend.services.places import place_directory
+from backend.services.query_cache import forward_cache
+from backend.services.singleflight import SingleFlight
 
-NOMINATIM_REVERSE_URL = "https://nominatim.openstreetmap.org/reverse"
-NOMINATIM_SEARCH_URL = "https://nominatim.openstreetmap.org/search"
+# Concurrent lookups for the same cache cell share one upstream request
+reverse_flights = SingleFlight()
 
-# Mapping of countries to continents
-CONTINENT_MAP = {
-    # Europe
-    "Italy": "Europe", "Germany": "Europe", "France": "Europe", "Spain": "Europe",
-    "United Kingdom": "Europe", "Poland": "Europe", "Netherlands": "Europe",
-    "Belgium": "Europe", "Greece": "Europe", "Portugal": "Europe", "Sweden": "Europe",
-    "Austria": "Europe", "Switzerland": "Europe", "Ireland": "Europe", "Norway": "Europe",
-    "Denmark": "Europe", "Finland": "Europe", "Czech Republic": "Europe", "Czechia": "Europe",
-    "Hungary": "Europe", "Romania": "Europe", "Croatia": "Europe", "Slovenia": "Europe",
-    "Slovakia": "Europe", "Bulgaria": "Europe", "Serbia": "Europe", "Ukraine": "Europe",
-    "Russia": "Europe", "Turkey": "Europe", "Iceland": "Europe", "Luxembourg": "Europe",
-    # Americas
-    "United States": "North America", "Canada": "North America", "Mexico": "North America",
-    "Brazil": "South America", "Argentina": "South America", "Chile": "South America",
-    "Colombia": "South America", "Peru": "South America", "Venezuela": "South America",
-    "Ecuador": "South America", "Bolivia": "South America", "Uruguay": "South America",
-    "Costa Rica": "North America", "Panama": "North America", "Cuba": "North America",
-    # Asia
-    "China": "Asia", "Japan": "Asia", "South Korea": "Asia", "India": "Asia",
-    "Thailand": "Asia", "Vietnam": "Asia", "Indonesia": "Asia", "Philippines": "Asia",
-    "Singapore": "Asia", "Malaysia": "Asia", "Taiwan": "Asia", "Hong Kong": "Asia",
-    "United Arab Emirates": "Asia", "Saudi Arabia": "Asia", "Israel": "Asia",
-    "Nepal": "Asia", "Sri Lanka": "Asia", "Cambodia": "Asia", "Myanmar": "Asia",
-    # Africa
-    "Egypt": "Africa", "South Africa": "Africa", "Morocco": "Africa", "Kenya": "Africa",
-    "Nigeria": "Africa", "Tunisia": "Africa", "Ethiopia": "Africa", "Tanzania": "Africa",
-    "Ghana": "Africa", "Senegal": "Africa", "Uganda": "Africa", "Zimbabwe": "Africa",
-    # Oceania
-    "Australia": "Oceania", "New Zealand": "Oceania", "Fiji": "Oceania",
-}
+# How add_point/update_point got their locations
+write_path_counters = {"local": 0, "inline": 0, "deferred": 0, "degraded": 0, "over_budget": 0}
 
 def get_continent(country: str) -> str:
-    return CONTINENT_MAP.get(country, "Unknown")
+    return continent_of(country) or "Unknown"
 
-async def reverse_geocode(lat: float, lng: float) -> Dict[str, Optional[str]]:
+def empty_location() -> Dict[str, Optional[str]]:
+    return {"city": None, "region": None, "country": None, "country_code": None, "continent": None}
+
+def geocode_status_for(geo: Dict[str, Optional[str]]) -> str:
+    return "resolved" if geo.get("country") else "failed"
+
+def apply_location(point, geo: Dict[str, Optional[str]]):
+    """Copy geocoder output and its place ids onto a Point and mark it resolved or failed."""
+    point.city = geo.get("city")
+    point.region = geo.get("region")
+    point.country = geo.get("country")
+    point.continent = geo.get("continent")
+    point.geocode_status = geocode_status_for(geo)
+    for kind, place_id in place_directory.resolve(geo).items():
+        setattr(point, f"{kind}_id", place_id)
+
+def lookup_local(lat: float, lng: float) -> Optional[Dict[str, Optional[str]]]:
+    """Resolve coordinates from the offline index or the cache, without any network call."""
+    if settings.GEOCODER_MODE == "offline":
+        offline = offline_geocoder.lookup(lat, lng)
+        if offline:
+            return offline
+    return geocode_cache.get(lat, lng)
+
+async def reverse_geocode(lat: float, lng: float, raise_errors: bool = False) -> Dict[str, Optional[str]]:
     """
-    Call Nominatim API to get location details from coordinates.
-    Returns dict with city, region, country, continent.
+    Get location details from coordinates, using the offline resolver and
+    the grid-cell cache when possible.
+    Returns dict with city, region, country, country_code, continent.
+    Upstream failures return all-None fields unless raise_errors is set.
     """
-    result = {"city": None, "region": None, "country": None, "continent": None}
+    local = lookup_local(lat, lng)
+    if local is not None:
+        return local
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                NOMINATIM_REVERSE_URL,
-                params={
-                    "lat": lat,
-                    "lon": lng,
-                    "format": "json",
-                    "addressdetails": 1,
-                    "accept-language": "en",
-                },
-                headers={"User-Agent": "Odyssey/1.0"},
-                timeout=5.0
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                address = data.get("address", {})
-                
-                result["city"] = (
-                    address.get("city") or 
-                    address.get("town") or 
-                    address.get("village") or 
-                    address.get("municipality") or
-                    address.get("county")
-                )
-                
-                result["region"] = address.get("state") or address.get("region")
-                result["country"] = address.get("country")
-                
-                if result["country"]:
-                    result["continent"] = get_continent(result["country"])
-                    
-    except Exception as e:
+        return await reverse_flights.do(cell_key(lat, lng), lambda: _fetch_and_cache(lat, lng))
+    except GeocodingError as e:
+        if raise_errors:
+            raise
         print(f"Geocoding error: {e}")
+        return empty_location()
+
+async def geocode_for_write(lat: float, lng: float) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Location for a point being added or moved, within the write latency budget.
+    Returns None when the point should be committed as pending and enriched
+    in the background: always in GEOCODE_ASYNC mode on a local miss, otherwise
+    when the providers fail, their circuits are open or the budget runs out.
+    """
+    local = lookup_local(lat, lng)
+    if local is not None:
+        write_path_counters["local"] += 1
+        return local
+    if settings.GEOCODE_ASYNC:
+        write_path_counters["deferred"] += 1
+        return None
+    
+    # Shielded so a lookup that outlives the budget still finishes and fills
+    # the cache for the enrichment worker
+    lookup = asyncio.ensure_future(reverse_geocode(lat, lng, raise_errors=True))
+    lookup.add_done_callback(_discard_result)
+    try:
+        geo = await asyncio.wait_for(asyncio.shield(lookup), settings.GEOCODE_WRITE_BUDGET_SECONDS)
+    except asyncio.TimeoutError:
+        write_path_counters["over_budget"] += 1
+        return None
+    except GeocodingError as e:
+        print(f"Geocoding error, deferring to background enrichment: {e}")
+        write_path_counters["degraded"] += 1
+        return None
+    write_path_counters["inline"] += 1
+    return geo
+
+def _discard_result(task: asyncio.Future):
+    # Mark errors of abandoned lookups as retrieved so they are not logged as unhandled
+    if not task.cancelled():
+        task.exception()
+
+async def _fetch_and_cache(lat: float, lng: float) -> Dict[str, Optional[str]]:
+    result = await _fetch_reverse(lat, lng)
+    
+    # Empty answers are not cached so the next point in the cell retries
+    if result["country"]:
+        geocode_cache.set(lat, lng, result)
     
     return result
 
+async def _fetch_reverse(lat: float, lng: float) -> Dict[str, Optional[str]]:
+    """
+    Ask the configured providers for location details from coordinates.
+    Returns dict with city, region, country, country_code, continent.
+    Raises GeocodingError when every provider failed.
+    """
+    return await geocoder.reverse(lat, lng) or empty_location()
+
 async def forward_geocode(city_name: str) -> Optional[Tuple[float, float, Dict[str, Optional[str]]]]:
     """
-    Convert a city name to coordinates and location details.
+    Convert a city name to coordinates and location details through the
+    query cache and the configured providers (local gazetteer first by default).
     Returns tuple of (latitude, longitude, location_dict) or None if not found.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                NOMINATIM_SEARCH_URL,
-                params={
-                    "q": city_name,
-                    "format": "json",
-                    "addressdetails": 1,
-                    "limit": 1,
-                    "accept-language": "en",
-                },
-                headers={"User-Agent": "Odyssey/1.0"},
-                timeout=5.0
-            )
-            
-            if response.status_code == 200:
-                results = response.json()
-                if results:
-                    first = results[0]
-                    lat = float(first["lat"])
-                    lon = float(first["lon"])
-                    address = first.get("address", {})
-                    
-                    city = (
-                        address.get("city") or 
-                        address.get("town") or 
-                        address.get("village") or 
-                        address.get("municipality") or
-                        city_name
-                    )
-                    
-                    region = address.get("state") or address.get("region")
-                    country = address.get("country")
-                    continent = get_continent(country) if country else "Unknown"
-                    
-                    return (lat, lon, {
-                        "city": city,
-                        "region": region,
-                        "country": country,
-                        "continent": continent
-                    })
-    except Exception as e:
+        matches = await forward_cache.get_or_fetch(city_name, lambda: _forward(city_name))
+    except GeocodingError as e:
         print(f"Forward geocoding error: {e}")
-    
-    return None
+        return None
+    if not matches:
+        return None
+    match = matches[0]
+    return (match.latitude, match.longitude, dict(match.location))
+
+async def _forward(city_name: str) -> list:
+    match = await geocoder.forward(city_name)
+    # Misses are cached too, so repeated unknown names stay local
+    return [match] if match else []
@@ -0,0 +1,133 @@
+"""Readers for the local geographic datasets used by the offline geocoder.
+
+Expected files (all optional except countries.geojson):
+    countries.geojson    Natural Earth admin-0 boundaries
+    admin1.geojson       Natural Earth admin-1 (states/provinces) boundaries
+    cities.txt           GeoNames cities dump (e.g. cities15000.txt)
+    countryInfo.txt      GeoNames country names and continent codes
+    admin1Codes.txt      GeoNames admin1CodesASCII.txt, for region names of cities
+"""
+import csv
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# GeoNames continent codes
+CONTINENT_CODES = {
+    "AF": "Africa",
+    "AN": "Antarctica",
+    "AS": "Asia",
+    "EU": "Europe",
+    "NA": "North America",
+    "OC": "Oceania",
+    "SA": "South America",
+}
+
+Ring = List[Tuple[float, float]]  # (lng, lat) pairs
+
+
+@dataclass
+class Boundary:
+    name: Optional[str]
+    iso_code: Optional[str]
+    continent: Optional[str]
+    parent: Optional[str]  # Country name for admin-1 boundaries
+    polygons: List[List[Ring]]  # Each polygon is [outer_ring, *holes]
+
+
+@dataclass
+class City:
+    name: str
+    ascii_name: str
+    latitude: float
+    longitude: float
+    country_code: str
+    admin1_code: str
+    population: int
+
+
+def _prop(props: dict, *keys: str) -> Optional[str]:
+    """Return the first usable property, ignoring case and Natural Earth's '-99' placeholders."""
+    lowered = {k.lower(): v for k, v in props.items()}
+    for key in keys:
+        value = lowered.get(key.lower())
+        if value not in (None, "", "-99", -99):
+            return str(value)
+    return None
+
+
+def read_boundaries(path: str) -> List[Boundary]:
+    """Read Polygon/MultiPolygon features from a GeoJSON FeatureCollection."""
+    with open(path, encoding="utf-8") as f:
+        collection = json.load(f)
+
+    boundaries = []
+    for feature in collection.get("features", []):
+        geometry = feature.get("geometry") or {}
+        props = feature.get("properties") or {}
+
+        if geometry.get("type") == "Polygon":
+            raw_polygons = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiPolygon":
+            raw_polygons = geometry["coordinates"]
+        else:
+            continue
+
+        polygons = [
+            [[(float(x), float(y)) for x, y, *_ in ring] for ring in polygon]
+            for polygon in raw_polygons
+        ]
+        boundaries.append(Boundary(
+            name=_prop(props, "name", "NAME_EN", "ADMIN"),
+            iso_code=_prop(props, "ISO_A2", "ISO_A2_EH", "iso_a2"),
+            continent=_prop(props, "CONTINENT"),
+            parent=_prop(props, "admin", "geonunit"),
+            polygons=polygons,
+        ))
+    return boundaries
+
+
+def iter_geonames(path: str) -> Iterator[List[str]]:
+    """Yield tab-separated GeoNames rows, skipping comments."""
+    with open(path, encoding="utf-8") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if row and not row[0].startswith("#"):
+                yield row
+
+
+def read_cities(path: str) -> List[City]:
+    cities = []
+    for row in iter_geonames(path):
+        if len(row) < 15:
+            continue
+        cities.append(City(
+            name=row[1],
+            ascii_name=row[2] or row[1],
+            latitude=float(row[4]),
+            longitude=float(row[5]),
+            country_code=row[8],
+            admin1_code=row[10],
+            population=int(row[14] or 0),
+        ))
+    return cities
+
+
+def read_country_info(path: str) -> Dict[str, Tuple[str, Optional[str]]]:
+    """Map ISO alpha-2 code to (country name, continent name)."""
+    countries = {}
+    for row in iter_geonames(path):
+        if len(row) < 9:
+            continue
+        countries[row[0]] = (row[4], CONTINENT_CODES.get(row[8]))
+    return countries
+
+
+def read_admin1_codes(path: str) -> Dict[str, str]:
+    """Map 'CC.admin1' codes (e.g. 'IT.07') to region names."""
+    return {row[0]: row[1] for row in iter_geonames(path) if len(row) >= 2}
+
+
+def data_file(data_dir: str, name: str) -> Optional[str]:
+    path = os.path.join(data_dir, name)
+    return path if os.path.exists(path) else None
@@ -0,0 +1,100 @@
+"""Shared outbound HTTP clients.
+
+One keep-alive connection pool per upstream, created on first use and closed
+when the application shuts down. Connection setup is traced so the reuse
+ratio can be checked under load.
+"""
+from collections import Counter
+from typing import Dict
+
+import httpx
+from backend.core.config import settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Per-upstream client options; each upstream gets its own pool, so pool limits are per host
+UPSTREAMS = {
+    "nominatim": {"headers": {"User-Agent": "Odyssey/1.0"}},
+    "google": {},
+    "turnstile": {},
+    "stub": {},
+}
+
+
+class ClientStats:
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.http_versions: Counter = Counter()
+
+    async def trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.complete":
+            self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    async def on_request(self, request: httpx.Request):
+        self.requests += 1
+        request.extensions["trace"] = self.trace
+
+    async def on_response(self, response: httpx.Response):
+        self.http_versions[response.http_version] += 1
+
+    def as_dict(self) -> dict:
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / self.requests, 4) if self.requests else None,
+            "http_versions": dict(self.http_versions),
+        }
+
+
+class HttpClientRegistry:
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, ClientStats] = {}
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Return the pooled client for an upstream, creating it on first use."""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create(name)
+            self._clients[name] = client
+        return client
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        stats = self._stats.setdefault(name, ClientStats())
+        options = UPSTREAMS.get(name, {})
+        return httpx.AsyncClient(
+            http2=settings.HTTP2_ENABLED and HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            headers=options.get("headers"),
+            event_hooks={"request": [stats.on_request], "response": [stats.on_response]},
+        )
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "http2_enabled": settings.HTTP2_ENABLED and HTTP2_AVAILABLE,
+            "clients": {name: stats.as_dict() for name, stats in self._stats.items()},
+        }
+
+
+http_clients = HttpClientRegistry()
@@ -0,0 +1,193 @@
+"""Global leaderboard: the ranking query and versioned in-memory snapshots of it.
+
+Each sort order has a snapshot of its top LEADERBOARD_SNAPSHOT_SIZE entries.
+A snapshot is rebuilt when it is older than LEADERBOARD_REFRESH_SECONDS or
+when this process has committed LEADERBOARD_REFRESH_CHANGES user stats
+changes since it was built. Its version only moves when the entries change;
+the ETag is a hash of the entries, so it stays valid across restarts and
+worker processes. Concurrent refreshes of one sort order collapse
+into a single query; with stale-while-revalidate the stale snapshot is
+served while the refresh runs in the background.
+
+With LEADERBOARD_SOURCE=analytics, snapshots and the deeper pages past them
+are both ranked from the columnar export, so one leaderboard never mixes
+two sources. Ranks in /users/me/stats still come from the live rank index
+and can run ahead of the leaderboard until the next export.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlmodel import Session, select, func
+from backend.core.config import settings
+from backend.database import engine
+from backend.models import User, UserStats
+from backend.services.rank_index import rank_index
+
+LEADERBOARD_SCORES = {
+    "points": UserStats.total_points,
+    "countries": UserStats.unique_countries,
+    "continents": UserStats.unique_continents,
+}
+
+
+def query_leaderboard(session: Session, sort_by: str, offset: int, limit: int) -> List[dict]:
+    """Rank users in the database with RANK() over the userstats scores."""
+    # Users without points have no userstats row and rank with zero scores
+    columns = {
+        name: func.coalesce(column, 0).label(name)
+        for name, column in (
+            ("total_points", UserStats.total_points),
+            ("unique_countries", UserStats.unique_countries),
+            ("unique_continents", UserStats.unique_continents),
+        )
+    }
+    score = func.coalesce(LEADERBOARD_SCORES[sort_by], 0)
+    rows = session.exec(
+        select(
+            User.id,
+            User.username,
+            User.total_badges,
+            *columns.values(),
+            func.rank().over(order_by=score.desc()).label("rank"),
+        )
+        .outerjoin(UserStats, UserStats.user_id == User.id)
+        .order_by(score.desc(), User.id)
+        .offset(offset)
+        .limit(limit)
+    ).all()
+
+    return [
+        {
+            "rank": row.rank,
+            "user_id": row.id,
+            "username": row.username,
+            "total_points": row.total_points,
+            "unique_countries": row.unique_countries,
+            "unique_continents": row.unique_continents,
+            "total_badges": row.total_badges,
+        }
+        for row in rows
+    ]
+
+
+@dataclass
+class Snapshot:
+    sort_by: str
+    version: int
+    entries: List[dict]
+    built_at: float
+    changes_at_build: int
+    etag: str
+
+
+class LeaderboardSnapshots:
+    def __init__(self):
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._locks = {sort_by: threading.Lock() for sort_by in LEADERBOARD_SCORES}
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {
+            "hits": 0, "stale_hits": 0, "refreshes": 0, "collapsed": 0, "live_queries": 0, "analytics_loads": 0,
+        }
+
+    def get(self, sort_by: str) -> Snapshot:
+        """Current snapshot for a sort order, refreshing it if needed."""
+        snapshot = self._snapshots.get(sort_by)
+        if snapshot is None:
+            return self._refresh(sort_by, wait=True)
+        if not self._is_stale(snapshot):
+            self.counters["hits"] += 1
+            return snapshot
+        if settings.LEADERBOARD_STALE_WHILE_REVALIDATE:
+            self.counters["stale_hits"] += 1
+            threading.Thread(target=self._refresh, args=(sort_by, False), daemon=True).start()
+            return snapshot
+        return self._refresh(sort_by, wait=True)
+
+    def page(self, sort_by: str, offset: int, limit: int) -> tuple[Snapshot, Optional[List[dict]]]:
+        """Snapshot and the requested slice, or None when the slice lies past the snapshot."""
+        snapshot = self.get(sort_by)
+        # A full snapshot is truncated, so pages past its end need the database
+        if offset + limit > len(snapshot.entries) and len(snapshot.entries) >= settings.LEADERBOARD_SNAPSHOT_SIZE:
+            self.counters["live_queries"] += 1
+            return snapshot, None
+        return snapshot, snapshot.entries[offset:offset + limit]
+
+    async def start(self):
+        """Refresh every sort order on a schedule so requests rarely see a stale snapshot."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def get_stats(self) -> dict:
+        stats = dict(self.counters)
+        stats["snapshots"] = {
+            sort_by: {"version": s.version, "entries": len(s.entries), "age_seconds": round(time.monotonic() - s.built_at, 1)}
+            for sort_by, s in self._snapshots.items()
+        }
+        return stats
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.LEADERBOARD_REFRESH_SECONDS)
+            for sort_by in LEADERBOARD_SCORES:
+                try:
+                    await asyncio.to_thread(self._refresh, sort_by, False)
+                except Exception as e:
+                    print(f"Leaderboard refresh error: {e}")
+
+    def _is_stale(self, snapshot: Snapshot) -> bool:
+        if time.monotonic() - snapshot.built_at > settings.LEADERBOARD_REFRESH_SECONDS:
+            return True
+        return rank_index.counters["changes"] - snapshot.changes_at_build >= settings.LEADERBOARD_REFRESH_CHANGES
+
+    def _refresh(self, sort_by: str, wait: bool) -> Optional[Snapshot]:
+        lock = self._locks[sort_by]
+        if not lock.acquire(blocking=wait):
+            # Another thread is already refreshing this sort order
+            self.counters["collapsed"] += 1
+            return None
+        try:
+            current = self._snapshots.get(sort_by)
+            if wait and current is not None and not self._is_stale(current):
+                # Refreshed by the thread we waited for
+                self.counters["collapsed"] += 1
+                return current
+
+            changes = rank_index.counters["changes"]
+            with Session(engine) as session:
+                entries = self.query(session, sort_by, 0, settings.LEADERBOARD_SNAPSHOT_SIZE)
+            if current is not None and entries == current.entries:
+                version, etag = current.version, current.etag
+            else:
+                version = current.version + 1 if current else 1
+                digest = hashlib.sha1(json.dumps(entries, sort_keys=True, default=str).encode()).hexdigest()
+                etag = f'W/"leaderboard-{sort_by}-{digest}"'
+            snapshot = Snapshot(sort_by, version, entries, time.monotonic(), changes, etag)
+            self._snapshots[sort_by] = snapshot
+            self.counters["refreshes"] += 1
+            return snapshot
+        finally:
+            lock.release()
+
+    def query(self, session: Session, sort_by: str, offset: int, limit: int) -> List[dict]:
+        """Rank a slice of the leaderboard from LEADERBOARD_SOURCE, bypassing the snapshot."""
+        if settings.LEADERBOARD_SOURCE == "analytics":
+            # Imported here so pyarrow is only needed when the snapshot is used
+            from backend.services import analytics
+
+            if analytics.is_available():
+                self.counters["analytics_loads"] += 1
+                return analytics.leaderboard(sort_by, offset, limit)
+        return query_leaderboard(session, sort_by, offset, limit)
+
+
+leaderboard_snapshots = LeaderboardSnapshots()
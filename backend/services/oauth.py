@@ -1,5 +1,5 @@
 """Google OAuth service for authentication."""
-import httpx
+from backend.services.http_client import http_clients
 from urllib.parse import urlencode
 from backend.core.config import settings
 
@@ -59,10 +59,10 @@ async def exchange_code_for_tokens(code: str) -> dict:
         "redirect_uri": settings.GOOGLE_REDIRECT_URI,
     }
     
-    async with httpx.AsyncClient() as client:
-        response = await client.post(GOOGLE_TOKEN_URL, data=payload)
-        response.raise_for_status()
-        return response.json()
+    client = http_clients.get("google")
+    response = await client.post(GOOGLE_TOKEN_URL, data=payload)
+    response.raise_for_status()
+    return response.json()
 
 
 async def get_google_user_info(access_token: str) -> dict:
@@ -77,10 +77,10 @@ async def get_google_user_info(access_token: str) -> dict:
     """
     headers = {"Authorization": f"Bearer {access_token}"}
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(GOOGLE_USERINFO_URL, headers=headers)
-        response.raise_for_status()
-        return response.json()
+    client = http_clients.get("google")
+    response = await client.get(GOOGLE_USERINFO_URL, headers=headers)
+    response.raise_for_status()
+    return response.json()
 
 
 async def get_user_from_code(code: str) -> dict:
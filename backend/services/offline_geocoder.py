@@ -0,0 +1,264 @@
+"""Offline reverse geocoder backed by local boundary polygons and a city gazetteer.
+
+Boundaries are indexed in a bulk-loaded bounding-box R-tree and tested with
+point-in-polygon; the nearest city comes from a KD-tree over unit-sphere
+coordinates. Everything is built once at startup and only read afterwards.
+"""
+import heapq
+import math
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from backend.services.geodata import (
+    Boundary, City, Ring, data_file, read_admin1_codes, read_boundaries,
+    read_cities, read_country_info,
+)
+
+EARTH_RADIUS_KM = 6371.0
+RTREE_NODE_SIZE = 16
+
+BBox = Tuple[float, float, float, float]  # min_lng, min_lat, max_lng, max_lat
+
+
+def _ring_bbox(ring: Ring) -> BBox:
+    xs = [p[0] for p in ring]
+    ys = [p[1] for p in ring]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def _merge_bbox(boxes: Sequence[BBox]) -> BBox:
+    return (
+        min(b[0] for b in boxes), min(b[1] for b in boxes),
+        max(b[2] for b in boxes), max(b[3] for b in boxes),
+    )
+
+
+def _ring_contains(ring: Ring, x: float, y: float) -> bool:
+    """Even-odd ray casting test."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _polygon_contains(polygon: List[Ring], x: float, y: float) -> bool:
+    if not _ring_contains(polygon[0], x, y):
+        return False
+    return not any(_ring_contains(hole, x, y) for hole in polygon[1:])
+
+
+class BBoxRTree:
+    """Static R-tree built with Sort-Tile-Recursive packing."""
+
+    def __init__(self, items: List[Tuple[BBox, object]]):
+        self.size = len(items)
+        level = [(bbox, None, payload) for bbox, payload in items]
+        while len(level) > RTREE_NODE_SIZE:
+            level = self._pack(level)
+        self.root = (_merge_bbox([n[0] for n in level]), level, None) if level else None
+
+    @staticmethod
+    def _pack(nodes):
+        slices = math.ceil(math.sqrt(math.ceil(len(nodes) / RTREE_NODE_SIZE)))
+        per_slice = slices * RTREE_NODE_SIZE
+        nodes = sorted(nodes, key=lambda n: n[0][0] + n[0][2])
+        parents = []
+        for s in range(0, len(nodes), per_slice):
+            vertical = sorted(nodes[s:s + per_slice], key=lambda n: n[0][1] + n[0][3])
+            for g in range(0, len(vertical), RTREE_NODE_SIZE):
+                children = vertical[g:g + RTREE_NODE_SIZE]
+                parents.append((_merge_bbox([c[0] for c in children]), children, None))
+        return parents
+
+    def query_point(self, x: float, y: float) -> List[object]:
+        if not self.root:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            bbox, children, payload = stack.pop()
+            if not (bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]):
+                continue
+            if children is None:
+                found.append(payload)
+            else:
+                stack.extend(children)
+        return found
+
+
+def _to_xyz(lat: float, lng: float) -> Tuple[float, float, float]:
+    phi = math.radians(lat)
+    lam = math.radians(lng)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+
+class KDTree:
+    """3-d tree over unit vectors; chord distance ranks like great-circle distance."""
+
+    def __init__(self, points: List[Tuple[float, float, float]]):
+        self.points = points
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indices: List[int], depth: int):
+        if not indices:
+            return None
+        axis = depth % 3
+        indices.sort(key=lambda i: self.points[i][axis])
+        mid = len(indices) // 2
+        return (
+            indices[mid],
+            axis,
+            self._build(indices[:mid], depth + 1),
+            self._build(indices[mid + 1:], depth + 1),
+        )
+
+    def nearest(self, target: Tuple[float, float, float], k: int = 1) -> List[Tuple[float, int]]:
+        """Return up to k (squared chord distance, index) pairs, closest first."""
+        heap: List[Tuple[float, int]] = []  # Max-heap via negated distances
+
+        def visit(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            point = self.points[index]
+            dist = sum((point[a] - target[a]) ** 2 for a in range(3))
+            if len(heap) < k:
+                heapq.heappush(heap, (-dist, index))
+            elif dist < -heap[0][0]:
+                heapq.heapreplace(heap, (-dist, index))
+
+            delta = target[axis] - point[axis]
+            near, far = (left, right) if delta < 0 else (right, left)
+            visit(near)
+            if len(heap) < k or delta * delta < -heap[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return sorted((-d, i) for d, i in heap)
+
+
+def chord_to_km(squared_chord: float) -> float:
+    chord = math.sqrt(squared_chord)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class OfflineGeocoder:
+    def __init__(self):
+        self.loaded = False
+        self.countries: Optional[BBoxRTree] = None
+        self.regions: Optional[BBoxRTree] = None
+        self.cities: List[City] = []
+        self.city_tree: Optional[KDTree] = None
+        self.country_info: Dict[str, Tuple[str, Optional[str]]] = {}
+        self.admin1_names: Dict[str, str] = {}
+        self.max_city_distance_km = 30.0
+
+    def load(self, data_dir: str, max_city_distance_km: float = 30.0):
+        """Load and index the datasets in data_dir. Safe to call again to reload."""
+        started = time.perf_counter()
+        countries_path = data_file(data_dir, "countries.geojson")
+        if not countries_path:
+            print(f"Offline geocoder: no countries.geojson in {data_dir}, offline lookups disabled")
+            self.loaded = False
+            return
+
+        self.max_city_distance_km = max_city_distance_km
+        self.countries = self._index_boundaries(read_boundaries(countries_path))
+
+        admin1_path = data_file(data_dir, "admin1.geojson")
+        self.regions = self._index_boundaries(read_boundaries(admin1_path)) if admin1_path else None
+
+        info_path = data_file(data_dir, "countryInfo.txt")
+        self.country_info = read_country_info(info_path) if info_path else {}
+
+        codes_path = data_file(data_dir, "admin1Codes.txt")
+        self.admin1_names = read_admin1_codes(codes_path) if codes_path else {}
+
+        cities_path = data_file(data_dir, "cities.txt")
+        self.cities = read_cities(cities_path) if cities_path else []
+        self.city_tree = KDTree([_to_xyz(c.latitude, c.longitude) for c in self.cities]) if self.cities else None
+
+        self.loaded = True
+        print(
+            f"Offline geocoder: {self.countries.size} country polygons, "
+            f"{self.regions.size if self.regions else 0} region polygons, "
+            f"{len(self.cities)} cities indexed in {time.perf_counter() - started:.1f}s"
+        )
+
+    @staticmethod
+    def _index_boundaries(boundaries: List[Boundary]) -> BBoxRTree:
+        items = []
+        for boundary in boundaries:
+            for polygon in boundary.polygons:
+                if polygon and polygon[0]:
+                    items.append((_ring_bbox(polygon[0]), (boundary, polygon)))
+        return BBoxRTree(items)
+
+    @staticmethod
+    def _find_boundary(tree: Optional[BBoxRTree], lat: float, lng: float) -> Optional[Boundary]:
+        if not tree:
+            return None
+        for boundary, polygon in tree.query_point(lng, lat):
+            if _polygon_contains(polygon, lng, lat):
+                return boundary
+        return None
+
+    def _nearest_city(self, lat: float, lng: float, country_code: Optional[str]) -> Optional[City]:
+        if not self.city_tree:
+            return None
+        candidates = self.city_tree.nearest(_to_xyz(lat, lng), k=5)
+        in_range = [
+            self.cities[i] for dist, i in candidates
+            if chord_to_km(dist) <= self.max_city_distance_km
+        ]
+        # Near borders the closest city can sit across the line; prefer one in the same country
+        for city in in_range:
+            if country_code and city.country_code == country_code:
+                return city
+        return in_range[0] if in_range else None
+
+    def lookup(self, lat: float, lng: float) -> Optional[Dict[str, Optional[str]]]:
+        """
+        Resolve coordinates without the network.
+        Returns dict with city, region, country, country_code, continent or None if outside every country.
+        """
+        # Imported here to avoid a cycle: geocoding imports this module
+        from backend.services.geocoding import get_continent
+
+        if not self.loaded:
+            return None
+
+        country = self._find_boundary(self.countries, lat, lng)
+        if not country:
+            return None
+
+        iso_code = country.iso_code
+        country_name, info_continent = self.country_info.get(iso_code, (None, None)) if iso_code else (None, None)
+        country_name = country_name or country.name
+
+        continent = get_continent(country_name) if country_name else "Unknown"
+        if continent == "Unknown":
+            continent = info_continent or country.continent or "Unknown"
+
+        region = self._find_boundary(self.regions, lat, lng)
+        city = self._nearest_city(lat, lng, iso_code)
+
+        region_name = region.name if region else None
+        if not region_name and city and city.admin1_code:
+            region_name = self.admin1_names.get(f"{city.country_code}.{city.admin1_code}")
+
+        return {
+            "city": city.name if city else None,
+            "region": region_name,
+            "country": country_name,
+            "country_code": iso_code,
+            "continent": continent,
+        }
+
+
+offline_geocoder = OfflineGeocoder()
@@ -0,0 +1,107 @@
+"""Place dimension: integer ids for the continent/country/region/city strings on Point.
+
+Names are matched on their folded form, so "São Paulo" and "Sao Paulo" share
+one row. Ids are cached in-process per (kind, parent_id, key); place rows are
+never deleted after startup, so cached ids stay valid.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from backend.database import engine
+from backend.models import Place
+from backend.services.text import fold_text
+
+# Outermost first; each kind is stored under the nearest resolved kind before it
+PLACE_KINDS = ("continent", "country", "region", "city")
+
+PlaceIds = Dict[str, Optional[int]]
+
+
+class PlaceDirectory:
+    def __init__(self):
+        self._ids: Dict[Tuple[str, Optional[int], str], int] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, geo: Dict[str, Optional[str]], connection=None) -> PlaceIds:
+        """
+        Ids for the names in geo, creating missing places.
+        Runs in its own transaction unless a Session or Connection is given.
+        """
+        if connection is not None:
+            return self._resolve(connection, geo)
+        try:
+            with Session(engine) as session:
+                ids = self._resolve(session, geo)
+                session.commit()
+            return ids
+        except Exception as e:
+            # Ids cached during a failed transaction may not exist
+            self.clear()
+            print(f"Place resolution error: {e}")
+            return {kind: None for kind in PLACE_KINDS}
+
+    def assign(self, point, connection=None):
+        """Set point.<kind>_id from the point's location strings."""
+        geo = {kind: getattr(point, kind) for kind in PLACE_KINDS}
+        for kind, place_id in self.resolve(geo, connection).items():
+            setattr(point, f"{kind}_id", place_id)
+
+    def ids_named(self, session: Session, kind: str, name: str) -> List[int]:
+        """Every place of this kind with this (folded) name, e.g. each Springfield."""
+        return list(session.exec(
+            select(Place.id).where(Place.kind == kind, Place.key == fold_text(name))
+        ).all())
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+    def _resolve(self, connection, geo: Dict[str, Optional[str]]) -> PlaceIds:
+        ids: PlaceIds = {}
+        parent_id = None
+        for kind in PLACE_KINDS:
+            name = (geo.get(kind) or "").strip()
+            key = fold_text(name)
+            if not key:
+                ids[kind] = None
+                continue
+            iso_code = geo.get("country_code") if kind == "country" else None
+            ids[kind] = parent_id = self._get_or_create(connection, kind, name, key, parent_id, iso_code)
+        return ids
+
+    def _get_or_create(self, connection, kind: str, name: str, key: str,
+                       parent_id: Optional[int], iso_code: Optional[str]) -> int:
+        cache_key = (kind, parent_id, key)
+        with self._lock:
+            place_id = self._ids.get(cache_key)
+        if place_id is not None:
+            return place_id
+
+        place_id = self._find(connection, kind, key, parent_id)
+        if place_id is None:
+            try:
+                # Savepoint so a concurrent insert of the same place does not abort the caller
+                with connection.begin_nested():
+                    connection.execute(insert(Place).values(
+                        kind=kind, name=name, key=key, parent_id=parent_id,
+                        iso_code=iso_code.upper() if iso_code else None,
+                    ))
+            except IntegrityError:
+                pass
+            place_id = self._find(connection, kind, key, parent_id)
+
+        with self._lock:
+            self._ids[cache_key] = place_id
+        return place_id
+
+    def _find(self, connection, kind: str, key: str, parent_id: Optional[int]) -> Optional[int]:
+        parent_match = Place.parent_id == parent_id if parent_id is not None else Place.parent_id.is_(None)
+        return connection.execute(
+            select(Place.id).where(Place.kind == kind, Place.key == key, parent_match).order_by(Place.id).limit(1)
+        ).scalar()
+
+
+place_directory = PlaceDirectory()
@@ -0,0 +1,148 @@
+"""Keyset (cursor) pagination of a map's points, with cached filtered totals.
+
+A cursor holds the sort key and id of the last point of a page. The next
+page seeks past it with a row-value comparison on (sort key, id), plus a
+plain bound on the sort key that lets the (map_id, sort key) indexes start
+the scan at the cursor, so deep pages cost the same as the first one. Text
+sort keys are coalesce(column, '') so NULLs sort first on every dialect,
+and Point.id breaks ties.
+
+The total of a filtered listing is cached per map and filters instead of
+counted on every request. It is dropped when a session that wrote points of
+the map commits (see services/change_feed.py), and expires after POINT_COUNT_CACHE_TTL_SECONDS for writes
+made by other processes.
+"""
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import literal_column, tuple_
+from sqlmodel import Session, func, select
+from backend.core.config import settings
+from backend.models import Point
+from backend.services.change_feed import change_feed
+
+# sort_by -> key expression; matches the ix_point_map_* indexes on Point
+SORT_KEYS = {
+    "timestamp": Point.timestamp,
+    "city": func.coalesce(Point.city, literal_column("''")),
+    "country": func.coalesce(Point.country, literal_column("''")),
+}
+DEFAULT_SORT = "timestamp"
+
+Filters = Tuple[Optional[str], ...]
+
+
+def _fingerprint(sort_by: str, sort_order: str, filters: Filters) -> str:
+    return hashlib.sha1(json.dumps([sort_by, sort_order, *filters]).encode()).hexdigest()[:16]
+
+
+def encode_cursor(sort_by: str, sort_order: str, filters: Filters, point: Point) -> str:
+    value = getattr(point, sort_by)
+    value = value.isoformat() if isinstance(value, datetime) else value or ""
+    payload = {"f": _fingerprint(sort_by, sort_order, filters), "v": value, "id": point.id}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str, filters: Filters) -> Tuple[object, int]:
+    """(sort key, id) of the cursor's point; ValueError for a malformed cursor or one from another listing."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        value, point_id = payload["v"], int(payload["id"])
+        if sort_by == "timestamp":
+            value = datetime.fromisoformat(value)
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Malformed cursor") from e
+    if not isinstance(value, (str, datetime)) or payload.get("f") != _fingerprint(sort_by, sort_order, filters):
+        raise ValueError("Cursor belongs to another sort order or filter")
+    return value, point_id
+
+
+def keyset_page(session: Session, query, sort_by: str, sort_order: str, filters: Filters,
+                cursor: Optional[str], limit: int) -> Tuple[List[Point], Optional[str]]:
+    """The page of query after cursor (the first page when empty) and the cursor of the next page, if any."""
+    if sort_by not in SORT_KEYS:
+        sort_by = DEFAULT_SORT
+    key = SORT_KEYS[sort_by]
+    if cursor:
+        value, point_id = decode_cursor(cursor, sort_by, sort_order, filters)
+        if sort_order == "asc":
+            query = query.where(key >= value, tuple_(key, Point.id) > tuple_(value, point_id))
+        else:
+            query = query.where(key <= value, tuple_(key, Point.id) < tuple_(value, point_id))
+    if sort_order == "asc":
+        query = query.order_by(key.asc(), Point.id.asc())
+    else:
+        query = query.order_by(key.desc(), Point.id.desc())
+
+    points = session.exec(query.limit(limit + 1)).all()
+    if len(points) <= limit:
+        return points, None
+    points = points[:limit]
+    return points, encode_cursor(sort_by, sort_order, filters, points[-1])
+
+
+class PointCountCache:
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # (map_id, filters) -> (expires_at, total)
+        self._entries: OrderedDict[Tuple[int, Filters], Tuple[float, int]] = OrderedDict()
+        # Bumped on every invalidation, so a count that raced a write is not stored
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def total(self, session: Session, map_id: int, filters: Filters, query) -> int:
+        """Rows of query, the filtered listing of the map's points, from the cache when fresh."""
+        key = (map_id, filters)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[1]
+            self.counters["misses"] += 1
+            generation = self._generations.get(map_id, 0)
+
+        total = session.exec(select(func.count()).select_from(query.subquery())).one()
+        with self._lock:
+            if self._generations.get(map_id, 0) == generation:
+                self._entries[key] = (time.monotonic() + self.ttl_seconds, total)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return total
+
+    def invalidate(self, *map_ids: int):
+        with self._lock:
+            for map_id in map_ids:
+                self._generations[map_id] = self._generations.get(map_id, 0) + 1
+            for key in [key for key in self._entries if key[0] in map_ids]:
+                del self._entries[key]
+                self.counters["invalidations"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._entries)
+        return stats
+
+
+point_counts = PointCountCache(
+    max_entries=settings.POINT_COUNT_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.POINT_COUNT_CACHE_TTL_SECONDS,
+)
+
+change_feed.subscribe(
+    "point_counts",
+    collect=lambda session, changes: {
+        obj.map_id for obj, _ in changes if isinstance(obj, Point) and obj.map_id is not None
+    },
+    apply=lambda map_ids: point_counts.invalidate(*set(map_ids)),
+)
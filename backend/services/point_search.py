@@ -0,0 +1,102 @@
+"""Full-text search over point city, region, country, description and category.
+
+The index is kept by the database itself, so every write path (ORM,
+bulk updates, migrations) stays in sync:
+
+- SQLite: an external-content FTS5 table point_fts over the point table,
+  updated by insert, update and delete triggers. The unicode61 tokenizer
+  folds case and diacritics.
+- Postgres: a generated tsvector column point.search_vector ('simple'
+  configuration) with a GIN index.
+
+Every word of a search must match, as a prefix ("rom" finds "Rome").
+matches() gives the ids of matching points with a relevance score (higher
+is better: -bm25 on SQLite, ts_rank on Postgres): filter with
+Point.id.in_() and join it only to order by relevance. When the
+index cannot be created (SQLite built without FTS5) search falls back to
+ILIKE in the endpoint.
+"""
+import re
+from typing import List
+
+from sqlalchemy import column, func, literal_column, select, table, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+from backend.models import Point
+
+COLUMNS = ("city", "region", "country", "description", "category")
+
+_COLUMN_LIST = ", ".join(COLUMNS)
+_NEW_VALUES = ", ".join(f"new.{name}" for name in COLUMNS)
+_OLD_VALUES = ", ".join(f"old.{name}" for name in COLUMNS)
+_DOCUMENT = " || ' ' || ".join(f"coalesce({name}, '')" for name in COLUMNS)
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS point_fts USING fts5({_COLUMN_LIST}, content='point', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS point_fts_insert AFTER INSERT ON point BEGIN "
+    f"INSERT INTO point_fts(rowid, {_COLUMN_LIST}) VALUES (new.id, {_NEW_VALUES}); END",
+    f"CREATE TRIGGER IF NOT EXISTS point_fts_delete AFTER DELETE ON point BEGIN "
+    f"INSERT INTO point_fts(point_fts, rowid, {_COLUMN_LIST}) VALUES ('delete', old.id, {_OLD_VALUES}); END",
+    f"CREATE TRIGGER IF NOT EXISTS point_fts_update AFTER UPDATE OF {_COLUMN_LIST} ON point BEGIN "
+    f"INSERT INTO point_fts(point_fts, rowid, {_COLUMN_LIST}) VALUES ('delete', old.id, {_OLD_VALUES}); "
+    f"INSERT INTO point_fts(rowid, {_COLUMN_LIST}) VALUES (new.id, {_NEW_VALUES}); END",
+]
+POSTGRES_DDL = [
+    "ALTER TABLE point ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    f"GENERATED ALWAYS AS (to_tsvector('simple', {_DOCUMENT})) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_point_search_vector ON point USING GIN (search_vector)",
+]
+
+
+def search_words(term: str) -> List[str]:
+    return re.findall(r"\w+", term.lower())
+
+
+class PointSearch:
+    def __init__(self):
+        self.available = False
+
+    def create_index(self, connection: Connection):
+        """Create the index, its triggers or column if missing; run at startup."""
+        dialect = connection.dialect.name
+        statements = POSTGRES_DDL if dialect == "postgresql" else SQLITE_DDL if dialect == "sqlite" else []
+        try:
+            with connection.begin_nested():
+                for statement in statements:
+                    connection.execute(text(statement))
+            self.available = bool(statements)
+        except DBAPIError as e:
+            print(f"Point search: no full-text index ({e.orig}), search falls back to ILIKE")
+            self.available = False
+
+    def rebuild(self, connection: Connection):
+        """Index the existing points; Postgres fills the generated column by itself."""
+        if self.available and connection.dialect.name == "sqlite":
+            connection.execute(text("INSERT INTO point_fts(point_fts) VALUES ('rebuild')"))
+
+    def matches(self, dialect: str, term: str):
+        """Subquery of (id, rank) for the points matching every word of term, or None to fall back to ILIKE."""
+        words = search_words(term)
+        if not self.available or not words:
+            return None
+        if dialect == "postgresql":
+            query = func.to_tsquery("simple", " & ".join(f"{word}:*" for word in words))
+            vector = literal_column("point.search_vector")
+            return (
+                select(Point.id.label("id"), func.ts_rank(vector, query).label("rank"))
+                .where(vector.op("@@")(query))
+                .subquery("search_matches")
+            )
+        fts = table("point_fts", column("rowid"))
+        # Quoted, so words are never read as FTS5 operators
+        query = " ".join(f'"{word}"*' for word in words)
+        return (
+            select(fts.c.rowid.label("id"), (-func.bm25(literal_column("point_fts"))).label("rank"))
+            .select_from(fts)
+            .where(literal_column("point_fts").op("MATCH")(query))
+            .subquery("search_matches")
+        )
+
+
+point_search = PointSearch()
@@ -0,0 +1,120 @@
+"""Result cache for place-name queries (city search and forward geocoding).
+
+Queries are keyed on their folded form, so "  Zürich" and "zurich" share an
+entry. Entries expire after a TTL and the least recently used are evicted.
+With prefix reuse on, a query is answered from a cached shorter prefix when
+that entry holds every match it had (fewer than the limit it was fetched
+with): "pari" is "par" filtered. That only holds for name-prefix search
+(the local gazetteer), so entries holding results of other providers are
+never reused for longer queries. Concurrent misses for the same query share
+one upstream call.
+"""
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+from backend.core.config import settings
+from backend.services.singleflight import SingleFlight
+from backend.services.text import fold_text
+
+
+class QueryCache:
+    def __init__(self, max_entries: int, ttl_seconds: int, name_of: Optional[Callable] = None):
+        """
+        name_of(result) enables prefix reuse: results are filtered on its folded value.
+        It returns None for results not found by name prefix, whose entries are not reused.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.name_of = name_of
+        # key -> (expires_at, fetch limit, results, reusable for longer prefixes)
+        self._entries: OrderedDict[str, Tuple[float, int, list, bool]] = OrderedDict()
+        self._flights = SingleFlight()
+        self.counters = {"hits": 0, "prefix_hits": 0, "misses": 0, "evictions": 0}
+
+    async def get_or_fetch(self, query: str, fetch: Callable[[], Awaitable[list]], limit: int = 1) -> list:
+        name, _, qualifier = query.partition(",")
+        name, qualifier = fold_text(name), fold_text(qualifier)
+        key = self._key(name, qualifier)
+
+        results = self._lookup(key, limit)
+        if results is not None:
+            self.counters["hits"] += 1
+            return results
+
+        if self.name_of:
+            results = self._lookup_prefix(name, qualifier, limit)
+            if results:
+                self.counters["prefix_hits"] += 1
+                return results
+
+        self.counters["misses"] += 1
+        return await self._flights.do((key, limit), lambda: self._fetch_and_store(key, fetch, limit))
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        stats = dict(self.counters)
+        stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["prefix_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["prefix_hits"]) / lookups, 4) if lookups else None
+        stats["single_flight"] = self._flights.get_stats()
+        return stats
+
+    @staticmethod
+    def _key(name: str, qualifier: str) -> str:
+        return f"{name},{qualifier}" if qualifier else name
+
+    def _lookup(self, key: str, limit: int) -> Optional[list]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, fetched_limit, results, _ = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        # A short answer is complete, so it also serves larger limits
+        if fetched_limit < limit and len(results) >= fetched_limit:
+            return None
+        self._entries.move_to_end(key)
+        return results[:limit]
+
+    def _lookup_prefix(self, name: str, qualifier: str, limit: int) -> Optional[list]:
+        for length in range(len(name) - 1, 0, -1):
+            key = self._key(name[:length], qualifier)
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            expires_at, fetched_limit, results, reusable = entry
+            if expires_at <= time.monotonic() or len(results) >= fetched_limit or not reusable:
+                # Expired, truncated so matches for the longer name may be missing,
+                # or not a prefix search so its matches say nothing about the longer name
+                return None
+            # An empty filter result is not trusted; providers that match on
+            # more than the name prefix may still know the place
+            matches = [result for result in results if fold_text(self.name_of(result) or "").startswith(name)]
+            return matches[:limit] or None
+        return None
+
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[list]], limit: int) -> list:
+        results = list(await fetch())
+        reusable = self.name_of is not None and all(self.name_of(result) is not None for result in results)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, limit, results, reusable)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+        return results[:limit]
+
+
+search_cache = QueryCache(
+    max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS,
+    # Only the gazetteer searches by name prefix; Nominatim matches on more than the name
+    name_of=lambda match: (match.location.get("city") or match.display_name) if match.provider == "local" else None,
+)
+forward_cache = QueryCache(
+    max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS,
+)
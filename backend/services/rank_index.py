@@ -0,0 +1,104 @@
+"""In-memory rank index over the userstats scores.
+
+Keeps one sorted score list per leaderboard metric, so "how many users score
+above X" is a binary search. User stats changes are staged on the session by
+services/user_stats.py and applied after the transaction commits; a rolled
+back transaction leaves the index untouched. Each worker process keeps its
+own index and rebuilds it from the database every RANK_INDEX_REBUILD_SECONDS
+to pick up changes made by other processes.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional
+
+from sqlmodel import Session, select
+from backend.core.config import settings
+from backend.database import engine
+from backend.models import UserStats
+from backend.services.change_feed import change_feed
+
+# Metric -> userstats column
+METRICS = {
+    "total_points": UserStats.total_points,
+    "unique_countries": UserStats.unique_countries,
+    "unique_continents": UserStats.unique_continents,
+}
+
+
+class RankIndex:
+    def __init__(self, rebuild_seconds: float):
+        self.rebuild_seconds = rebuild_seconds
+        self._scores: Dict[str, List[int]] = {metric: [] for metric in METRICS}
+        self._by_user: Dict[int, Dict[str, int]] = {}
+        self._built_at: Optional[float] = None
+        self._lock = threading.Lock()
+        # changes counts every committed user change, applied or not; updates only those applied
+        self.counters = {"rebuilds": 0, "updates": 0, "changes": 0, "queries": 0}
+
+    def rank(self, metric: str, score: int) -> int:
+        """1 + the number of users scoring strictly above score."""
+        self._ensure_fresh()
+        with self._lock:
+            self.counters["queries"] += 1
+            scores = self._scores[metric]
+            return len(scores) - bisect_right(scores, score) + 1
+
+    def update(self, user_id: int, scores: Dict[str, int]):
+        """Replace one user's scores in O(n) list moves, O(log n) searches."""
+        with self._lock:
+            self.counters["changes"] += 1
+            if self._built_at is None:
+                # Not built yet; the first query loads current values anyway
+                return
+            old = self._by_user.get(user_id)
+            for metric, values in self._scores.items():
+                if old is not None:
+                    del values[bisect_left(values, old[metric])]
+                insort(values, scores[metric])
+            self._by_user[user_id] = dict(scores)
+            self.counters["updates"] += 1
+
+    def rebuild(self):
+        with Session(engine) as session:
+            rows = session.exec(select(UserStats.user_id, *METRICS.values())).all()
+        by_user = {row[0]: dict(zip(METRICS, row[1:])) for row in rows}
+        scores = {metric: sorted(values[metric] for values in by_user.values()) for metric in METRICS}
+        with self._lock:
+            self._by_user = by_user
+            self._scores = scores
+            self._built_at = time.monotonic()
+            self.counters["rebuilds"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["users"] = len(self._by_user)
+            stats["age_seconds"] = round(time.monotonic() - self._built_at, 1) if self._built_at is not None else None
+        return stats
+
+    def _ensure_fresh(self):
+        built_at = self._built_at
+        if built_at is None or time.monotonic() - built_at > self.rebuild_seconds:
+            self.rebuild()
+
+
+rank_index = RankIndex(rebuild_seconds=settings.RANK_INDEX_REBUILD_SECONDS)
+
+
+def stage_update(connection, user_id: int, scores: Dict[str, int]):
+    """Queue new scores for a user, applied when the session commits."""
+    change_feed.stage(connection, "rank_index", [(user_id, scores)])
+
+
+def _apply_updates(updates: list):
+    # Only a user's last scores in the transaction count
+    for user_id, scores in dict(updates).items():
+        rank_index.update(user_id, scores)
+
+
+change_feed.subscribe("rank_index", apply=_apply_updates)
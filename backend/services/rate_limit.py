@@ -0,0 +1,22 @@
+"""Async rate limiter that spaces calls evenly over time."""
+import asyncio
+import time
+
+
+class AsyncRateLimiter:
+    def __init__(self, max_per_second: float):
+        self.interval = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self._next_slot = 0.0
+        self.waits = 0
+
+    async def acquire(self):
+        """Wait until the next call slot is available and claim it."""
+        if not self.interval:
+            return
+        # No await between reading and claiming the slot, so this is atomic on the event loop
+        now = time.monotonic()
+        delay = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            self.waits += 1
+            await asyncio.sleep(delay)
@@ -0,0 +1,103 @@
+"""Per-map scoreboards: participant counts from one grouped query, cached per map.
+
+A cached scoreboard is dropped when a session that wrote points or
+participants of its map commits; services/change_feed.py delivers the map
+ids. Each worker process keeps its own cache, so entries also expire after
+SCOREBOARD_CACHE_TTL_SECONDS to pick up writes made by other processes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from sqlalchemy import and_
+from sqlmodel import Session, select, func
+from backend.core.config import settings
+from backend.models import MapParticipant, Point, User
+from backend.services.change_feed import change_feed
+
+
+def query_scoreboard(session: Session, map_id: int) -> List[dict]:
+    """Visible point counts and distinct places per participant, ranked by points."""
+    points = func.count(Point.id)
+    rows = session.exec(
+        select(
+            MapParticipant.user_id,
+            User.username,
+            MapParticipant.role,
+            MapParticipant.assigned_color,
+            points.label("points"),
+            func.count(func.distinct(Point.city_id)).label("unique_cities"),
+            func.count(func.distinct(Point.country_id)).label("unique_countries"),
+            func.count(func.distinct(Point.continent_id)).label("unique_continents"),
+            func.rank().over(order_by=points.desc()).label("rank"),
+        )
+        .join(User, User.id == MapParticipant.user_id)
+        .outerjoin(Point, and_(
+            Point.map_id == MapParticipant.map_id,
+            Point.user_id == MapParticipant.user_id,
+            Point.hidden_at.is_(None),
+        ))
+        .where(MapParticipant.map_id == map_id)
+        .group_by(MapParticipant.user_id, User.username, MapParticipant.role, MapParticipant.assigned_color)
+        .order_by(points.desc(), MapParticipant.user_id)
+    ).all()
+    return [dict(row._mapping) for row in rows]
+
+
+class ScoreboardCache:
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # map_id -> (expires_at, scoreboard)
+        self._entries: OrderedDict[int, Tuple[float, List[dict]]] = OrderedDict()
+        # Bumped on every invalidation, so a query that raced a write is not stored
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, session: Session, map_id: int) -> List[dict]:
+        with self._lock:
+            entry = self._entries.get(map_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(map_id)
+                self.counters["hits"] += 1
+                return entry[1]
+            self.counters["misses"] += 1
+            generation = self._generations.get(map_id, 0)
+
+        scoreboard = query_scoreboard(session, map_id)
+        with self._lock:
+            if self._generations.get(map_id, 0) == generation:
+                self._entries[map_id] = (time.monotonic() + self.ttl_seconds, scoreboard)
+                self._entries.move_to_end(map_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return scoreboard
+
+    def invalidate(self, *map_ids: int):
+        with self._lock:
+            for map_id in map_ids:
+                self._generations[map_id] = self._generations.get(map_id, 0) + 1
+                if self._entries.pop(map_id, None) is not None:
+                    self.counters["invalidations"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._entries)
+        return stats
+
+
+scoreboard_cache = ScoreboardCache(
+    max_entries=settings.SCOREBOARD_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.SCOREBOARD_CACHE_TTL_SECONDS,
+)
+
+change_feed.subscribe(
+    "scoreboard",
+    collect=lambda session, changes: {
+        obj.map_id for obj, _ in changes if isinstance(obj, (Point, MapParticipant)) and obj.map_id is not None
+    },
+    apply=lambda map_ids: scoreboard_cache.invalidate(*set(map_ids)),
+)
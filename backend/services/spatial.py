@@ -0,0 +1,99 @@
+"""Quadkey cells for viewport (bounding-box) point queries.
+
+Every point stores the Web Mercator tile containing it at CELL_ZOOM as an
+integer quadkey: the bits of the tile x and y interleaved, so all cells inside
+a tile at a lower zoom form one contiguous integer range. A bounding box is
+covered by at most MAX_COVER_TILES tiles at the deepest zoom that allows it,
+and the tiles' ranges become range scans on the (map_id, cell) index. Exact
+latitude and longitude bounds then drop the few points outside the box.
+"""
+import math
+from typing import List, Tuple
+
+from sqlalchemy import and_, event, or_
+
+from backend.models import Point
+
+CELL_ZOOM = 15  # ~1.2 km tiles at the equator; 30-bit cells fit a 32-bit integer
+MAX_COVER_TILES = 16
+MAX_LATITUDE = 85.05112878  # Web Mercator limit; points beyond it share the edge cells
+
+
+def mercator_xy(lat: float, lng: float, zoom: int) -> Tuple[float, float]:
+    """Position in tile units at zoom: the integer parts are the tile, y grows southwards."""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    n = 1 << zoom
+    return (lng + 180.0) / 360.0 * n, (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+
+
+def tile_xy(lat: float, lng: float, zoom: int) -> Tuple[int, int]:
+    n = 1 << zoom
+    x, y = mercator_xy(lat, lng, zoom)
+    return min(max(int(x), 0), n - 1), min(max(int(y), 0), n - 1)
+
+
+def tile_bounds(zoom: int, x0: float, y0: float, x1: float, y1: float) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lng, max_lat, max_lng) of the area between tile positions (x0, y0) and (x1, y1)."""
+    n = 1 << zoom
+    x0, x1 = max(x0, 0.0), min(x1, float(n))
+    y0, y1 = max(y0, 0.0), min(y1, float(n))
+
+    def lat(y: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * y / n))))
+
+    # Edge tiles also hold the points beyond the Web Mercator limit
+    min_lat = -90.0 if y1 >= n else lat(y1)
+    max_lat = 90.0 if y0 <= 0 else lat(y0)
+    return min_lat, x0 / n * 360.0 - 180.0, max_lat, x1 / n * 360.0 - 180.0
+
+
+def quadkey(x: int, y: int, zoom: int) -> int:
+    key = 0
+    for bit in range(zoom - 1, -1, -1):
+        key = (key << 2) | (((y >> bit) & 1) << 1) | ((x >> bit) & 1)
+    return key
+
+
+def cell_for(lat: float, lng: float) -> int:
+    return quadkey(*tile_xy(lat, lng, CELL_ZOOM), CELL_ZOOM)
+
+
+def cell_ranges(min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> List[Tuple[int, int]]:
+    """Inclusive cell ranges covering a box that does not cross the antimeridian."""
+    for zoom in range(CELL_ZOOM, -1, -1):
+        # Tile y grows southwards
+        x0, y0 = tile_xy(max_lat, min_lng, zoom)
+        x1, y1 = tile_xy(min_lat, max_lng, zoom)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= MAX_COVER_TILES:
+            break
+    shift = 2 * (CELL_ZOOM - zoom)
+    starts = sorted(quadkey(x, y, zoom) << shift for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+
+    ranges: List[Tuple[int, int]] = []
+    for start in starts:
+        end = start + (1 << shift) - 1
+        if ranges and ranges[-1][1] + 1 == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def bbox_condition(map_id: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+    """WHERE clause for a map's points inside the box; min_lng > max_lng means it crosses the antimeridian."""
+    boxes = [(min_lng, max_lng)] if min_lng <= max_lng else [(min_lng, 180.0), (-180.0, max_lng)]
+    parts = []
+    for west, east in boxes:
+        # map_id repeated in every branch so SQLite runs one index range scan per branch
+        parts.extend(
+            and_(Point.map_id == map_id, Point.cell.between(start, end), Point.longitude.between(west, east))
+            for start, end in cell_ranges(min_lat, west, max_lat, east)
+        )
+    return and_(Point.latitude.between(min_lat, max_lat), or_(*parts))
+
+
+@event.listens_for(Point, "before_insert")
+@event.listens_for(Point, "before_update")
+def _set_cell(mapper, connection, point):
+    if point.latitude is not None and point.longitude is not None:
+        point.cell = cell_for(point.latitude, point.longitude)
@@ -0,0 +1,79 @@
+"""Deterministic stand-in for Nominatim's /reverse and /search, for tests and benchmarks.
+
+    uvicorn backend.services.stub_geocoder:app --port 8399
+    GEOCODER_PROVIDERS=stub   (or "stub,nominatim" to exercise failover)
+
+Answers depend only on the request, so runs are reproducible. Latency, slow
+tail and error share are set with the STUB_GEOCODER_* settings; which
+requests are slow or fail is chosen by a hash of the request sequence number,
+not randomly, so a retried or hedged request usually lands elsewhere.
+"""
+import asyncio
+import itertools
+import zlib
+
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+from backend.core.config import settings
+
+# (country, ISO code) picked per 10° cell
+COUNTRIES = [
+    ("Italy", "it"), ("France", "fr"), ("Germany", "de"), ("Spain", "es"), ("Japan", "jp"),
+    ("Brazil", "br"), ("Canada", "ca"), ("Kenya", "ke"), ("Australia", "au"), ("India", "in"),
+]
+
+app = FastAPI(title="Stub geocoder")
+
+request_counter = itertools.count()
+
+
+def _bucket(*parts) -> float:
+    """Stable value in [0, 1) for a request."""
+    return zlib.crc32(":".join(str(part) for part in parts).encode()) / 2**32
+
+
+async def _simulate():
+    sequence = next(request_counter)
+    if settings.STUB_GEOCODER_LATENCY_SECONDS:
+        await asyncio.sleep(settings.STUB_GEOCODER_LATENCY_SECONDS)
+    if _bucket("slow", sequence) < settings.STUB_GEOCODER_SLOW_RATIO:
+        await asyncio.sleep(settings.STUB_GEOCODER_SLOW_SECONDS)
+    if _bucket("error", sequence) < settings.STUB_GEOCODER_ERROR_RATIO:
+        return JSONResponse({"error": "Simulated outage"}, status_code=503)
+    return None
+
+
+def _address(lat: float, lon: float) -> dict:
+    country, code = COUNTRIES[(int(lat // 10) * 37 + int(lon // 10)) % len(COUNTRIES)]
+    return {
+        "city": f"Stub City {int(lat // 0.1)}/{int(lon // 0.1)}",
+        "state": f"Stub Region {int(lat)}/{int(lon)}",
+        "country": country,
+        "country_code": code,
+    }
+
+
+@app.get("/reverse")
+async def reverse(lat: float, lon: float):
+    error = await _simulate()
+    if error:
+        return error
+    address = _address(lat, lon)
+    return {"lat": str(lat), "lon": str(lon), "display_name": f"{address['city']}, {address['country']}",
+            "address": address}
+
+
+@app.get("/search")
+async def search(q: str, limit: int = Query(5, ge=1, le=50)):
+    error = await _simulate()
+    if error:
+        return error
+    results = []
+    for rank in range(min(limit, 3)):
+        # Spread matches for the same query over the globe, deterministically
+        lat = round(_bucket(q, rank, "lat") * 140 - 60, 5)
+        lon = round(_bucket(q, rank, "lon") * 360 - 180, 5)
+        address = dict(_address(lat, lon), city=q if rank == 0 else f"{q} {rank + 1}")
+        results.append({"lat": str(lat), "lon": str(lon), "display_name": f"{address['city']}, {address['country']}",
+                        "address": address})
+    return results
@@ -0,0 +1,9 @@
+"""Text normalization shared by place-name lookups."""
+import unicodedata
+
+
+def fold_text(value: str) -> str:
+    """Case-, accent- and whitespace-insensitive form of a name ("  São  Paulo" -> "sao paulo")."""
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())
@@ -0,0 +1,198 @@
+"""Time-bucketed point counts and first visits for a user or a map.
+
+Counts are grouped in SQL on Point.timestamp, with a bucket expression per
+dialect, over the (user_id, timestamp) and (map_id, timestamp) indexes.
+Buckets before the current one are closed: their counts and the first visits
+in them are cached per scope and granularity, and a request only queries the
+current bucket (plus any buckets closed since the entry was built).
+
+New points always land in the current bucket. Deleting, hiding or
+re-geocoding a point can change closed buckets, so a commit that does so
+drops the cached timelines of the point's user and map.
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlmodel import Session, select, func
+from backend.core.config import settings
+from backend.models import Place, Point
+from backend.services.change_feed import change_feed
+
+SCOPES = {"user": Point.user_id, "map": Point.map_id}
+# Place kinds with first-visit events, and their counter in each bucket
+EVENT_KINDS = {"country": "new_countries", "city": "new_cities"}
+
+
+def bucket_start(moment: datetime, bucket: str) -> datetime:
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    if bucket == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+
+def bucket_expression(dialect: str, bucket: str):
+    """SQL expression giving the bucket start of Point.timestamp as 'YYYY-MM-DD'; weeks start on Monday."""
+    if dialect == "postgresql":
+        return func.to_char(func.date_trunc(bucket, Point.timestamp), "YYYY-MM-DD")
+    if bucket == "week":
+        return func.date(Point.timestamp, "weekday 0", "-6 days")
+    if bucket == "month":
+        return func.strftime("%Y-%m-01", Point.timestamp)
+    if bucket == "year":
+        return func.strftime("%Y-01-01", Point.timestamp)
+    return func.date(Point.timestamp)
+
+
+@dataclass
+class ClosedBuckets:
+    until: datetime  # Start of the first bucket not included
+    points: Dict[str, int] = field(default_factory=dict)
+    # kind -> place_id -> (first visit, place name)
+    first_visits: Dict[str, Dict[int, Tuple[datetime, str]]] = field(
+        default_factory=lambda: {kind: {} for kind in EVENT_KINDS}
+    )
+
+
+class TimelineCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Tuple[str, int, str], ClosedBuckets] = OrderedDict()
+        # Bumped on every invalidation, so an entry built before a write is not stored
+        self._generations: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "extended": 0, "misses": 0, "invalidations": 0}
+
+    def timeline(self, session: Session, scope: str, scope_id: int, bucket: str) -> dict:
+        current = bucket_start(datetime.utcnow(), bucket)
+        key = (scope, scope_id, bucket)
+        with self._lock:
+            closed = self._entries.get(key)
+            if closed is not None:
+                self._entries.move_to_end(key)
+            generation = self._generations.get(key[:2], 0)
+
+        if closed is None:
+            self.counters["misses"] += 1
+            closed = ClosedBuckets(until=datetime.min)
+        else:
+            self.counters["hits" if closed.until >= current else "extended"] += 1
+        if closed.until < current:
+            # Buckets closed since the entry was built; never modify a shared entry in place
+            closed = _extend(session, closed, scope, scope_id, bucket, current)
+            self._store(key, closed, generation)
+
+        open_part = _extend(session, ClosedBuckets(until=current), scope, scope_id, bucket, None, seen=closed)
+        return _render(bucket, closed, open_part)
+
+    def invalidate(self, scope: str, scope_id: int):
+        with self._lock:
+            self._generations[(scope, scope_id)] = self._generations.get((scope, scope_id), 0) + 1
+            for key in [key for key in self._entries if key[:2] == (scope, scope_id)]:
+                del self._entries[key]
+                self.counters["invalidations"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def _store(self, key, closed: ClosedBuckets, generation: int):
+        with self._lock:
+            if self._generations.get(key[:2], 0) != generation:
+                return
+            self._entries[key] = closed
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _extend(session: Session, base: ClosedBuckets, scope: str, scope_id: int, bucket: str,
+            until: Optional[datetime], seen: Optional[ClosedBuckets] = None) -> ClosedBuckets:
+    """Counts and first visits from base.until up to until (None: no upper bound), added to a copy of base.
+
+    Places already first visited in seen (default: base) produce no event.
+    """
+    seen = seen or base
+    scope_column = SCOPES[scope]
+    conditions = [scope_column == scope_id, Point.hidden_at.is_(None), Point.timestamp >= base.until]
+    if until is not None:
+        conditions.append(Point.timestamp < until)
+
+    result = ClosedBuckets(
+        until=until or base.until,
+        points=dict(base.points),
+        first_visits={kind: dict(visits) for kind, visits in base.first_visits.items()},
+    )
+    expression = bucket_expression(session.get_bind().dialect.name, bucket)
+    for start, count in session.exec(
+        select(expression, func.count()).where(*conditions).group_by(expression)
+    ).all():
+        result.points[start] = result.points.get(start, 0) + count
+
+    for kind in EVENT_KINDS:
+        column = getattr(Point, f"{kind}_id")
+        firsts = session.exec(
+            select(column, func.min(Point.timestamp), Place.name)
+            .join(Place, Place.id == column)
+            .where(*conditions)
+            .group_by(column, Place.name)
+        ).all()
+        for place_id, first_visit, name in firsts:
+            if place_id not in seen.first_visits[kind]:
+                result.first_visits[kind][place_id] = (first_visit, name)
+    return result
+
+
+def _render(bucket: str, closed: ClosedBuckets, open_part: ClosedBuckets) -> dict:
+    buckets: Dict[str, dict] = {}
+
+    def bucket_entry(start: str) -> dict:
+        return buckets.setdefault(start, {"start": start, "points": 0, **{name: 0 for name in EVENT_KINDS.values()}})
+
+    for part in (closed, open_part):
+        for start, count in part.points.items():
+            bucket_entry(start)["points"] += count
+
+    events: List[dict] = []
+    for kind, counter in EVENT_KINDS.items():
+        visits = {**closed.first_visits[kind], **open_part.first_visits[kind]}
+        for place_id, (first_visit, name) in visits.items():
+            bucket_entry(bucket_start(first_visit, bucket).strftime("%Y-%m-%d"))[counter] += 1
+            events.append({"kind": kind, "place_id": place_id, "name": name, "timestamp": first_visit})
+
+    return {
+        "bucket": bucket,
+        "buckets": [buckets[start] for start in sorted(buckets)],
+        "first_visits": sorted(events, key=lambda event: (event["timestamp"], event["kind"])),
+    }
+
+
+timeline_cache = TimelineCache(max_entries=settings.TIMELINE_CACHE_MAX_ENTRIES)
+
+
+def _changed_scopes(session, changes) -> set:
+    # New points fall in the current bucket, which is never cached
+    scopes = set()
+    for point, change in changes:
+        if isinstance(point, Point) and change != "new":
+            if point.user_id is not None:
+                scopes.add(("user", point.user_id))
+            if point.map_id is not None:
+                scopes.add(("map", point.map_id))
+    return scopes
+
+
+def _invalidate(scopes: list):
+    for scope, scope_id in set(scopes):
+        timeline_cache.invalidate(scope, scope_id)
+
+
+change_feed.subscribe("timeline", collect=_changed_scopes, apply=_invalidate)
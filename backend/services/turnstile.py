@@ -1,5 +1,5 @@
 """Cloudflare Turnstile captcha verification service."""
-import httpx
+from backend.services.http_client import http_clients
 from backend.core.config import settings
 
 TURNSTILE_VERIFY_URL = "https://challenges.cloudflare.com/turnstile/v0/siteverify"
@@ -28,11 +28,11 @@ async def verify_turnstile(token: str, remote_ip: str | None = None) -> bool:
     if remote_ip:
         payload["remoteip"] = remote_ip
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(TURNSTILE_VERIFY_URL, data=payload)
-            result = response.json()
-            return result.get("success", False)
-        except Exception:
-            # If verification fails due to network error, deny access
-            return False
+    client = http_clients.get("turnstile")
+    try:
+        response = await client.post(TURNSTILE_VERIFY_URL, data=payload)
+        result = response.json()
+        return result.get("success", False)
+    except Exception:
+        # If verification fails due to network error, deny access
+        return False
@@ -0,0 +1,202 @@
+"""Incrementally maintained per-user stats (the userstats and userplacecount tables).
+
+Every write that changes a user's visible points reports the change here in
+the same transaction: userplacecount keeps the number of visible points per
+user and place, and the userstats row is refreshed from it. Reading stats is
+then a single primary-key lookup. Badges follow the new counts in the same
+transaction (services/achievements.py). rebuild_user_stats recomputes both
+tables from the point table to repair drift.
+
+Hooks take the point state before and after a change, so callers snapshot a
+point before editing it:
+
+    before = snapshot(point)
+    apply_location(point, geo)
+    point_updated(session, point, before)
+"""
+import json
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from backend.models import Place, Point, User, UserPlaceCount, UserStats
+from backend.services.rank_index import METRICS, stage_update
+
+# Place kind -> stats field prefix
+KIND_FIELDS = {"city": "cities", "region": "regions", "country": "countries", "continent": "continents"}
+
+
+class Contribution(NamedTuple):
+    user_id: int
+    places: Tuple[Tuple[int, str], ...]  # (place_id, kind)
+
+
+def snapshot(point) -> Optional[Contribution]:
+    """What a point adds to its owner's stats; None when it is hidden."""
+    if point.hidden_at is not None or point.user_id is None:
+        return None
+    places = tuple(
+        (getattr(point, f"{kind}_id"), kind) for kind in KIND_FIELDS if getattr(point, f"{kind}_id") is not None
+    )
+    return Contribution(point.user_id, places)
+
+
+def point_added(session, *points):
+    """New or restored points."""
+    record_change(session, [], [snapshot(point) for point in points])
+
+
+def point_removed(session, *points):
+    """Points about to be deleted or hidden; call before the change."""
+    record_change(session, [snapshot(point) for point in points], [])
+
+
+def point_updated(session, point, before: Optional[Contribution]):
+    record_change(session, [before], [snapshot(point)])
+
+
+def record_change(connection, before: Iterable[Optional[Contribution]], after: Iterable[Optional[Contribution]]):
+    """Apply the difference between two sets of contributions. Works on a Session or a Connection."""
+    point_deltas: Counter = Counter()
+    place_deltas: Counter = Counter()
+    for sign, contributions in ((-1, before), (1, after)):
+        for contribution in contributions:
+            if contribution is None:
+                continue
+            point_deltas[contribution.user_id] += sign
+            for place_id, kind in contribution.places:
+                place_deltas[(contribution.user_id, place_id, kind)] += sign
+
+    users = {user_id for user_id, delta in point_deltas.items() if delta}
+    users |= {user_id for (user_id, _, _), delta in place_deltas.items() if delta}
+    if not users:
+        return
+
+    for user_id in users:
+        _ensure_row(connection, user_id)
+        if point_deltas[user_id]:
+            connection.execute(
+                update(UserStats).where(UserStats.user_id == user_id)
+                .values(total_points=UserStats.total_points + point_deltas[user_id])
+            )
+
+    for (user_id, place_id, kind), delta in place_deltas.items():
+        if not delta:
+            continue
+        if not _add_place_points(connection, user_id, place_id, delta) and delta > 0:
+            try:
+                # Savepoint so a concurrent first point at the same place does not abort the caller
+                with connection.begin_nested():
+                    connection.execute(
+                        insert(UserPlaceCount).values(user_id=user_id, place_id=place_id, kind=kind, points=delta)
+                    )
+            except IntegrityError:
+                _add_place_points(connection, user_id, place_id, delta)
+
+    connection.execute(
+        delete(UserPlaceCount).where(UserPlaceCount.user_id.in_(users), UserPlaceCount.points <= 0)
+    )
+    for user_id in users:
+        _refresh_summary(connection, user_id)
+    _stage_rank_updates(connection, users)
+    _sync_achievements(connection, users, notify=True)
+
+
+def rebuild_user_stats(connection, user_ids: Optional[List[int]] = None) -> int:
+    """Recompute userplacecount and userstats from the point table. Returns the number of users."""
+    if user_ids is None:
+        user_ids = list(connection.execute(select(User.id)).scalars())
+    if not user_ids:
+        return 0
+
+    connection.execute(delete(UserPlaceCount).where(UserPlaceCount.user_id.in_(user_ids)))
+    for kind in KIND_FIELDS:
+        column = getattr(Point, f"{kind}_id")
+        connection.execute(insert(UserPlaceCount).from_select(
+            ["user_id", "place_id", "kind", "points"],
+            select(Point.user_id, column, literal(kind), func.count())
+            .where(Point.user_id.in_(user_ids), Point.hidden_at.is_(None), column.is_not(None))
+            .group_by(Point.user_id, column),
+        ))
+
+    totals = dict(connection.execute(
+        select(Point.user_id, func.count())
+        .where(Point.user_id.in_(user_ids), Point.hidden_at.is_(None))
+        .group_by(Point.user_id)
+    ).all())
+    for user_id in user_ids:
+        _ensure_row(connection, user_id)
+        connection.execute(
+            update(UserStats).where(UserStats.user_id == user_id).values(total_points=totals.get(user_id, 0))
+        )
+        _refresh_summary(connection, user_id)
+    _stage_rank_updates(connection, user_ids)
+    # A repair fixes badges silently; the changes already happened
+    _sync_achievements(connection, user_ids, notify=False)
+    return len(user_ids)
+
+
+def read_user_stats(session, user_id: int) -> dict:
+    """Counts and place name lists for a user, zero when nothing is recorded."""
+    row = session.get(UserStats, user_id)
+    stats = {"total_points": row.total_points if row else 0}
+    for field in KIND_FIELDS.values():
+        names = json.loads(getattr(row, f"{field}_list")) if row else []
+        stats[f"unique_{field}"] = getattr(row, f"unique_{field}") if row else 0
+        stats[f"{field}_list"] = names
+    return stats
+
+
+def _stage_rank_updates(connection, user_ids):
+    """Hand the new scores to the rank index, applied once the transaction commits."""
+    rows = connection.execute(
+        select(UserStats.user_id, *METRICS.values()).where(UserStats.user_id.in_(list(user_ids)))
+    ).all()
+    for row in rows:
+        stage_update(connection, row[0], dict(zip(METRICS, row[1:])))
+
+
+def _sync_achievements(connection, user_ids, notify: bool):
+    # Imported here: services.achievements reads stats through this module
+    from backend.services.achievements import sync_achievements
+
+    sync_achievements(connection, user_ids, notify=notify)
+
+
+def _ensure_row(connection, user_id: int):
+    if connection.execute(select(UserStats.user_id).where(UserStats.user_id == user_id)).first():
+        return
+    try:
+        # Savepoint so a concurrent first write for the same user does not abort the caller
+        with connection.begin_nested():
+            connection.execute(insert(UserStats).values(user_id=user_id, updated_at=datetime.utcnow()))
+    except IntegrityError:
+        pass
+
+
+def _add_place_points(connection, user_id: int, place_id: int, delta: int) -> bool:
+    """Add delta to an existing userplacecount row; False when there is none."""
+    return bool(connection.execute(
+        update(UserPlaceCount)
+        .where(UserPlaceCount.user_id == user_id, UserPlaceCount.place_id == place_id)
+        .values(points=UserPlaceCount.points + delta)
+    ).rowcount)
+
+
+def _refresh_summary(connection, user_id: int):
+    """Rewrite the distinct counts and name lists from the user's userplacecount rows."""
+    names = {kind: [] for kind in KIND_FIELDS}
+    for kind, name in connection.execute(
+        select(UserPlaceCount.kind, Place.name)
+        .join(Place, Place.id == UserPlaceCount.place_id)
+        .where(UserPlaceCount.user_id == user_id)
+    ).all():
+        names[kind].append(name)
+
+    values = {"updated_at": datetime.utcnow()}
+    for kind, field in KIND_FIELDS.items():
+        values[f"unique_{field}"] = len(names[kind])
+        values[f"{field}_list"] = json.dumps(sorted(names[kind]))
+    connection.execute(update(UserStats).where(UserStats.user_id == user_id).values(**values))
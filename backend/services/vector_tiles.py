@@ -0,0 +1,358 @@
+"""Mapbox Vector Tiles (MVT 2.1) of a map's points and routes, cached per tile.
+
+Each tile has a "points" layer (point id, user_id, category and the
+participant's colour) and a "routes" layer (route lines with the same
+colour). Tiles holding more than TILE_MAX_POINTS visible points carry a
+"clusters" layer from services/clustering.py instead of "points", so every
+tile stays small however large the map is. The protobuf encoding is written
+out here; the format needs only varints and length-delimited fields.
+
+Tiles are cached per (map, z, x, y) with the map version they were rendered
+at. Every commit that changes a map's points, routes or participant colours
+bumps the version and logs the areas it touched (services/change_feed.py
+delivers them). A cached tile from an older version is served as is when no
+logged area since its version overlaps it, so an edit only re-renders the
+tiles around it. Tiles older than the log, or than TILE_CACHE_TTL_SECONDS
+(writes made by other worker processes), are rendered again.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, inspect, not_, or_
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+from backend.core.config import settings
+from backend.models import MapParticipant, Point, Route
+from backend.services.change_feed import change_feed
+from backend.services.clustering import cluster_cache
+from backend.services.spatial import bbox_condition, mercator_xy, tile_bounds
+
+EXTENT = 4096
+BUFFER = 64  # Tile units drawn beyond each edge, so symbols and lines are not cut at tile borders
+MAX_ZOOM = 22
+MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+ROUTE_COLOR = "#808080"  # As in GET /maps/{map_id}/routes, for routes of former participants
+
+POINT, LINESTRING = 1, 2
+MOVE_TO, LINE_TO = 1, 2
+
+Bounds = Tuple[float, float, float, float]  # (min_lat, min_lng, max_lat, max_lng)
+POINT_FIELDS = ("map_id", "user_id", "latitude", "longitude", "category", "hidden_at")
+
+
+# --- Protobuf encoding of vector_tile.proto ---
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _uint_field(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+
+def _bytes_field(number: int, payload: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _packed_field(number: int, values: List[int]) -> bytes:
+    return _bytes_field(number, b"".join(_varint(value) for value in values))
+
+
+def _value(value) -> bytes:
+    if isinstance(value, int):
+        return _uint_field(5, value) if value >= 0 else _uint_field(6, _zigzag(value))
+    return _bytes_field(1, str(value).encode())
+
+
+class Layer:
+    def __init__(self, name: str):
+        self.name = name
+        self.features: List[bytes] = []
+        self.keys: Dict[str, int] = {}
+        self.values: Dict[Tuple[type, object], int] = {}
+
+    def add(self, feature_id: int, geometry_type: int, geometry: List[int], properties: dict):
+        tags = []
+        for key, value in properties.items():
+            if value is not None:
+                tags.append(self.keys.setdefault(key, len(self.keys)))
+                # Keyed with the type so 1 and "1" stay distinct values
+                tags.append(self.values.setdefault((type(value), value), len(self.values)))
+        self.features.append(
+            _uint_field(1, feature_id) + _packed_field(2, tags)
+            + _uint_field(3, geometry_type) + _packed_field(4, geometry)
+        )
+
+    def encode(self) -> bytes:
+        return _bytes_field(3, b"".join([
+            _uint_field(15, 2),
+            _bytes_field(1, self.name.encode()),
+            *(_bytes_field(2, feature) for feature in self.features),
+            *(_bytes_field(3, key.encode()) for key in self.keys),
+            *(_bytes_field(4, _value(value)) for _, value in self.values),
+            _uint_field(5, EXTENT),
+        ]))
+
+
+def _command(command: int, count: int) -> int:
+    return command | count << 3
+
+
+def _point_geometry(x: int, y: int) -> List[int]:
+    return [_command(MOVE_TO, 1), _zigzag(x), _zigzag(y)]
+
+
+def _line_geometry(coordinates: List[Tuple[int, int]]) -> Optional[List[int]]:
+    """MoveTo the first vertex, then LineTo the others; None when the line has no length."""
+    (x, y), steps = coordinates[0], []
+    for next_x, next_y in coordinates[1:]:
+        if (next_x, next_y) != (x, y):
+            steps += [_zigzag(next_x - x), _zigzag(next_y - y)]
+            x, y = next_x, next_y
+    if not steps:
+        return None
+    return [_command(MOVE_TO, 1), _zigzag(coordinates[0][0]), _zigzag(coordinates[0][1]),
+            _command(LINE_TO, len(steps) // 2), *steps]
+
+
+# --- Rendering ---
+
+def buffered_bounds(z: int, x: int, y: int) -> Bounds:
+    margin = BUFFER / EXTENT
+    return tile_bounds(z, x - margin, y - margin, x + 1 + margin, y + 1 + margin)
+
+
+def render_tile(session: Session, map_id: int, z: int, x: int, y: int) -> bytes:
+    bounds = buffered_bounds(z, x, y)
+
+    def position(lat: float, lng: float) -> Tuple[int, int]:
+        tile_x, tile_y = mercator_xy(lat, lng, z)
+        return round((tile_x - x) * EXTENT), round((tile_y - y) * EXTENT)
+
+    layers = [_points_layer(session, map_id, z, bounds, position), _routes_layer(session, map_id, bounds, position)]
+    return b"".join(layer.encode() for layer in layers if layer.features)
+
+
+def _points_layer(session: Session, map_id: int, z: int, bounds: Bounds, position) -> Layer:
+    rows = session.exec(
+        select(Point.id, Point.user_id, Point.latitude, Point.longitude, Point.category, MapParticipant.assigned_color)
+        .outerjoin(MapParticipant, and_(
+            MapParticipant.map_id == Point.map_id, MapParticipant.user_id == Point.user_id,
+        ))
+        .where(Point.hidden_at.is_(None), bbox_condition(map_id, *bounds))
+        .limit(settings.TILE_MAX_POINTS + 1)
+    ).all()
+    if len(rows) <= settings.TILE_MAX_POINTS:
+        layer = Layer("points")
+        for point_id, user_id, lat, lng, category, color in rows:
+            layer.add(point_id, POINT, _point_geometry(*position(lat, lng)),
+                      {"user_id": user_id, "category": category, "color": color})
+        return layer
+
+    layer = Layer("clusters")
+    # Clusters at zoom z + 2 give 16 x 16 clusters per tile
+    for index, cluster in enumerate(cluster_cache.tree(session, map_id).clusters(*bounds, zoom=z + 2)["clusters"], 1):
+        categories = cluster["categories"]
+        layer.add(index, POINT, _point_geometry(*position(cluster["latitude"], cluster["longitude"])),
+                  {"count": cluster["count"], "category": max(categories, key=categories.get)})
+    return layer
+
+
+def _routes_layer(session: Session, map_id: int, bounds: Bounds, position) -> Layer:
+    min_lat, min_lng, max_lat, max_lng = bounds
+    start, end = aliased(Point), aliased(Point)
+    rows = session.exec(
+        select(Route.id, Route.user_id, start.latitude, start.longitude, end.latitude, end.longitude,
+               MapParticipant.assigned_color)
+        .join(start, start.id == Route.start_point_id)
+        .join(end, end.id == Route.end_point_id)
+        .outerjoin(MapParticipant, and_(
+            MapParticipant.map_id == Route.map_id, MapParticipant.user_id == Route.user_id,
+        ))
+        .where(
+            Route.map_id == map_id,
+            # The line's bounding box overlaps the tile
+            not_(and_(start.latitude > max_lat, end.latitude > max_lat)),
+            not_(and_(start.latitude < min_lat, end.latitude < min_lat)),
+            not_(and_(start.longitude > max_lng, end.longitude > max_lng)),
+            not_(and_(start.longitude < min_lng, end.longitude < min_lng)),
+        )
+    ).all()
+    layer = Layer("routes")
+    for route_id, user_id, start_lat, start_lng, end_lat, end_lng, color in rows:
+        geometry = _line_geometry([position(start_lat, start_lng), position(end_lat, end_lng)])
+        if geometry is not None:
+            layer.add(route_id, LINESTRING, geometry, {"user_id": user_id, "color": color or ROUTE_COLOR})
+    return layer
+
+
+# --- Cache ---
+
+def _overlaps(a: Bounds, b: Bounds) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+@dataclass
+class CachedTile:
+    version: int
+    expires_at: float
+    data: bytes
+    etag: str
+
+
+class TileCache:
+    def __init__(self, max_entries: int, ttl_seconds: int, edit_log_size: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.edit_log_size = edit_log_size
+        self._tiles: OrderedDict[Tuple[int, int, int, int], CachedTile] = OrderedDict()
+        self._versions: Dict[int, int] = {}
+        # map_id -> (version, areas touched by that commit; None for the whole map)
+        self._edits: Dict[int, Deque[Tuple[int, List[Optional[Bounds]]]]] = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "revalidated": 0, "misses": 0, "commits": 0}
+
+    def get(self, session: Session, map_id: int, z: int, x: int, y: int) -> CachedTile:
+        key = (map_id, z, x, y)
+        with self._lock:
+            version = self._versions.get(map_id, 0)
+            tile = self._tiles.get(key)
+            if tile is not None and tile.expires_at > time.monotonic():
+                if tile.version == version or not self._touched(key, tile.version):
+                    self.counters["hits" if tile.version == version else "revalidated"] += 1
+                    tile.version = version
+                    self._tiles.move_to_end(key)
+                    return tile
+            self.counters["misses"] += 1
+
+        # Stored with the version read above: edits committed while rendering
+        # have a later version and are checked on the next request
+        data = render_tile(session, map_id, z, x, y)
+        tile = CachedTile(version, time.monotonic() + self.ttl_seconds, data,
+                          f'"mvt-{hashlib.sha1(data).hexdigest()}"')
+        with self._lock:
+            current = self._tiles.get(key)
+            if current is None or current.version <= version:
+                self._tiles[key] = tile
+                self._tiles.move_to_end(key)
+                while len(self._tiles) > self.max_entries:
+                    self._tiles.popitem(last=False)
+        return tile
+
+    def _touched(self, key: Tuple[int, int, int, int], since: int) -> bool:
+        """Whether a commit after version since changed the tile's area (called with the lock held)."""
+        map_id, z, x, y = key
+        edits = self._edits.get(map_id)
+        if not edits or edits[0][0] > since + 1:
+            return True  # The log no longer reaches back to the tile's version
+        area = buffered_bounds(z, x, y)
+        return any(
+            edited is None or _overlaps(edited, area)
+            for version, areas in edits if version > since
+            for edited in areas
+        )
+
+    def record(self, edits: List[Tuple[int, Optional[Bounds]]]):
+        """Log one commit's (map_id, area) edits; an area of None covers the whole map."""
+        by_map: Dict[int, List[Optional[Bounds]]] = {}
+        for map_id, area in edits:
+            by_map.setdefault(map_id, []).append(area)
+        with self._lock:
+            for map_id, areas in by_map.items():
+                version = self._versions.get(map_id, 0) + 1
+                self._versions[map_id] = version
+                self._edits.setdefault(map_id, deque(maxlen=self.edit_log_size)).append((version, areas))
+                self.counters["commits"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._tiles)
+            stats["bytes"] = sum(len(tile.data) for tile in self._tiles.values())
+        return stats
+
+
+tile_cache = TileCache(
+    max_entries=settings.TILE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.TILE_CACHE_TTL_SECONDS,
+    edit_log_size=settings.TILE_EDIT_LOG_SIZE,
+)
+
+
+# --- Edit tracking ---
+
+def _point_state(point: Point, before: bool) -> Tuple:
+    """POINT_FIELDS before or after the pending flush."""
+    state = inspect(point)
+    values = []
+    for name in POINT_FIELDS:
+        history = state.attrs[name].history
+        values.append(history.deleted[0] if before and history.deleted else getattr(point, name))
+    return tuple(values)
+
+
+def _changed(obj, name: str) -> bool:
+    return inspect(obj).attrs[name].history.has_changes()
+
+
+def _collect_edits(session, changes) -> List[Tuple[int, Optional[Bounds]]]:
+    edits: List[Tuple[int, Optional[Bounds]]] = []
+    # point id -> positions before and after the flush, for the routes attached to it
+    positions: Dict[int, List[Tuple[float, float]]] = {}
+    moved = set()
+    routes = []
+
+    def touch(map_id, *coordinates):
+        if map_id is not None and coordinates:
+            lats, lngs = [lat for lat, _ in coordinates], [lng for _, lng in coordinates]
+            edits.append((map_id, (min(lats), min(lngs), max(lats), max(lngs))))
+
+    for obj, change in changes:
+        if isinstance(obj, Point):
+            if change == "dirty":
+                old, new = _point_state(obj, before=True), _point_state(obj, before=False)
+                states = [old, new] if old != new else []
+                if old[2:4] != new[2:4]:
+                    moved.add(obj.id)
+            else:
+                states = [_point_state(obj, before=change == "deleted")]
+            for map_id, _, lat, lng, _, _ in states:
+                touch(map_id, (lat, lng))
+                positions.setdefault(obj.id, []).append((lat, lng))
+        elif isinstance(obj, Route):
+            routes.append((obj.map_id, obj.start_point_id, obj.end_point_id))
+        elif isinstance(obj, MapParticipant) and obj.map_id is not None:
+            if change != "dirty" or _changed(obj, "assigned_color"):
+                edits.append((obj.map_id, None))
+
+    if moved:
+        routes += session.connection().execute(
+            select(Route.map_id, Route.start_point_id, Route.end_point_id)
+            .where(or_(Route.start_point_id.in_(moved), Route.end_point_id.in_(moved)))
+        ).all()
+    if routes:
+        missing = {point_id for _, start, end in routes for point_id in (start, end) if point_id not in positions}
+        if missing:
+            for point_id, lat, lng in session.connection().execute(
+                select(Point.id, Point.latitude, Point.longitude).where(Point.id.in_(missing))
+            ).all():
+                positions[point_id] = [(lat, lng)]
+        for map_id, start, end in routes:
+            touch(map_id, *positions.get(start, []), *positions.get(end, []))
+    return edits
+
+
+change_feed.subscribe("tiles", collect=_collect_edits, apply=tile_cache.record)
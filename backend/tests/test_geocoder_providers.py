@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import httpx
+from backend.services import geocoding  # noqa: F401  Loaded by the app before any lookup
+from backend.services.circuit_breaker import CircuitBreaker
+from backend.services.geocoder_providers import FailoverProvider, GeocodingError, NominatimProvider
+from backend.services.http_client import http_clients
+from backend.services.rate_limit import AsyncRateLimiter
+
+
+def test_rate_limit_queueing_does_not_trip_breaker():
+    # An instant upstream behind a 10 rps limiter: 12 concurrent lookups queue
+    # for up to 1.1 s, far past the 0.2 s slow-call threshold, yet every call
+    # itself is fast
+    def answer(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"address": {"city": "Paris", "country": "France"}})
+
+    async def run():
+        http_clients._clients["test-upstream"] = httpx.AsyncClient(transport=httpx.MockTransport(answer))
+        provider = NominatimProvider("test", "http://upstream.test", "test-upstream", AsyncRateLimiter(10))
+        provider.breaker = CircuitBreaker("test", failure_threshold=3, slow_call_seconds=0.2, reset_seconds=30)
+        geocoder = FailoverProvider([provider])
+        try:
+            locations = await asyncio.gather(*(geocoder.reverse(48.85, 2.35) for _ in range(12)))
+        finally:
+            await http_clients._clients.pop("test-upstream").aclose()
+        return provider, locations
+
+    provider, locations = asyncio.run(run())
+
+    assert all(location["city"] == "Paris" for location in locations)
+    assert provider.limiter.waits >= 10
+    stats = provider.breaker.get_stats()
+    assert stats["state"] == "closed"
+    assert stats["slow_calls"] == 0
+    assert max(provider.latencies) < 0.2
+
+
+def test_open_breaker_rejects_without_waiting_for_the_limiter():
+    requests = []
+
+    def answer(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"address": {"city": "Paris", "country": "France"}})
+
+    async def run():
+        http_clients._clients["test-upstream"] = httpx.AsyncClient(transport=httpx.MockTransport(answer))
+        provider = NominatimProvider("test", "http://upstream.test", "test-upstream", AsyncRateLimiter(1))
+        provider.breaker = CircuitBreaker("test", failure_threshold=1, slow_call_seconds=5, reset_seconds=30)
+        provider.breaker.record_failure()
+        geocoder = FailoverProvider([provider])
+        started = time.perf_counter()
+        try:
+            results = await asyncio.gather(
+                *(geocoder.reverse(48.85, 2.35) for _ in range(4)), return_exceptions=True,
+            )
+        finally:
+            await http_clients._clients.pop("test-upstream").aclose()
+        return provider, results, time.perf_counter() - started
+
+    provider, results, elapsed = asyncio.run(run())
+
+    assert all(isinstance(result, GeocodingError) for result in results)
+    assert elapsed < 0.2
+    assert provider.limiter.waits == 0
+    assert not requests
+    assert provider.breaker.get_stats()["rejected"] == 4
+
+
+def test_probe_cancelled_while_queued_is_released():
+    async def run():
+        provider = NominatimProvider("test", "http://upstream.test", "test-upstream", AsyncRateLimiter(1))
+        provider.breaker = CircuitBreaker("test", failure_threshold=1, slow_call_seconds=5, reset_seconds=0)
+        provider.breaker.record_failure()
+        # Take the limiter's free slot so the probe has to queue
+        await provider.limiter.acquire()
+        task = asyncio.create_task(FailoverProvider([provider]).reverse(48.85, 2.35))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return provider
+
+    provider = asyncio.run(run())
+
+    assert provider.breaker.state == "half_open"
+    # The slot is free again, so the next call may probe
+    provider.breaker.before_call()
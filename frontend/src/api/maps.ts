@@ -66,6 +66,32 @@ export const getPoints = async (mapId: number): Promise<Point[]> => {
     return response.data;
 };
 
+export interface Bounds {
+    min_lat: number;
+    min_lng: number;
+    max_lat: number;
+    max_lng: number;
+}
+
+export interface PointCluster {
+    latitude: number;
+    longitude: number;
+    count: number;
+    categories: Record<string, number>;
+}
+
+export interface ClustersResponse {
+    zoom: number;
+    level: number;
+    total_points: number;
+    clusters: PointCluster[];
+}
+
+export const getClusters = async (mapId: number, zoom: number, bounds?: Bounds): Promise<ClustersResponse> => {
+    const response = await api.get<ClustersResponse>(`/maps/${mapId}/clusters`, { params: { zoom, ...bounds } });
+    return response.data;
+};
+
 // Modified to accept FormData for file uploads
 export const addPoint = async (mapId: number, formData: FormData): Promise<Point> => {
     const response = await api.post<Point>(`/maps/${mapId}/points`, formData);
@@ -146,6 +172,19 @@ export const getPointsPaginated = async (mapId: number, params: PointsQueryParam
     return response.data;
 };
 
+export interface CursorPointsResponse {
+    items: Point[];
+    total: number;
+    limit: number;
+    next_cursor: string | null;
+}
+
+// Keyset pages: pass '' for the first page, then the previous response's next_cursor
+export const getPointsByCursor = async (mapId: number, cursor: string, params: Omit<PointsQueryParams, 'page'> = {}): Promise<CursorPointsResponse> => {
+    const response = await api.get<CursorPointsResponse>(`/maps/${mapId}/points/paginated`, { params: { ...params, cursor } });
+    return response.data;
+};
+
 // --- Enhanced Stats ---
 export interface BadgeInfo {
     level: number;
@@ -175,6 +214,7 @@ export interface EnhancedUserStats {
         continents: number;
     };
     total_badges: number;
+    continent_coverage: Record<string, { visited: number; total: number; percent: number }>;
     global_rank_points?: number;
     global_rank_countries?: number;
     global_rank_continents?: number;
@@ -278,6 +278,7 @@ const PointsManagementPage: React.FC = () => {
                                 <option value="timestamp">Date</option>
                                 <option value="city">City</option>
                                 <option value="country">Country</option>
+                                <option value="relevance">Relevance (search)</option>
                             </select>
                             <select
                                 value={sortOrder}